@@ -1,25 +1,33 @@
+import argparse
 import asyncio
-import os
-from uuid import uuid4
-import re
+import logging
 
-from app.memes.service import MemesService
-from app.memes.s3client import s3_client
+from app.repository.orm import async_session
+from app.s3storage.meme import s3_storage
+from app.utils.ingest import ingest_directory
 
 
-async def upload_memes(filename, filepath):
-    filename = re.sub("[\s\(\)]+", "-", filename)
-    filename = f"{uuid4()}-{filename}"
-    await s3_client.upload_file_locally(filepath, filename)
-    await MemesService.add_meme(filename)
-
-
-async def main():
-    for i in os.listdir("my_memes"):
-        filepath = os.path.join("my_memes", i)
-        await upload_memes(i, filepath)
-        print(f"Uploaded {i}")
+async def main(args: argparse.Namespace):
+    await s3_storage.start()
+    try:
+        report = await ingest_directory(
+            args.directory,
+            s3_storage,
+            async_session,
+            manifest_path=args.manifest,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+        )
+    finally:
+        await s3_storage.close()
+    print(report)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Upload all memes from a directory.")
+    parser.add_argument("directory", nargs="?", default="my_memes")
+    parser.add_argument("--manifest", default="my_memes.manifest.jsonl", help="finished files are skipped on rerun")
+    parser.add_argument("--concurrency", type=int, default=8, help="max number of uploads at once")
+    parser.add_argument("--batch-size", type=int, default=500, help="max number of rows per INSERT")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
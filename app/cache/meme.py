@@ -0,0 +1,282 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Protocol
+
+from app.config import settings
+from app.utils.lazy import Lazy
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> dict | None: ...
+
+    async def set(self, key: str, value: dict) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+
+class InMemoryCache:
+    def __init__(self, max_size: int = 10_000, ttl: float = 60):
+        """In-process cache, entries expire after `ttl` seconds and the least recently used
+        entries are evicted when there are more than `max_size` of them.
+
+        Args:
+            max_size (int, optional): max number of entries. Defaults to 10_000.
+            ttl (float, optional): time to live of an entry in seconds. Defaults to 60.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    async def get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"Can't encode {type(value)}")
+
+
+def _decode(value: dict) -> Any:
+    if "$datetime" in value:
+        return datetime.fromisoformat(value["$datetime"])
+    return value
+
+
+class RedisCache:
+    def __init__(self, redis, ttl: float = 60, prefix: str = "memes:"):
+        """Cache shared between workers, stored in anything that speaks Redis protocol.
+
+        Args:
+            redis: async client with `get`, `set` and `delete`, e.g. `redis.asyncio.Redis`.
+            ttl (float, optional): time to live of an entry in seconds. Defaults to 60.
+            prefix (str, optional): prefix of the keys. Defaults to "memes:".
+        """
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> dict | None:
+        value = await self.redis.get(self.prefix + key)
+        return None if value is None else json.loads(value, object_hook=_decode)
+
+    async def set(self, key: str, value: dict) -> None:
+        await self.redis.set(self.prefix + key, json.dumps(value, default=_encode), px=int(self.ttl * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self.redis.delete(self.prefix + key)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    invalidations: int = 0
+
+
+class MemeCache:
+    def __init__(self, backend: CacheBackend):
+        """Read-through cache of memes. Concurrent misses of the same key are coalesced
+        into a single load, so an expired hot meme does not hit the database with every request.
+
+        Args:
+            backend (CacheBackend): where the entries are stored.
+        """
+        self.backend = backend
+        self.stats = CacheStats()
+        self._loading: dict[str, asyncio.Future] = {}
+        # keys invalidated while loading, so a load started before a write does not put stale data back
+        self._stale: set[str] = set()
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[dict | None]]) -> dict | None:
+        async def load_one(keys: list[str]) -> dict[str, dict | None]:
+            return {key: await load()}
+
+        return (await self.get_many_or_load([key], load_one)).get(key)
+
+    async def get_many_or_load(
+        self, keys: list[str], load: Callable[[list[str]], Awaitable[dict[str, dict | None]]]
+    ) -> dict[str, dict]:
+        """Same as `get_or_load` for many keys, the missing ones are loaded by one call of `load`.
+        Returns the found values by their keys."""
+        values = {}
+        for key in dict.fromkeys(keys):
+            value = await self.backend.get(key)
+            if value is not None:
+                values[key] = value
+        self.stats.hits += len(values)
+
+        waiting = {key: self._loading[key] for key in dict.fromkeys(keys) if key not in values and key in self._loading}
+        missing = [key for key in dict.fromkeys(keys) if key not in values and key not in waiting]
+        self.stats.coalesced += len(waiting)
+        self.stats.misses += len(missing)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            self._loading.update(futures)
+            try:
+                loaded = await load(missing)
+                for key, future in futures.items():
+                    value = loaded.get(key)
+                    if value is not None:
+                        values[key] = value
+                        if key not in self._stale:
+                            await self.backend.set(key, value)
+                    future.set_result(value)
+            except asyncio.CancelledError:
+                for future in futures.values():
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(e)
+                        # mark as retrieved, the exception is re-raised here and waiters get it from the future
+                        future.exception()
+                raise
+            finally:
+                for key in missing:
+                    del self._loading[key]
+                    self._stale.discard(key)
+
+        retry = []
+        for key, future in waiting.items():
+            try:
+                value = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # the request that started the load was cancelled, not this one, so the key is loaded again
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                retry.append(key)
+                continue
+            if value is not None:
+                values[key] = value
+        if retry:
+            values.update(await self.get_many_or_load(retry, load))
+        return values
+
+    async def invalidate(self, key: str) -> None:
+        self.stats.invalidations += 1
+        if key in self._loading:
+            self._stale.add(key)
+        await self.backend.delete(key)
+
+
+class CachedRepository:
+    def __init__(self, repository, cache: MemeCache, deferred: bool = False):
+        """Wraps repository, reads of a single meme go through the cache
+        and writes invalidate it. Other methods are passed to the repository.
+
+        Args:
+            repository: repository to wrap.
+            cache (MemeCache): cache of memes.
+            deferred (bool, optional): keep invalidations until `flush_invalidations` is called,
+                for repositories that do not commit on their own. Defaults to False.
+        """
+        self.repository = repository
+        self.cache = cache
+        self.deferred = deferred
+        self.pending_invalidations: set[str] = set()
+
+    def __getattr__(self, name: str):
+        return getattr(self.repository, name)
+
+    async def _invalidate(self, key: str) -> None:
+        if self.deferred:
+            self.pending_invalidations.add(key)
+        else:
+            await self.cache.invalidate(key)
+
+    async def flush_invalidations(self) -> None:
+        """Invalidates entries of memes written since the last call, after the writes are committed."""
+        for key in self.pending_invalidations:
+            await self.cache.invalidate(key)
+        self.pending_invalidations.clear()
+
+    async def get_meme_by_id(self, meme_id: int) -> dict | None:
+        async def load():
+            # a lagging replica could return the row from before the write that invalidated the entry,
+            # and it would be cached for the whole ttl
+            meme = await self.repository.get_meme_by_id(meme_id, primary=True)
+            return None if meme is None else dict(meme)
+
+        return await self.cache.get_or_load(str(meme_id), load)
+
+    async def update_meme_by_id(self, meme_id: int, **kwargs) -> dict | None:
+        meme = await self.repository.update_meme_by_id(meme_id, **kwargs)
+        await self._invalidate(str(meme_id))
+        return meme
+
+    async def delete_meme_by_id(self, meme_id: int) -> dict | None:
+        meme = await self.repository.delete_meme_by_id(meme_id)
+        await self._invalidate(str(meme_id))
+        return meme
+
+    async def get_memes_by_ids(self, meme_ids: list[int]) -> list[dict]:
+        async def load(keys: list[str]) -> dict[str, dict | None]:
+            memes = await self.repository.get_memes_by_ids([int(key) for key in keys])
+            return {str(meme["id"]): dict(meme) for meme in memes}
+
+        memes = await self.cache.get_many_or_load([str(meme_id) for meme_id in meme_ids], load)
+        return [memes[str(meme_id)] for meme_id in dict.fromkeys(meme_ids) if str(meme_id) in memes]
+
+    async def update_memes_descriptions(self, descriptions: dict[int, str | None]) -> list[dict]:
+        memes = await self.repository.update_memes_descriptions(descriptions)
+        for meme_id in descriptions:
+            await self._invalidate(str(meme_id))
+        return memes
+
+    async def delete_memes_by_ids(self, meme_ids: list[int]) -> list[dict]:
+        memes = await self.repository.delete_memes_by_ids(meme_ids)
+        for meme_id in meme_ids:
+            await self._invalidate(str(meme_id))
+        return memes
+
+    async def set_derivatives(self, derivatives: dict[str, list[str]]) -> list[int]:
+        meme_ids = await self.repository.set_derivatives(derivatives)
+        for meme_id in meme_ids:
+            await self._invalidate(str(meme_id))
+        return meme_ids
+
+
+    async def set_content_hash(self, meme_id: int, filename: str, content_hash: str) -> str | None:
+        stored = await self.repository.set_content_hash(meme_id, filename, content_hash)
+        if stored is not None and stored != filename:
+            await self._invalidate(str(meme_id))
+        return stored
+
+
+def create_meme_cache() -> MemeCache | None:
+    if settings.CACHE_BACKEND == "memory":
+        return MemeCache(InMemoryCache(max_size=settings.CACHE_MAX_SIZE, ttl=settings.CACHE_TTL_SECONDS))
+    if settings.CACHE_BACKEND == "redis":
+        from redis.asyncio import Redis
+
+        return MemeCache(RedisCache(Redis.from_url(settings.REDIS_URL), ttl=settings.CACHE_TTL_SECONDS))
+    return None
+
+
+meme_cache: Lazy[MemeCache | None] = Lazy(create_meme_cache, "cache")
@@ -1,29 +1,115 @@
+from functools import lru_cache
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from app.utils.lazy import Lazy
+
 
 class Settings(BaseSettings):
 
-    POSTGRES_PASSWORD: str
-    POSTGRES_USER: str
-    POSTGRES_DB: str
-    POSTGRES_HOSTNAME: str
-    POSTGRES_PORT: int
+    # "memory" keeps memes in the process and files in a dict, for tests and benchmarks without services
+    REPOSITORY_BACKEND: Literal["postgres", "memory"] = "postgres"
+    STORAGE_BACKEND: Literal["s3", "memory"] = "s3"
+
+    # required only once the database is used, see `require`
+    POSTGRES_PASSWORD: str | None = None
+    POSTGRES_USER: str | None = None
+    POSTGRES_DB: str | None = None
+    POSTGRES_HOSTNAME: str = "localhost"
+    POSTGRES_PORT: int = 5432
+
+    # "host:port" of each read replica, credentials and database are the same as of the primary
+    POSTGRES_REPLICA_HOSTS: list[str] = []
+    POSTGRES_REPLICA_COOLDOWN_SECONDS: float = 30
+
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = False
+    DB_STATEMENT_TIMEOUT_MS: int | None = None
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 100
 
     @property
     def DATABASE_URL(self):
+        self.require("POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB")
         return (
             f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
             f"@{self.POSTGRES_HOSTNAME}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         )
 
-    ACCESS_KEY: str
-    SECRET_KEY: str
-    ENDPOINT_URL: str
-    BUCKET_NAME: str
-    MINIO_ROOT_USER: str
-    MINIO_ROOT_PASSWORD: str
+    @property
+    def REPLICA_DATABASE_URLS(self):
+        self.require("POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB")
+        return [
+            f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{host}/{self.POSTGRES_DB}"
+            for host in self.POSTGRES_REPLICA_HOSTS
+        ]
+
+    # credentials are required only once S3 is used, see `require`
+    ACCESS_KEY: str | None = None
+    SECRET_KEY: str | None = None
+    ENDPOINT_URL: str = "http://localhost:9000"
+    BUCKET_NAME: str = "memes"
+    MINIO_ROOT_USER: str | None = None
+    MINIO_ROOT_PASSWORD: str | None = None
+    S3_MAX_POOL_CONNECTIONS: int = 10
+    S3_BOOTSTRAP_MARKER: str | None = None
+    S3_BOOTSTRAP_TTL_MINUTES: float = 10
+    S3_MULTIPART_PART_SIZE_MB: int = 8
+    S3_MULTIPART_CONCURRENCY: int = 4
+    S3_PRESIGN_UPLOAD_EXPIRES_SECONDS: int = 3600
+    S3_PRESIGN_GET_URLS: bool = False
+    S3_PRESIGN_GET_EXPIRES_SECONDS: int = 300
+
+    CACHE_BACKEND: Literal["memory", "redis", "none"] = "memory"
+    CACHE_MAX_SIZE: int = 10_000
+    CACHE_TTL_SECONDS: float = 60
+    REDIS_URL: str | None = None
+
+    UPLOAD_MAX_IMAGE_MB: int = 20
+    UPLOAD_MAX_VIDEO_MB: int = 200
+
+    RATE_LIMIT_BACKEND: Literal["memory", "redis", "none"] = "memory"
+    RATE_LIMIT_UPLOADS_PER_MINUTE: float = 30
+    RATE_LIMIT_UPLOADS_BURST: int = 10
+    UPLOADS_MAX_IN_FLIGHT: int = 8
+    UPLOADS_MAX_QUEUED: int = 32
+    UPLOADS_QUEUE_TIMEOUT_SECONDS: float = 30
+
+    THUMBNAIL_WIDTHS: list[int] = [320, 640]
+    THUMBNAIL_MAX_SOURCE_MB: int = 20
+    DERIVATIVES_WORKERS: int | None = None
+
+    HTTP_CACHE_CONTROL_ITEM: str = "no-cache"
+    HTTP_CACHE_CONTROL_LIST: str = "no-cache"
+
+    JOBS_RUN_IN_APP: bool = True
+    JOBS_CONCURRENCY: int = 4
+    JOBS_POLL_INTERVAL_SECONDS: float = 1
+    JOBS_TIMEOUT_SECONDS: float = 300
+    JOBS_MAX_ATTEMPTS: int = 5
+    JOBS_BACKOFF_SECONDS: float = 5
+    JOBS_MAX_BACKOFF_SECONDS: float = 600
+
+    TRACING_EXPORTER: Literal["none", "console", "otlp"] = "none"
+    TRACING_OTLP_ENDPOINT: str | None = None
+
+    # empty values, e.g. of a copied `.example.env`, are left to the defaults
+    model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True)
+
+    def require(self, *names: str) -> None:
+        """Raises ValueError if any of the settings is not set. Credentials of Postgres and S3 are
+        checked when their backends are made, so the memory backends run without any configuration."""
+        missing = [name for name in names if getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"Missing settings: {', '.join(missing)}.")
+
 
-    model_config = SettingsConfigDict(env_file=".env")
+@lru_cache
+def get_settings() -> Settings:
+    """Settings read from the environment and `.env` on first use, so importing the app needs no configuration."""
+    return Settings()
 
 
-settings = Settings()
+settings: Lazy[Settings] = Lazy(get_settings, "settings")
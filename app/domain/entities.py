@@ -6,18 +6,21 @@ from app.domain.exceptions import NotSupportedFileExtensionException
 from app.domain.value_objects import MIMETypes
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Meme:
 
-    id: str = field(init=False, default_factory=lambda: str(uuid4()))
     filename: str
     description: str | None = field(default=None)
-    content_type: type[MIMETypes] = field(init=False)
+    content_hash: str | None = field(default=None)
+    id: str = field(default_factory=lambda: str(uuid4()))
+    content_type: MIMETypes = field(init=False)
     created_at: datetime | None = field(init=False, default=None)
     updated_at: datetime | None = field(init=False, default=None)
 
     def __post_init__(self):
-        name_and_extension = self.filename.lower().split(".")
-        if len(name_and_extension) < 2 or name_and_extension[-1] not in MIMETypes.supported_types():
+        _, dot, extension = self.filename.rpartition(".")
+        content_type = MIMETypes.from_extension(extension.lower()) if dot else None
+        if content_type is None:
             raise NotSupportedFileExtensionException(self.filename)
-        self.content_type = MIMETypes[name_and_extension[-1]]
+        # frozen, so derived fields are set past the dataclass __setattr__
+        object.__setattr__(self, "content_type", content_type)
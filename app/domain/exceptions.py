@@ -13,3 +13,32 @@ class NotSupportedFileExtensionException(Exception):
             f"Не поддерживаемый формат файла '{self.filename}'."
             f"Поддерживаются следующие типы данных: {MIMETypes.supported_types()}"
         )
+
+
+@dataclass(eq=False)
+class MemeNotFoundException(Exception):
+    meme_id: int
+
+    @property
+    def message(self):
+        return f"Мем {self.meme_id} не найден."
+
+
+@dataclass(eq=False)
+class ContentTypeMismatchException(Exception):
+    filename: str
+    content_type: str
+
+    @property
+    def message(self):
+        return f"Содержимое файла '{self.filename}' не соответствует типу {self.content_type}."
+
+
+@dataclass(eq=False)
+class FileTooLargeException(Exception):
+    filename: str
+    max_size: int
+
+    @property
+    def message(self):
+        return f"Файл '{self.filename}' больше {self.max_size // (1024 * 1024)} МБ."
@@ -15,3 +15,8 @@ class MIMETypes(Enum):
     @classmethod
     def supported_types(cls):
         return cls.__members__.keys()
+
+    @classmethod
+    def from_extension(cls, extension: str) -> "MIMETypes | None":
+        """Type of a lowercase file extension, None if it is not supported."""
+        return cls.__members__.get(extension)
@@ -0,0 +1,106 @@
+import hashlib
+from datetime import timedelta
+
+from app.config import settings
+from app.utils.reconcile import reconcile_storage
+from app.utils.stream import iter_hashed
+
+
+def make_handlers(storage, pipeline, open_repository) -> dict:
+    """Handlers of background jobs by their kind, payload of a job is passed as keyword arguments.
+    Handlers raise to have the job retried, so they must be safe to run more than once.
+
+    Args:
+        storage: storage of the files, e.g. `MemeStorage`.
+        pipeline: pipeline of derivatives, e.g. `DerivativesPipeline`.
+        open_repository: factory of repository contexts, e.g. `open_repository`.
+    """
+
+    async def delete_files(filenames: list[str]) -> None:
+        result = await storage.delete_many(filenames)
+        if result.errors:
+            raise RuntimeError(f"Could not delete {len(result.errors)} files, e.g. {result.errors[0]}")
+
+    async def file_hash(filename: str, data: bytes | None) -> str:
+        """sha256 of a file, streamed from the storage if it was not read."""
+        if data is not None:
+            return hashlib.sha256(data).hexdigest()
+        hasher = hashlib.sha256()
+        file = await storage.stream_file(filename)
+        async for _ in iter_hashed(file.body, hasher):
+            pass
+        return hasher.hexdigest()
+
+    async def process_file(
+        meme_id: int,
+        filename: str,
+        content_type: str,
+        size: int | None,
+        derivatives: bool,
+        deduplicate: bool = False,
+    ):
+        """Renders derivatives of a new file, records them and hashes the image of a meme. If the file
+        is shared with memes added before, the derivatives made for them are recorded instead.
+        Images over `THUMBNAIL_MAX_SOURCE_MB` are not read, so they get neither.
+        Files stored without a hash, e.g. uploaded by clients, are hashed first if `deduplicate` is set,
+        a file with content that is stored already is deleted and the meme gets the stored one."""
+        data = None
+        if content_type.startswith("image/") and (
+            size is None or size <= settings.THUMBNAIL_MAX_SOURCE_MB * 1024 * 1024
+        ):
+            try:
+                data = await storage.get_file(filename)
+            except FileNotFoundError:
+                # the meme was deleted or its file replaced before the job was run
+                return
+
+        if deduplicate:
+            try:
+                content_hash = await file_hash(filename, data)
+            except FileNotFoundError:
+                return
+            async with open_repository() as repository:
+                stored = await repository.set_content_hash(meme_id, filename, content_hash)
+            if stored is None:
+                return
+            if stored != filename:
+                await delete_files([filename])
+                filename, derivatives = stored, False
+
+        if derivatives:
+            keys = await pipeline.generate(filename, content_type, data)
+        else:
+            keys = await pipeline.stored_keys(filename, content_type)
+        image_hash = await pipeline.image_hash(data) if data is not None else None
+        async with open_repository() as repository:
+            # set for every meme of the file, so the ones added while the derivatives were made get them too
+            await repository.set_derivatives({filename: keys})
+            if image_hash is not None:
+                await repository.set_image_hashes({meme_id: image_hash})
+
+    async def expire_uploads(batch_size: int = 100) -> None:
+        """Cleans up uploads of clients that were not completed before they expired: multipart uploads
+        are aborted and uploaded files deleted, then the uploads are forgotten. Queued for each upload
+        to run once it expires, and cleans up all expired ones."""
+        while True:
+            async with open_repository() as repository:
+                uploads = await repository.get_expired_uploads(batch_size)
+            if not uploads:
+                return
+            for upload in uploads:
+                if upload["multipart_upload_id"]:
+                    await storage.abort_multipart_upload(upload["filename"], upload["multipart_upload_id"])
+            await delete_files([upload["filename"] for upload in uploads])
+            async with open_repository() as repository:
+                for upload in uploads:
+                    await repository.delete_pending_upload(upload["id"])
+
+    async def reconcile(min_age_minutes: float = 60) -> None:
+        await reconcile_storage(storage, open_repository, min_age=timedelta(minutes=min_age_minutes))
+
+    return {
+        "delete_files": delete_files,
+        "process_file": process_file,
+        "expire_uploads": expire_uploads,
+        "reconcile_storage": reconcile,
+    }
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import AsyncIterator, Awaitable, Callable
+
+from app.cache.meme import CachedRepository, meme_cache
+from app.config import settings
+from app.jobs.handlers import make_handlers
+from app.media.derivatives import derivatives
+from app.repository.backends import open_job_queue, open_repository
+from app.s3storage.meme import s3_storage
+from app.telemetry.tracing import traced
+from app.utils.lazy import Lazy
+
+
+class JobWorker:
+    def __init__(
+        self,
+        job_queue,
+        handlers: dict[str, Callable[..., Awaitable]],
+        concurrency: int = 4,
+        poll_interval: float = 1,
+        timeout: float = 300,
+        max_attempts: int = 5,
+        backoff: float = 5,
+        max_backoff: float = 600,
+    ):
+        """Runs queued jobs of a `JobQueue` with asyncio tasks. Any number of workers can run
+        in the app processes or beside them, each job is claimed by one of them. A failed job
+        is retried with exponential backoff and marked dead after `max_attempts`.
+
+        Args:
+            job_queue: factory of job queue contexts, e.g. `open_job_queue`.
+            handlers (dict[str, Callable[..., Awaitable]]): handler by job kind, see `make_handlers`.
+            concurrency (int, optional): max number of jobs run at once. Defaults to 4.
+            poll_interval (float, optional): seconds to wait when there are no due jobs. Defaults to 1.
+            timeout (float, optional): seconds a job may run, it is claimed again after that. Defaults to 300.
+            max_attempts (int, optional): attempts before the job is marked dead. Defaults to 5.
+            backoff (float, optional): seconds before the first retry, doubled for each next one. Defaults to 5.
+            max_backoff (float, optional): max seconds between retries. Defaults to 600.
+        """
+        self.job_queue = job_queue
+        self.handlers = {kind: traced(f"job.{kind}")(handler) for kind, handler in handlers.items()}
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._loop_task: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """Starts claiming jobs in the running event loop."""
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        """Stops the worker, jobs it was running are claimed again once their lease expires."""
+        tasks = [task for task in [self._loop_task, *self._running] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+
+    async def run_once(self) -> int:
+        """Claims due jobs and runs them. Returns the number of claimed jobs."""
+        jobs = await self._claim(self.concurrency)
+        await asyncio.gather(*(self._run(job) for job in jobs))
+        return len(jobs)
+
+    def retry_delay(self, attempts: int) -> timedelta:
+        return timedelta(seconds=min(self.backoff * 2 ** (attempts - 1), self.max_backoff))
+
+    async def _loop(self) -> None:
+        while True:
+            free = self.concurrency - len(self._running)
+            if free == 0:
+                await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                jobs = await self._claim(free)
+            except Exception:
+                logging.exception("Could not claim jobs")
+                jobs = []
+            for job in jobs:
+                task = asyncio.create_task(self._run(job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            if len(jobs) < free:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _claim(self, limit: int) -> list[dict]:
+        async with self.job_queue() as jobs:
+            return await jobs.claim_jobs(list(self.handlers), limit, timedelta(seconds=self.timeout))
+
+    async def _run(self, job: dict) -> None:
+        try:
+            await asyncio.wait_for(self.handlers[job["kind"]](**job["payload"]), self.timeout)
+        except Exception as e:
+            retry_in = self.retry_delay(job["attempts"]) if job["attempts"] < self.max_attempts else None
+            logging.exception(f"Job {job['id']} '{job['kind']}' failed, attempt {job['attempts']}")
+            await self._finish(job, error=repr(e), retry_in=retry_in)
+        else:
+            await self._finish(job)
+
+    async def _finish(self, job: dict, error: str | None = None, retry_in: timedelta | None = None) -> None:
+        try:
+            async with self.job_queue() as jobs:
+                if error is None:
+                    await jobs.complete_job(job["id"])
+                else:
+                    await jobs.fail_job(job["id"], error, retry_in)
+        except Exception:
+            # the job is claimed again once its lease expires
+            logging.exception(f"Could not record the result of job {job['id']}")
+
+
+@asynccontextmanager
+async def open_cached_repository() -> AsyncIterator:
+    """Repository whose writes invalidate the cache of memes, so the memes served by the app
+    show what the jobs record, e.g. their derivatives."""
+    async with open_repository() as repository:
+        cache = meme_cache.get()
+        yield repository if cache is None else CachedRepository(repository, cache)
+
+
+def create_job_worker() -> JobWorker:
+    return JobWorker(
+        open_job_queue,
+        make_handlers(s3_storage, derivatives, open_cached_repository),
+        concurrency=settings.JOBS_CONCURRENCY,
+        poll_interval=settings.JOBS_POLL_INTERVAL_SECONDS,
+        timeout=settings.JOBS_TIMEOUT_SECONDS,
+        max_attempts=settings.JOBS_MAX_ATTEMPTS,
+        backoff=settings.JOBS_BACKOFF_SECONDS,
+        max_backoff=settings.JOBS_MAX_BACKOFF_SECONDS,
+    )
+
+
+job_worker: Lazy[JobWorker] = Lazy(create_job_worker, "job worker")
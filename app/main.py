@@ -1,9 +1,91 @@
-from fastapi import FastAPI
-from fastapi_pagination import add_pagination
+from contextlib import asynccontextmanager
 
-from app.memes.router import router as memes_router
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 
-app = FastAPI()
-add_pagination(app)
+from prometheus_client import REGISTRY
 
-app.include_router(memes_router)
+from app.config import settings
+from app.domain.exceptions import (
+    ContentTypeMismatchException,
+    FileTooLargeException,
+    MemeNotFoundException,
+    NotSupportedFileExtensionException,
+)
+from app.jobs.worker import job_worker
+from app.media.derivatives import derivatives
+from app.media.validation import max_request_size
+from app.repository.orm import engine
+from app.s3storage.meme import s3_storage
+from app.telemetry.metrics import PoolCollector, metrics_endpoint
+from app.telemetry.startup import startup_report
+from app.telemetry.tracing import TelemetryMiddleware, setup_tracing
+from app.web.limits import rate_limiter
+from app.web.middleware import BodySizeLimitMiddleware, UploadRateLimitMiddleware
+from app.web.router import router as memes_router
+
+
+# uploads through the app, presigned uploads go straight to the storage
+UPLOAD_ROUTES = {("POST", "/memes"), ("PUT", "/memes/{id}")}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with startup_report.measure("tracing"):
+        setup_tracing(settings.TRACING_EXPORTER, settings.TRACING_OTLP_ENDPOINT)
+    with startup_report.measure("storage start"):
+        await s3_storage.start()
+    with startup_report.measure("derivatives start"):
+        derivatives.start()
+    if settings.JOBS_RUN_IN_APP:
+        with startup_report.measure("job worker start"):
+            job_worker.start()
+    collector = PoolCollector(engine if settings.REPOSITORY_BACKEND == "postgres" else None, s3_storage.get())
+    REGISTRY.register(collector)
+    startup_report.log()
+    yield
+    REGISTRY.unregister(collector)
+    if job_worker.made:
+        await job_worker.close()
+    derivatives.close()
+    await s3_storage.close()
+
+
+async def not_supported_file_extension_handler(request: Request, exc: NotSupportedFileExtensionException):
+    return JSONResponse(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, content={"detail": exc.message})
+
+
+async def content_type_mismatch_handler(request: Request, exc: ContentTypeMismatchException):
+    return JSONResponse(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, content={"detail": exc.message})
+
+
+async def file_too_large_handler(request: Request, exc: FileTooLargeException):
+    return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, content={"detail": exc.message})
+
+
+async def meme_not_found_handler(request: Request, exc: MemeNotFoundException):
+    return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"detail": exc.message})
+
+
+def create_app() -> FastAPI:
+    """Makes the app. Settings, the engine and the storage are made on first use and started
+    in the lifespan, so this needs no configuration and does no I/O.
+
+    Example:
+        uvicorn --factory app.main:create_app
+    """
+    app = FastAPI(lifespan=lifespan)
+    # the last one added is the outermost, rejected bodies are still measured
+    app.add_middleware(UploadRateLimitMiddleware, limiter=rate_limiter.get, routes=UPLOAD_ROUTES)
+    app.add_middleware(BodySizeLimitMiddleware, max_size=max_request_size)
+    app.add_middleware(TelemetryMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
+    app.include_router(memes_router)
+    app.add_exception_handler(NotSupportedFileExtensionException, not_supported_file_extension_handler)
+    app.add_exception_handler(ContentTypeMismatchException, content_type_mismatch_handler)
+    app.add_exception_handler(FileTooLargeException, file_too_large_handler)
+    app.add_exception_handler(MemeNotFoundException, meme_not_found_handler)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import multiprocessing
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from app.config import settings
+from app.media.similarity import image_hash
+from app.s3storage.meme import MemeStorage, s3_storage
+from app.utils.lazy import Lazy
+
+# lifetime of the url ffmpeg reads a video by, covers the wait for a worker and the ffmpeg timeout
+POSTER_URL_EXPIRES_SECONDS = 10 * 60
+
+
+def thumbnail_key(filename: str, width: int) -> str:
+    return f"thumbnails/{width}/{filename}.webp"
+
+
+def poster_key(filename: str) -> str:
+    return f"posters/{filename}.webp"
+
+
+def source_filename(key: str) -> str:
+    """Name of the original file of a derivative, the key itself if it is not a derivative."""
+    if key.startswith("thumbnails/"):
+        return key.split("/", 2)[-1].removesuffix(".webp")
+    if key.startswith("posters/"):
+        return key.removeprefix("posters/").removesuffix(".webp")
+    return key
+
+
+def derivative_keys(filename: str, content_type: str, widths: list[int]) -> list[str]:
+    """Keys of all derivatives a file can have, used to delete them together with the file."""
+    if content_type.startswith("image/"):
+        return [thumbnail_key(filename, width) for width in widths]
+    if content_type.startswith("video/"):
+        return [poster_key(filename)]
+    return []
+
+
+def render_thumbnails(data: bytes, widths: list[int], quality: int = 80) -> dict[int, bytes]:
+    """Resizes image to each of the widths keeping aspect ratio, images are never upscaled.
+    Animated images are represented by their first frame. Runs in a worker process.
+
+    Args:
+        data (bytes): original image.
+        widths (list[int]): widths of the thumbnails.
+        quality (int, optional): WebP quality. Defaults to 80.
+
+    Returns:
+        dict[int, bytes]: WebP thumbnail by width.
+    """
+    from PIL import Image, ImageOps
+
+    thumbnails = {}
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        for width in widths:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((width, image.height))
+            buffer = BytesIO()
+            thumbnail.save(buffer, format="WEBP", quality=quality)
+            thumbnails[width] = buffer.getvalue()
+    return thumbnails
+
+
+def render_poster(url: str, quality: int = 80) -> bytes | None:
+    """Extracts the first frame of a video as WebP with ffmpeg. ffmpeg reads the video over HTTP
+    and fetches only the ranges it needs. Runs in a worker process.
+
+    Args:
+        url (str): url of the video.
+        quality (int, optional): WebP quality. Defaults to 80.
+
+    Returns:
+        bytes | None: poster or None if ffmpeg is not installed or failed.
+    """
+    if shutil.which("ffmpeg") is None:
+        logging.warning("ffmpeg is not installed, can't render poster")
+        return None
+
+    command = ["ffmpeg", "-loglevel", "error", "-i", url, "-frames:v", "1"]
+    command += ["-c:v", "libwebp", "-quality", str(quality), "-f", "image2pipe", "-"]
+    result = subprocess.run(command, capture_output=True, timeout=60)
+    if result.returncode != 0:
+        logging.warning(f"Could not render poster for '{url}': {result.stderr.decode(errors='replace')}")
+        return None
+    return result.stdout
+
+
+class DerivativesPipeline:
+    def __init__(self, storage: MemeStorage, widths: list[int], max_workers: int | None = None):
+        """Renders thumbnails of images and posters of videos in a process pool,
+        so the event loop is not blocked, and uploads them next to the original.
+
+        Args:
+            storage (MemeStorage): storage of the originals and derivatives.
+            widths (list[int]): widths of image thumbnails.
+            max_workers (int | None, optional): size of the process pool. Defaults to number of CPUs.
+        """
+        self.storage = storage
+        self.widths = widths
+        self.max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        # forked workers would inherit the event loop, the connection pools and their locks of the app
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def keys(self, filename: str, content_type: str) -> list[str]:
+        return derivative_keys(filename, content_type, self.widths)
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def generate(self, filename: str, content_type: str, data: bytes | None = None) -> list[str]:
+        """Renders and uploads derivatives of a file. Never raises, failures are logged.
+
+        Args:
+            filename (str): name of the original in the storage.
+            content_type (str): MIME type of the original.
+            data (bytes | None, optional): original image, not needed for videos. Defaults to None.
+
+        Returns:
+            list[str]: keys of the uploaded derivatives.
+        """
+        try:
+            derivatives = {}
+            if content_type.startswith("image/") and data is not None:
+                thumbnails = await self._run(render_thumbnails, data, self.widths)
+                derivatives = {thumbnail_key(filename, width): body for width, body in thumbnails.items()}
+            elif content_type.startswith("video/"):
+                # the bucket may be private, ffmpeg can only read a signed url
+                url = self.storage.get_presigned_url(filename, POSTER_URL_EXPIRES_SECONDS)
+                poster = await self._run(render_poster, url)
+                if poster is not None:
+                    derivatives = {poster_key(filename): poster}
+
+            await asyncio.gather(
+                *(self.storage.upload_file_via_request(key, body, "image/webp") for key, body in derivatives.items())
+            )
+            return list(derivatives)
+        except Exception:
+            logging.exception(f"Could not generate derivatives of '{filename}'")
+            return []
+
+    async def stored_keys(self, filename: str, content_type: str) -> list[str]:
+        """Keys of the derivatives of a file that are in the storage, e.g. made for another meme of the file."""
+        keys = self.keys(filename, content_type)
+        found = await asyncio.gather(*(self.storage.head_file(key) for key in keys))
+        return [key for key, head in zip(keys, found) if head is not None]
+
+    async def image_hash(self, data: bytes) -> int | None:
+        """Perceptual hash of an image, see `app.media.similarity.image_hash`. Returns None if it can't be read."""
+        try:
+            return await self._run(image_hash, data)
+        except Exception:
+            logging.exception("Could not hash image")
+            return None
+
+    async def generate_stored(self, filename: str, content_type: str) -> list[str]:
+        """Same as `generate`, but the original image is read from the storage."""
+        data = None
+        if content_type.startswith("image/"):
+            try:
+                data = await self.storage.get_file(filename)
+            except Exception:
+                logging.exception(f"Could not read '{filename}'")
+                return []
+        return await self.generate(filename, content_type, data)
+
+
+def create_derivatives() -> DerivativesPipeline:
+    return DerivativesPipeline(s3_storage, settings.THUMBNAIL_WIDTHS, settings.DERIVATIVES_WORKERS)
+
+
+derivatives: Lazy[DerivativesPipeline] = Lazy(create_derivatives, "derivatives")
@@ -0,0 +1,62 @@
+from io import BytesIO
+from itertools import combinations
+
+# 64-bit hashes are split into chunks for multi-index hashing, see `chunk_candidates`
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+MAX_DISTANCE = 3 * CHUNKS - 1
+
+
+def image_hash(data: bytes) -> int:
+    """64-bit difference hash (dHash) of an image. Recompressed, resized or slightly edited copies
+    of an image have hashes within a small Hamming distance. Runs in a worker process.
+
+    Args:
+        data (bytes): image.
+
+    Returns:
+        int: hash as a signed 64-bit integer, as stored in the database.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+        pixels = list(image.getdata())
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = value << 1 | (pixels[row * 9 + column] < pixels[row * 9 + column + 1])
+    return to_signed(value)
+
+
+def to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return ((a ^ b) & (1 << 64) - 1).bit_count()
+
+
+def chunk(value: int, index: int) -> int:
+    """`index`-th 16-bit chunk of a hash, counting from the most significant one."""
+    return value >> (CHUNKS - 1 - index) * CHUNK_BITS & (1 << CHUNK_BITS) - 1
+
+
+def chunk_candidates(value: int, max_distance: int) -> list[list[int]]:
+    """Values of each chunk that a hash within `max_distance` of `value` may have. If two hashes
+    differ in at most `max_distance` bits, at least one of their chunks differs in at most
+    `max_distance // CHUNKS` bits, so a hash is a candidate if any of its chunks is in the list.
+
+    Raises:
+        ValueError: if `max_distance` is above `MAX_DISTANCE`, the lists would be too long.
+    """
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise ValueError(f"Distance should be from 0 to {MAX_DISTANCE}.")
+
+    radius = max_distance // CHUNKS
+    masks = [0]
+    for flips in range(1, radius + 1):
+        masks += [sum(1 << bit for bit in bits) for bits in combinations(range(CHUNK_BITS), flips)]
+    return [[chunk(value, index) ^ mask for mask in masks] for index in range(CHUNKS)]
+
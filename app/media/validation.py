@@ -0,0 +1,106 @@
+from typing import AsyncIterable, AsyncIterator
+
+from app.config import settings
+from app.domain.exceptions import ContentTypeMismatchException, FileTooLargeException
+from app.domain.value_objects import MIMETypes
+
+# bytes needed to tell the supported types apart
+SNIFF_BYTES = 12
+# major brands of the `ftyp` box of mp4 files, others like HEIC images or QuickTime movies are not mp4
+MP4_BRANDS = {b"isom", b"iso2", b"iso4", b"iso5", b"iso6", b"mp41", b"mp42", b"avc1", b"dash", b"M4V ", b"mmp4", b"MSNV"}
+# slack for the multipart framing and form fields around the file in a request
+FORM_OVERHEAD = 1024 * 1024
+
+
+def sniff_content_type(head: bytes) -> str | None:
+    """MIME type of a file by its first `SNIFF_BYTES` bytes, None if it is not one of `MIMETypes`."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return MIMETypes.jpeg.value
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return MIMETypes.png.value
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return MIMETypes.gif.value
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return MIMETypes.webp.value
+    if head.startswith(b"BM"):
+        return MIMETypes.bmp.value
+    if head[4:8] == b"ftyp" and head[8:12] in MP4_BRANDS:
+        return MIMETypes.mp4.value
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return MIMETypes.webm.value
+    if head.startswith((b"\x00\x00\x01\xba", b"\x00\x00\x01\xb3")):
+        return MIMETypes.mpeg.value
+    return None
+
+
+def max_upload_size(content_type: str) -> int:
+    """Max size in bytes of an uploaded file of the type, see `UPLOAD_MAX_IMAGE_MB` and `UPLOAD_MAX_VIDEO_MB`."""
+    if content_type.startswith("video/"):
+        return settings.UPLOAD_MAX_VIDEO_MB * 1024 * 1024
+    return settings.UPLOAD_MAX_IMAGE_MB * 1024 * 1024
+
+
+def max_request_size() -> int:
+    """Max size in bytes of a request body, the biggest upload of any type with its form."""
+    return max(max_upload_size(content_type.value) for content_type in MIMETypes) + FORM_OVERHEAD
+
+
+def check_content(filename: str, head: bytes, content_type: str) -> None:
+    """Checks that the first bytes of a file match the type of its extension.
+
+    Raises:
+        ContentTypeMismatchException: if they don't.
+    """
+    if sniff_content_type(head) != content_type:
+        raise ContentTypeMismatchException(filename, content_type)
+
+
+async def validate_upload(
+    filename: str, stream: AsyncIterable[bytes], content_type: str, max_size: int
+) -> AsyncIterator[bytes]:
+    """Passes chunks of an uploaded file through, checking its first bytes before the first chunk
+    and its size after each one. Raising stops the upload, so the storage aborts it before it is finished.
+
+    Args:
+        filename (str): name of the file, for errors.
+        stream (AsyncIterable[bytes]): chunks of the file.
+        content_type (str): MIME type of the file by its extension.
+        max_size (int): max size of the file in bytes, see `max_upload_size`.
+
+    Raises:
+        ContentTypeMismatchException: if the content is not of `content_type`.
+        FileTooLargeException: once more than `max_size` bytes were received.
+    """
+    head: bytes | None = b""
+    size = 0
+    async for chunk in stream:
+        size += len(chunk)
+        if size > max_size:
+            raise FileTooLargeException(filename, max_size)
+        if head is not None:
+            # chunks are held back until there are enough bytes to check
+            head += chunk
+            if len(head) < SNIFF_BYTES:
+                continue
+            check_content(filename, head, content_type)
+            chunk, head = head, None
+        yield chunk
+    if head is not None:
+        check_content(filename, head, content_type)
+        if head:
+            yield head
+
+
+async def check_stored_file(storage, filename: str, content_type: str, size: int) -> None:
+    """Checks size and first bytes of a file uploaded to the storage directly, e.g. with a presigned url.
+
+    Raises:
+        ContentTypeMismatchException: if the content is not of `content_type`.
+        FileTooLargeException: if the file is bigger than allowed for its type.
+    """
+    max_size = max_upload_size(content_type)
+    if size > max_size:
+        raise FileTooLargeException(filename, max_size)
+    file = await storage.stream_file(filename, f"bytes=0-{SNIFF_BYTES - 1}")
+    head = b"".join([chunk async for chunk in file.body]) if file.body is not None else b""
+    check_content(filename, head, content_type)
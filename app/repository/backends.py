@@ -0,0 +1,37 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from app.config import settings
+from app.repository.base import JobQueue, MemeRepository
+from app.repository.jobs import JobRepository
+from app.repository.memory import InMemoryJobRepository, InMemoryRepository
+from app.repository.orm import async_session, replicas
+from app.repository.repository import SQLAlchemyRepository
+
+# used instead of the database if REPOSITORY_BACKEND is "memory", the data lives as long as the process
+memory_repository = InMemoryRepository()
+memory_jobs = InMemoryJobRepository()
+
+
+@asynccontextmanager
+async def open_repository(use_replicas: bool = False) -> AsyncIterator[MemeRepository]:
+    """Repository of memes of the configured backend, e.g. for a request or a batch of work.
+
+    Args:
+        use_replicas (bool, optional): read from the replicas, see `SQLAlchemyRepository`. Defaults to False.
+    """
+    if settings.REPOSITORY_BACKEND == "memory":
+        yield memory_repository
+        return
+    async with async_session() as session:
+        yield SQLAlchemyRepository(session, replicas.get() if use_replicas else None)
+
+
+@asynccontextmanager
+async def open_job_queue() -> AsyncIterator[JobQueue]:
+    """Queue of background jobs of the configured backend."""
+    if settings.REPOSITORY_BACKEND == "memory":
+        yield memory_jobs
+        return
+    async with async_session() as session:
+        yield JobRepository(session)
@@ -0,0 +1,95 @@
+from datetime import timedelta
+from typing import Literal, Protocol, runtime_checkable
+
+from app.domain.entities import Meme
+from app.repository.pagination import KeysetPage
+
+
+@runtime_checkable
+class MemeRepository(Protocol):
+    """Storage of memes, implemented by `SQLAlchemyRepository` and `InMemoryRepository`.
+    Rows are returned as mappings of the `memes` columns, see the implementations for details."""
+
+    async def get_memes(
+        self, order_by: Literal["id", "updated_at"] = "id", descending: bool = False, offset=0, limit=10
+    ) -> list: ...
+
+    async def get_memes_page(
+        self,
+        order_by: Literal["id", "updated_at"] = "id",
+        descending: bool = False,
+        cursor: str | None = None,
+        limit=10,
+        with_version: bool = False,
+    ) -> KeysetPage: ...
+
+    async def search_memes(self, q: str, cursor: str | None = None, limit=10) -> KeysetPage: ...
+
+    async def count_memes(self) -> int: ...
+
+    async def estimate_memes_count(self) -> int: ...
+
+    async def get_memes_version(self) -> tuple: ...
+
+    async def get_meme_by_id(self, meme_id: int, primary: bool = False): ...
+
+    async def get_memes_by_ids(self, meme_ids: list[int]) -> list: ...
+
+    async def add_meme(self, meme: Meme): ...
+
+    async def add_meme_of_stored_file(self, meme: Meme): ...
+
+    async def set_content_hash(self, meme_id: int, filename: str, content_hash: str) -> str | None: ...
+
+    async def add_memes_bulk(self, memes: list[Meme]) -> list: ...
+
+    async def update_meme_by_id(self, meme_id: int, file: Meme | None = None, **kwargs) -> dict | None: ...
+
+    async def delete_meme_by_id(self, meme_id: int) -> dict | None: ...
+
+    async def update_memes_descriptions(self, descriptions: dict[int, str | None]) -> list: ...
+
+    async def delete_memes_by_ids(self, meme_ids: list[int]) -> list[dict]: ...
+
+    async def add_pending_upload(
+        self,
+        meme: Meme,
+        size: int | None = None,
+        multipart_upload_id: str | None = None,
+        expires_in: timedelta = timedelta(hours=1),
+    ): ...
+
+    async def get_pending_upload(self, upload_id: str): ...
+
+    async def complete_pending_upload(self, upload_id: str): ...
+
+    async def delete_pending_upload(self, upload_id: str) -> None: ...
+
+    async def get_expired_uploads(self, limit=100) -> list: ...
+
+    async def find_similar_memes(self, meme_id: int, max_distance: int = 6, limit=50) -> list[dict]: ...
+
+    async def get_memes_without_image_hash(self, after_id: int | None = None, limit=100) -> list: ...
+
+    async def set_image_hashes(self, hashes: dict[int, int]) -> None: ...
+
+    async def get_memes_without_derivatives(self, after_id: int | None = None, limit=100) -> list: ...
+
+    async def set_derivatives(self, derivatives: dict[str, list[str]]) -> list[int]: ...
+
+    async def get_stored_filenames(self, filenames: list[str]) -> set[str]: ...
+
+
+@runtime_checkable
+class JobQueue(Protocol):
+    """Queue of background jobs, implemented by `JobRepository` and `InMemoryJobRepository`."""
+
+    async def add_job(self, kind: str, payload: dict, delay: timedelta | None = None) -> int: ...
+
+    async def claim_jobs(self, kinds: list[str], limit: int, lease: timedelta) -> list[dict]: ...
+
+    async def complete_job(self, job_id: int) -> None: ...
+
+    async def fail_job(self, job_id: int, error: str, retry_in: timedelta | None) -> None: ...
+
+    async def retry_dead_jobs(self, kinds: list[str] | None = None) -> int: ...
@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+from sqlalchemy import String, any_, bindparam, delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.repository.orm import JobsTable
+from app.telemetry.tracing import instrumented
+
+
+@instrumented("db")
+class JobRepository:
+    def __init__(self, session: AsyncSession, autocommit: bool = True) -> None:
+        """Queue of background jobs in the database.
+
+        Args:
+            session (AsyncSession): session of the primary database.
+            autocommit (bool, optional): commit after every write. Disabled in a unit of work,
+                so jobs are queued only if its transaction is committed. Defaults to True.
+        """
+        self.session = session
+        self.autocommit = autocommit
+
+    async def add_job(self, kind: str, payload: dict, delay: timedelta | None = None) -> int:
+        """Queues a job, it is run once the transaction is committed and `delay` has passed.
+
+        Returns:
+            int: id of the job.
+        """
+        values = {"kind": kind, "payload": payload}
+        if delay is not None:
+            values["run_at"] = func.now() + delay
+        job_id = await self.session.scalar(insert(JobsTable).values(**values).returning(JobsTable.id))
+        await self._commit()
+        return job_id
+
+    async def claim_jobs(self, kinds: list[str], limit: int, lease: timedelta) -> list[dict]:
+        """Takes due jobs of the given kinds. Rows locked by other workers are skipped, so workers
+        don't wait for each other. A claimed job is hidden for `lease` and is claimed again after it
+        if the worker didn't finish it, e.g. crashed."""
+        due = (
+            select(JobsTable.id)
+            .where(JobsTable.status == "pending", JobsTable.run_at <= func.now())
+            .where(JobsTable.kind == any_(bindparam("kinds", kinds, type_=ARRAY(String))))
+            .order_by(JobsTable.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        query = (
+            update(JobsTable)
+            .where(JobsTable.id.in_(due.scalar_subquery()))
+            .values(attempts=JobsTable.attempts + 1, run_at=func.now() + lease)
+            .returning(JobsTable.id, JobsTable.kind, JobsTable.payload, JobsTable.attempts)
+        )
+        result = await self.session.execute(query)
+        jobs = result.mappings().all()
+        await self._commit()
+        return jobs
+
+    async def complete_job(self, job_id: int) -> None:
+        await self.session.execute(delete(JobsTable).filter_by(id=job_id))
+        await self._commit()
+
+    async def fail_job(self, job_id: int, error: str, retry_in: timedelta | None) -> None:
+        """Schedules job to run again in `retry_in`, it is marked dead if `retry_in` is None."""
+        values = {"last_error": error}
+        if retry_in is None:
+            values["status"] = "dead"
+        else:
+            values["run_at"] = func.now() + retry_in
+        await self.session.execute(update(JobsTable).filter_by(id=job_id).values(**values))
+        await self._commit()
+
+    async def retry_dead_jobs(self, kinds: list[str] | None = None) -> int:
+        """Queues dead jobs again with their attempts reset. Returns the number of the jobs."""
+        query = update(JobsTable).filter_by(status="dead").values(status="pending", attempts=0, run_at=func.now())
+        if kinds is not None:
+            query = query.where(JobsTable.kind == any_(bindparam("kinds", kinds, type_=ARRAY(String))))
+        result = await self.session.execute(query)
+        await self._commit()
+        return result.rowcount
+
+    async def _commit(self) -> None:
+        if self.autocommit:
+            await self.session.commit()
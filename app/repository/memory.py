@@ -0,0 +1,401 @@
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Literal
+
+from app.domain.entities import Meme
+from app.media.similarity import MAX_DISTANCE, hamming_distance
+from app.repository.pagination import Cursor, KeysetPage
+
+
+class InMemoryRepository:
+    def __init__(self) -> None:
+        """Repository of memes in the memory of the process, for tests and benchmarks without a database.
+        Behaves like `SQLAlchemyRepository`, including shared files and cursors. Ids and `(updated_at, id)`
+        are kept in sorted lists, so a page is found by binary search like by an index in the database.
+        Writes take effect at once, there are no transactions to roll back."""
+        self.memes: dict[int, dict] = {}
+        self.image_hashes: dict[int, int] = {}
+        self.files: dict[str, dict] = {}
+        self.pending_uploads: dict[str, dict] = {}
+        self._by_id: list[int] = []
+        self._by_updated_at: list[tuple[datetime, int]] = []
+        self._next_id = 1
+        self._writes = 0
+
+    async def get_memes(
+        self,
+        order_by: Literal["id", "updated_at"] = "id",
+        descending: bool = False,
+        offset=0,
+        limit=10,
+    ) -> list[dict]:
+        ids = self._ids(order_by)
+        if descending:
+            ids = ids[::-1]
+        return [dict(self.memes[meme_id]) for meme_id in ids[offset : offset + limit]]
+
+    async def get_memes_page(
+        self,
+        order_by: Literal["id", "updated_at"] = "id",
+        descending: bool = False,
+        cursor: str | None = None,
+        limit=10,
+        with_version: bool = False,
+    ) -> KeysetPage:
+        """Same as `SQLAlchemyRepository.get_memes_page`.
+
+        Raises:
+            ValueError: if cursor is malformed or was made for another ordering.
+        """
+        index = self._by_updated_at if order_by == "updated_at" else self._by_id
+        position = Cursor.decode(cursor, order_by, descending) if cursor else None
+        backwards = position is not None and position.backwards
+        key = None
+        if position is not None:
+            key = tuple(position.keys) if order_by == "updated_at" else position.keys[0]
+
+        if descending != backwards:
+            end = bisect_left(index, key) if key is not None else len(index)
+            keys = index[max(end - limit - 1, 0) : end][::-1]
+        else:
+            start = bisect_right(index, key) if key is not None else 0
+            keys = index[start : start + limit + 1]
+        rows = [dict(self.memes[key[-1] if order_by == "updated_at" else key]) for key in keys]
+
+        def cursor_at(row, backwards: bool) -> str:
+            keys = (row["updated_at"], row["id"]) if order_by == "updated_at" else (row["id"],)
+            return Cursor(order_by, descending, keys, backwards).encode()
+
+        version = await self.get_memes_version() if with_version else None
+        return KeysetPage.from_rows(rows, limit, position, cursor_at, version)
+
+    async def search_memes(self, q: str, cursor: str | None = None, limit=10) -> KeysetPage:
+        """Finds memes whose descriptions have words starting with the words of the query. Rank is the share
+        of the matched words of the query, memes of the same rank are ordered by `id` descending.
+
+        Raises:
+            ValueError: if cursor is malformed.
+        """
+        terms = q.casefold().split()
+        ranked = []
+        for meme in self.memes.values():
+            words = (meme["description"] or "").casefold().split()
+            matched = sum(any(word.startswith(term) for word in words) for term in terms)
+            if matched:
+                ranked.append((matched / len(terms), meme["id"]))
+
+        position = Cursor.decode(cursor, "rank", True) if cursor else None
+        backwards = position is not None and position.backwards
+        if position is not None:
+            ranked = [key for key in ranked if (key > position.keys if backwards else key < position.keys)]
+        keys = heapq.nsmallest(limit + 1, ranked) if backwards else heapq.nlargest(limit + 1, ranked)
+        rows = [{**self.memes[meme_id], "rank": rank} for rank, meme_id in keys]
+
+        def cursor_at(row, backwards: bool) -> str:
+            return Cursor("rank", True, (row["rank"], row["id"]), backwards).encode()
+
+        return KeysetPage.from_rows(rows, limit, position, cursor_at)
+
+    async def count_memes(self) -> int:
+        return len(self.memes)
+
+    async def estimate_memes_count(self) -> int:
+        return len(self.memes)
+
+    async def get_memes_version(self) -> tuple:
+        """Number of writes of memes so far."""
+        return (self._writes,)
+
+    async def get_meme_by_id(self, meme_id: int, primary: bool = False) -> dict | None:
+        meme = self.memes.get(meme_id)
+        return None if meme is None else dict(meme)
+
+    async def get_memes_by_ids(self, meme_ids: list[int]) -> list[dict]:
+        return [dict(self.memes[meme_id]) for meme_id in dict.fromkeys(meme_ids) if meme_id in self.memes]
+
+    async def add_meme(self, meme: Meme) -> dict:
+        """Same as `SQLAlchemyRepository.add_meme`."""
+        filename = meme.filename if meme.content_hash is None else self._acquire_file(meme)
+        return self._insert(filename, meme.description, meme.content_type.value, meme.content_hash)
+
+    async def add_meme_of_stored_file(self, meme: Meme) -> dict | None:
+        """Same as `SQLAlchemyRepository.add_meme_of_stored_file`."""
+        file = self.files.get(meme.content_hash)
+        if file is None or file["content_type"] != meme.content_type.value:
+            return None
+        file["ref_count"] += 1
+        return self._insert(file["filename"], meme.description, meme.content_type.value, meme.content_hash)
+
+    async def set_content_hash(self, meme_id: int, filename: str, content_hash: str) -> str | None:
+        meme = self.memes.get(meme_id)
+        if meme is None or meme["filename"] != filename or meme["content_hash"] is not None:
+            return None
+        stored = self._acquire_file(Meme(filename=filename, content_hash=content_hash))
+        if stored != filename:
+            self._update(meme_id, filename=stored, content_hash=content_hash)
+        else:
+            meme["content_hash"] = content_hash
+        return stored
+
+    async def add_memes_bulk(self, memes: list[Meme]) -> list[dict]:
+        return [await self.add_meme(meme) for meme in memes]
+
+    async def update_meme_by_id(self, meme_id: int, file: Meme | None = None, **kwargs) -> dict | None:
+        """Same as `SQLAlchemyRepository.update_meme_by_id`."""
+        forbidden = ("updated_at", "created_at", "id", "content_type", "content_hash", "image_hash", "derivatives")
+        if any(i in kwargs.keys() for i in forbidden):
+            raise ValueError("Can't update provided fields.")
+        if meme_id not in self.memes:
+            return None
+
+        replaced = None
+        if file is not None:
+            replaced = dict(self.memes[meme_id])
+            kwargs["filename"] = file.filename if file.content_hash is None else self._acquire_file(file)
+            kwargs["content_type"] = file.content_type.value
+            kwargs["content_hash"] = file.content_hash
+            # hash and derivatives of the new file are made after the upload
+            kwargs["derivatives"] = []
+            self.image_hashes.pop(meme_id, None)
+
+        meme = self._update(meme_id, **kwargs)
+        meme["replaced"] = self._release_files([replaced])[0] if replaced is not None else None
+        return meme
+
+    async def delete_meme_by_id(self, meme_id: int) -> dict | None:
+        """Same as `SQLAlchemyRepository.delete_meme_by_id`."""
+        if meme_id not in self.memes:
+            return None
+        return self._release_files([self._delete(meme_id)])[0]
+
+    async def update_memes_descriptions(self, descriptions: dict[int, str | None]) -> list[dict]:
+        return [
+            self._update(meme_id, description=description)
+            for meme_id, description in descriptions.items()
+            if meme_id in self.memes
+        ]
+
+    async def delete_memes_by_ids(self, meme_ids: list[int]) -> list[dict]:
+        deleted = [self._delete(meme_id) for meme_id in dict.fromkeys(meme_ids) if meme_id in self.memes]
+        return self._release_files(deleted)
+
+    async def add_pending_upload(
+        self,
+        meme: Meme,
+        size: int | None = None,
+        multipart_upload_id: str | None = None,
+        expires_in: timedelta = timedelta(hours=1),
+    ) -> dict:
+        upload = {
+            "id": meme.id,
+            "filename": meme.filename,
+            "description": meme.description,
+            "content_type": meme.content_type.value,
+            "size": size,
+            "multipart_upload_id": multipart_upload_id,
+            "created_at": datetime.now(),
+            "expires_at": datetime.now() + expires_in,
+        }
+        self.pending_uploads[meme.id] = upload
+        return dict(upload)
+
+    async def get_pending_upload(self, upload_id: str) -> dict | None:
+        upload = self.pending_uploads.get(upload_id)
+        return None if upload is None or _expired(upload) else dict(upload)
+
+    async def complete_pending_upload(self, upload_id: str) -> dict | None:
+        upload = self.pending_uploads.get(upload_id)
+        if upload is None or _expired(upload):
+            return None
+        del self.pending_uploads[upload_id]
+        return self._insert(upload["filename"], upload["description"], upload["content_type"], None)
+
+    async def delete_pending_upload(self, upload_id: str) -> None:
+        self.pending_uploads.pop(upload_id, None)
+
+    async def get_expired_uploads(self, limit=100) -> list[dict]:
+        expired = [dict(upload) for upload in self.pending_uploads.values() if _expired(upload)]
+        return sorted(expired, key=lambda upload: upload["expires_at"])[:limit]
+
+    async def find_similar_memes(self, meme_id: int, max_distance: int = 6, limit=50) -> list[dict]:
+        """Same as `SQLAlchemyRepository.find_similar_memes`, but all hashes are compared.
+
+        Raises:
+            ValueError: if `max_distance` is too large.
+        """
+        if not 0 <= max_distance <= MAX_DISTANCE:
+            raise ValueError(f"Distance should be from 0 to {MAX_DISTANCE}.")
+        image_hash = self.image_hashes.get(meme_id)
+        if image_hash is None:
+            return []
+
+        distances = [
+            (hamming_distance(image_hash, other), other_id)
+            for other_id, other in self.image_hashes.items()
+            if other_id != meme_id
+        ]
+        closest = heapq.nsmallest(limit, (key for key in distances if key[0] <= max_distance))
+        return [{**self.memes[other_id], "distance": distance} for distance, other_id in closest]
+
+    async def get_memes_without_image_hash(self, after_id: int | None = None, limit=100) -> list[dict]:
+        start = bisect_right(self._by_id, after_id) if after_id is not None else 0
+        memes = []
+        for meme_id in self._by_id[start:]:
+            if len(memes) == limit:
+                break
+            meme = self.memes[meme_id]
+            if meme_id not in self.image_hashes and meme["content_type"].startswith("image/"):
+                memes.append(dict(meme))
+        return memes
+
+    async def set_image_hashes(self, hashes: dict[int, int]) -> None:
+        self.image_hashes.update({meme_id: value for meme_id, value in hashes.items() if meme_id in self.memes})
+
+    async def get_memes_without_derivatives(self, after_id: int | None = None, limit=100) -> list[dict]:
+        start = bisect_right(self._by_id, after_id) if after_id is not None else 0
+        memes = []
+        for meme_id in self._by_id[start:]:
+            if len(memes) == limit:
+                break
+            meme = self.memes[meme_id]
+            if not meme["derivatives"] and meme["content_type"].startswith(("image/", "video/")):
+                memes.append(dict(meme))
+        return memes
+
+    async def set_derivatives(self, derivatives: dict[str, list[str]]) -> list[int]:
+        meme_ids = [meme["id"] for meme in self.memes.values() if meme["filename"] in derivatives]
+        for meme_id in meme_ids:
+            self._update(meme_id, derivatives=list(derivatives[self.memes[meme_id]["filename"]]))
+        return meme_ids
+
+    async def get_stored_filenames(self, filenames: list[str]) -> set[str]:
+        stored = {file["filename"] for file in self.files.values()}
+        stored |= {meme["filename"] for meme in self.memes.values()}
+        stored |= {upload["filename"] for upload in self.pending_uploads.values() if not _expired(upload)}
+        return stored.intersection(filenames)
+
+    def _ids(self, order_by: Literal["id", "updated_at"]) -> list[int]:
+        if order_by == "updated_at":
+            return [meme_id for _, meme_id in self._by_updated_at]
+        return self._by_id
+
+    def _insert(self, filename: str, description: str | None, content_type: str, content_hash: str | None) -> dict:
+        now = datetime.now()
+        meme = {
+            "id": self._next_id,
+            "filename": filename,
+            "description": description,
+            "content_type": content_type,
+            "content_hash": content_hash,
+            "created_at": now,
+            "updated_at": now,
+            "derivatives": [],
+        }
+        self._next_id += 1
+        self._writes += 1
+        self.memes[meme["id"]] = meme
+        # ids only grow, so the list stays sorted
+        self._by_id.append(meme["id"])
+        insort(self._by_updated_at, (now, meme["id"]))
+        return dict(meme)
+
+    def _update(self, meme_id: int, **values) -> dict:
+        meme = self.memes[meme_id]
+        del self._by_updated_at[bisect_left(self._by_updated_at, (meme["updated_at"], meme_id))]
+        meme.update(values, updated_at=datetime.now())
+        insort(self._by_updated_at, (meme["updated_at"], meme_id))
+        self._writes += 1
+        return dict(meme)
+
+    def _delete(self, meme_id: int) -> dict:
+        meme = self.memes.pop(meme_id)
+        self.image_hashes.pop(meme_id, None)
+        del self._by_id[bisect_left(self._by_id, meme_id)]
+        del self._by_updated_at[bisect_left(self._by_updated_at, (meme["updated_at"], meme_id))]
+        self._writes += 1
+        return meme
+
+    def _acquire_file(self, meme: Meme) -> str:
+        file = self.files.setdefault(
+            meme.content_hash,
+            {"filename": meme.filename, "content_type": meme.content_type.value, "ref_count": 0},
+        )
+        file["ref_count"] += 1
+        return file["filename"]
+
+    def _release_files(self, memes: list[dict]) -> list[dict]:
+        counts = Counter(meme["content_hash"] for meme in memes if meme["content_hash"] is not None)
+        released = set()
+        for content_hash, references in counts.items():
+            file = self.files.get(content_hash)
+            if file is None:
+                continue
+            file["ref_count"] -= references
+            if file["ref_count"] <= 0:
+                del self.files[content_hash]
+                released.add(content_hash)
+        return [
+            {**meme, "released": meme["content_hash"] is None or meme["content_hash"] in released} for meme in memes
+        ]
+
+
+def _expired(upload: dict) -> bool:
+    return upload["expires_at"] <= datetime.now()
+
+
+class InMemoryJobRepository:
+    def __init__(self) -> None:
+        """Queue of background jobs in the memory of the process, behaves like `JobRepository`."""
+        self.jobs: dict[int, dict] = {}
+        self._next_id = 1
+
+    async def add_job(self, kind: str, payload: dict, delay: timedelta | None = None) -> int:
+        job_id = self._next_id
+        self._next_id += 1
+        self.jobs[job_id] = {
+            "id": job_id,
+            "kind": kind,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "last_error": None,
+            "run_at": datetime.now() + (delay or timedelta()),
+        }
+        return job_id
+
+    async def claim_jobs(self, kinds: list[str], limit: int, lease: timedelta) -> list[dict]:
+        now = datetime.now()
+        due = [
+            job
+            for job in self.jobs.values()
+            if job["status"] == "pending" and job["run_at"] <= now and job["kind"] in kinds
+        ]
+        claimed = []
+        for job in heapq.nsmallest(limit, due, key=lambda job: job["run_at"]):
+            job["attempts"] += 1
+            job["run_at"] = now + lease
+            claimed.append({key: job[key] for key in ("id", "kind", "payload", "attempts")})
+        return claimed
+
+    async def complete_job(self, job_id: int) -> None:
+        self.jobs.pop(job_id, None)
+
+    async def fail_job(self, job_id: int, error: str, retry_in: timedelta | None) -> None:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job["last_error"] = error
+        if retry_in is None:
+            job["status"] = "dead"
+        else:
+            job["run_at"] = datetime.now() + retry_in
+
+    async def retry_dead_jobs(self, kinds: list[str] | None = None) -> int:
+        dead = [
+            job for job in self.jobs.values() if job["status"] == "dead" and (kinds is None or job["kind"] in kinds)
+        ]
+        for job in dead:
+            job.update(status="pending", attempts=0, run_at=datetime.now())
+        return len(dead)
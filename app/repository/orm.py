@@ -1,25 +1,137 @@
 from datetime import datetime
 
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy import BigInteger, Computed, ForeignKey, Index, String, literal_column, text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSVECTOR
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 from app.config import settings
+from app.media.similarity import CHUNK_BITS, CHUNKS
+from app.repository.replicas import Replicas
+from app.utils.lazy import Lazy
 
-engine = create_async_engine(settings.DATABASE_URL)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+def create_engine(url: str) -> AsyncEngine:
+    connect_args = {"prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE}
+    if settings.DB_STATEMENT_TIMEOUT_MS is not None:
+        connect_args["server_settings"] = {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}
+    return create_async_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+def create_replicas() -> Replicas:
+    return Replicas(
+        [async_sessionmaker(replica, expire_on_commit=False) for replica in replica_engines.get()],
+        cooldown=settings.POSTGRES_REPLICA_COOLDOWN_SECONDS,
+    )
+
+
+# made on first use, so a worker does not need the settings to import the app
+engine: Lazy[AsyncEngine] = Lazy(lambda: create_engine(settings.DATABASE_URL), "engine")
+async_session: Lazy[async_sessionmaker] = Lazy(
+    lambda: async_sessionmaker(engine.get(), expire_on_commit=False), "sessions"
+)
+replica_engines: Lazy[list[AsyncEngine]] = Lazy(
+    lambda: [create_engine(url) for url in settings.REPLICA_DATABASE_URLS], "replica engines"
+)
+replicas: Lazy[Replicas] = Lazy(create_replicas, "replicas")
 
 
 class Base(DeclarativeBase):
     pass
 
 
+def _image_hash_chunk_sql(index: int) -> str:
+    """`index`-th chunk of `image_hash`, see `app.media.similarity.chunk`."""
+    return f"((image_hash >> {(CHUNKS - 1 - index) * CHUNK_BITS}) & {(1 << CHUNK_BITS) - 1})"
+
+
+class MemeFilesTable(Base):
+    """Stored files by their content, memes with the same content share one file."""
+
+    __tablename__ = "meme_files"
+
+    content_hash: Mapped[str] = mapped_column(primary_key=True)
+    filename: Mapped[str] = mapped_column(unique=True)
+    content_type: Mapped[str]
+    ref_count: Mapped[int]
+    created_at: Mapped[datetime] = mapped_column(server_default=text("now()"))
+
+
 class MemesTable(Base):
     __tablename__ = "memes"
 
-    id: Mapped[str] = mapped_column(primary_key=True)
-    filename: Mapped[str]
+    id: Mapped[int] = mapped_column(primary_key=True)
+    filename: Mapped[str] = mapped_column(index=True)
     description: Mapped[str | None]
     content_type: Mapped[str]
+    content_hash: Mapped[str | None] = mapped_column(ForeignKey("meme_files.content_hash"), index=True)
     created_at: Mapped[datetime] = mapped_column(server_default=text("now()"))
     updated_at: Mapped[datetime] = mapped_column(server_default=text("now()"))
+    # keys of the derivatives made of the file, set by the `process_file` job
+    derivatives: Mapped[list[str]] = mapped_column(ARRAY(String), server_default="{}")
+    # columns below are for searching only and are not selected with memes, see `MEME_COLUMNS`
+    image_hash: Mapped[int | None] = mapped_column(BigInteger)
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR, Computed("to_tsvector('russian', coalesce(description, ''))", persisted=True)
+    )
+
+    __table_args__ = (
+        Index("ix_memes_updated_at_id", "updated_at", "id"),
+        Index("ix_memes_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_memes_description_trgm",
+            "description",
+            postgresql_using="gin",
+            postgresql_ops={"description": "gin_trgm_ops"},
+        ),
+        *(Index(f"ix_memes_image_hash_{index}", text(_image_hash_chunk_sql(index))) for index in range(CHUNKS)),
+    )
+
+
+def image_hash_chunk(index: int):
+    """Expression of a chunk of `image_hash`, the same as in its index so the index can be used."""
+    return literal_column(_image_hash_chunk_sql(index))
+
+
+MEME_COLUMNS = [column for column in MemesTable.__table__.columns if column.name not in ("image_hash", "search_vector")]
+
+
+class PendingUploadsTable(Base):
+    """Uploads sent by clients straight to the storage, they become memes when completed."""
+
+    __tablename__ = "pending_uploads"
+
+    id: Mapped[str] = mapped_column(primary_key=True)
+    filename: Mapped[str] = mapped_column(index=True)
+    description: Mapped[str | None]
+    content_type: Mapped[str]
+    size: Mapped[int | None] = mapped_column(BigInteger)
+    multipart_upload_id: Mapped[str | None]
+    created_at: Mapped[datetime] = mapped_column(server_default=text("now()"))
+    # urls of the upload stop working then, it can't be completed and is cleaned up by `expire_uploads` job
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+
+
+class JobsTable(Base):
+    """Background jobs, see `app.jobs.worker.JobWorker`. Finished jobs are deleted, the ones that failed
+    too many times are kept as "dead"."""
+
+    __tablename__ = "jobs"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    kind: Mapped[str]
+    payload: Mapped[dict] = mapped_column(JSONB)
+    status: Mapped[str] = mapped_column(server_default="pending")
+    attempts: Mapped[int] = mapped_column(server_default="0")
+    last_error: Mapped[str | None]
+    run_at: Mapped[datetime] = mapped_column(server_default=text("now()"))
+    created_at: Mapped[datetime] = mapped_column(server_default=text("now()"))
+
+    __table_args__ = (Index("ix_jobs_pending_run_at", "run_at", postgresql_where=text("status = 'pending'")),)
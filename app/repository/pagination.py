@@ -0,0 +1,78 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Literal
+
+
+@dataclass
+class Cursor:
+    """Position in a keyset ordered list. `keys` are the values of the ordering columns of the row
+    next to which the page starts, `backwards` is True if the page goes before that row."""
+
+    order_by: Literal["id", "updated_at", "rank"]
+    descending: bool
+    keys: tuple
+    backwards: bool = False
+
+    def encode(self) -> str:
+        keys = [key.isoformat() if isinstance(key, datetime) else key for key in self.keys]
+        payload = {"o": self.order_by, "d": self.descending, "k": keys, "b": self.backwards}
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, cursor: str, order_by: Literal["id", "updated_at", "rank"], descending: bool) -> "Cursor":
+        """Decodes cursor made by `encode`.
+
+        Raises:
+            ValueError: if cursor is malformed or was made for another ordering.
+        """
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            keys = payload["k"]
+            if payload["o"] == "updated_at":
+                keys = [datetime.fromisoformat(keys[0]), int(keys[1])]
+            elif payload["o"] == "rank":
+                keys = [float(keys[0]), int(keys[1])]
+            else:
+                keys = [int(keys[0])]
+            decoded = cls(payload["o"], bool(payload["d"]), tuple(keys), bool(payload["b"]))
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise ValueError("Malformed cursor.")
+
+        if (decoded.order_by, decoded.descending) != (order_by, descending):
+            raise ValueError("Cursor was made for another ordering.")
+        return decoded
+
+
+@dataclass
+class KeysetPage:
+    items: list[Any] = field(default_factory=list)
+    next_cursor: str | None = None
+    previous_cursor: str | None = None
+    # version of the whole table read with the page, see `SQLAlchemyRepository.get_memes_version`
+    version: tuple | None = None
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: list,
+        limit: int,
+        position: Cursor | None,
+        cursor_at: Callable[[Any, bool], str],
+        version: tuple | None = None,
+    ) -> "KeysetPage":
+        """Makes page of rows read in the scan order, `limit + 1` of them, the extra row tells
+        if there is more. `cursor_at(row, backwards)` makes the cursor of a row."""
+        backwards = position is not None and position.backwards
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows = rows[::-1]
+
+        page = cls(items=rows, version=version)
+        if rows and (has_more if not backwards else position is not None):
+            page.next_cursor = cursor_at(rows[-1], False)
+        if rows and (has_more if backwards else position is not None):
+            page.previous_cursor = cursor_at(rows[0], True)
+        return page
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from asyncpg.exceptions import CannotConnectNowError
+from sqlalchemy.exc import DBAPIError
+
+
+class Replicas:
+    def __init__(self, session_factories: list, cooldown: float = 30):
+        """Read replicas, each read goes to the next one in turn. A replica that could not be reached
+        is skipped for `cooldown` seconds, so a dead replica does not slow every read down.
+
+        Args:
+            session_factories (list): session factory of each replica, e.g. `async_sessionmaker`.
+            cooldown (float, optional): seconds to skip a failed replica for. Defaults to 30.
+        """
+        self.session_factories = session_factories
+        self.cooldown = cooldown
+        self._next = 0
+        self._failed_until: dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.session_factories)
+
+    def candidates(self) -> list[tuple[int, object]]:
+        """Healthy replicas with their indexes, starting from the next one in turn."""
+        if not self.session_factories:
+            return []
+        start = self._next
+        self._next = (self._next + 1) % len(self.session_factories)
+        now = time.monotonic()
+        indexes = [(start + shift) % len(self.session_factories) for shift in range(len(self.session_factories))]
+        return [(i, self.session_factories[i]) for i in indexes if self._failed_until.get(i, 0) <= now]
+
+    def mark_failed(self, index: int) -> None:
+        self._failed_until[index] = time.monotonic() + self.cooldown
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """True if the database could not be reached, as opposed to the query failing."""
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated
+    return isinstance(error, (OSError, asyncio.TimeoutError, CannotConnectNowError))
@@ -1,15 +1,59 @@
+import logging
+from collections import Counter
+from datetime import timedelta
 from typing import Literal
-from sqlalchemy import select, insert, desc, update, func, delete
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    String,
+    any_,
+    bindparam,
+    cast,
+    select,
+    insert,
+    desc,
+    update,
+    func,
+    delete,
+    literal_column,
+    or_,
+    text,
+    tuple_,
+    union,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, BIT, JSONB, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.repository.orm import MemesTable
+from app.media.similarity import chunk_candidates
+from app.repository.orm import (
+    MEME_COLUMNS,
+    MemeFilesTable,
+    MemesTable,
+    PendingUploadsTable,
+    image_hash_chunk,
+)
+from app.repository.pagination import Cursor, KeysetPage
+from app.repository.replicas import Replicas, is_connection_error
 from app.domain.entities import Meme
+from app.telemetry.tracing import instrumented
 
 
+@instrumented("db")
 class SQLAlchemyRepository:
 
-    def __init__(self, session: AsyncSession) -> None:
+    def __init__(self, session: AsyncSession, replicas: Replicas | None = None, autocommit: bool = True) -> None:
+        """Repository of memes, writes go to the primary and some reads go to the replicas.
+
+        Args:
+            session (AsyncSession): session of the primary database.
+            replicas (Replicas | None, optional): read replicas for the feed and single memes, their lag
+                can be seen right after a write. Defaults to None, everything is read from the primary.
+            autocommit (bool, optional): commit after every write. Disabled in a unit of work,
+                which commits all writes at once. Defaults to True.
+        """
         self.session: AsyncSession = session
+        self.replicas = replicas
+        self.autocommit = autocommit
 
     async def get_memes(
         self,
@@ -20,45 +64,595 @@ class SQLAlchemyRepository:
     ) -> list[MemesTable]:
 
         query = (
-            select(MemesTable.__table__.columns)
+            select(*MEME_COLUMNS)
             .order_by(desc(order_by) if descending else order_by)
             .offset(offset)
             .limit(limit)
         )
+        return await self._read(query)
+
+    async def get_memes_page(
+        self,
+        order_by: Literal["id", "updated_at"] = "id",
+        descending: bool = False,
+        cursor: str | None = None,
+        limit=10,
+        with_version: bool = False,
+    ) -> KeysetPage:
+        """Keyset pagination, the cost of a page does not depend on how deep it is.
+        Rows ordered by `updated_at` are tie-broken by `id`. If `with_version` is set, the version
+        of the table is read right before the page from the same database.
+
+        Raises:
+            ValueError: if cursor is malformed or was made for another ordering.
+        """
+        columns = [MemesTable.updated_at, MemesTable.id] if order_by == "updated_at" else [MemesTable.id]
+        keys = tuple_(*columns) if len(columns) > 1 else columns[0]
+
+        position = Cursor.decode(cursor, order_by, descending) if cursor else None
+        backwards = position is not None and position.backwards
+        # scan the index in reverse to go back, rows are reversed again after the query
+        scan_descending = descending != backwards
+
+        query = select(*MEME_COLUMNS)
+        if position is not None:
+            values = tuple_(*position.keys) if len(columns) > 1 else position.keys[0]
+            query = query.where(keys < values if scan_descending else keys > values)
+        query = query.order_by(*(column.desc() if scan_descending else column for column in columns))
+        query = query.limit(limit + 1)
+
+        version = None
+        if with_version:
+            versions, rows = await self._read_many(_memes_version_query(), query)
+            version = tuple(versions[0].values())
+        else:
+            rows = await self._read(query)
+
+        def cursor_at(row, backwards: bool) -> str:
+            return Cursor(order_by, descending, tuple(row[column.name] for column in columns), backwards).encode()
+
+        return KeysetPage.from_rows(rows, limit, position, cursor_at, version)
+
+    async def search_memes(self, q: str, cursor: str | None = None, limit=10) -> KeysetPage:
+        """Finds memes by description, best matches first. Words are matched by the russian full-text
+        configuration, misspelled and unfinished words by trigram similarity, both are served by GIN indexes.
+        Memes of the same rank are ordered by `id` descending.
+
+        Raises:
+            ValueError: if cursor is malformed.
+        """
+        tsquery = func.websearch_to_tsquery(literal_column("'russian'::regconfig"), q)
+        rank = func.ts_rank(MemesTable.search_vector, tsquery) + func.word_similarity(q, MemesTable.description)
+        keys = tuple_(rank, MemesTable.id)
+
+        position = Cursor.decode(cursor, "rank", True) if cursor else None
+        backwards = position is not None and position.backwards
+
+        query = select(*MEME_COLUMNS, rank.label("rank")).where(
+            or_(MemesTable.search_vector.op("@@")(tsquery), MemesTable.description.op("%>")(q))
+        )
+        if position is not None:
+            values = tuple_(*position.keys)
+            query = query.where(keys > values if backwards else keys < values)
+        query = query.order_by(*(key if backwards else key.desc() for key in (rank, MemesTable.id)))
+        query = query.limit(limit + 1)
+
         result = await self.session.execute(query)
-        return result.mappings().all()
 
-    async def get_meme_by_id(self, meme_id: int) -> MemesTable | None:
-        query = select(MemesTable.__table__.columns).filter_by(id=meme_id)
+        def cursor_at(row, backwards: bool) -> str:
+            return Cursor("rank", True, (row["rank"], row["id"]), backwards).encode()
+
+        return KeysetPage.from_rows(result.mappings().all(), limit, position, cursor_at)
+
+    async def count_memes(self) -> int:
+        query = select(func.count()).select_from(MemesTable)
+        return await self.session.scalar(query)
+
+    async def estimate_memes_count(self) -> int:
+        """Cheap row count from planner statistics, falls back to exact count if the table was never analyzed."""
+        query = text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'memes'::regclass")
+        estimate = await self.session.scalar(query)
+        if estimate is None or estimate < 0:
+            return await self.count_memes()
+        return estimate
+
+    async def get_memes_version(self) -> tuple:
+        """Version of the whole table: the latest `updated_at`, the largest id and the number of memes.
+        Every write of memes changes at least one of them, the maximums are read from the ends of indexes
+        and the count by an index-only scan. Nothing is locked, so writes don't wait for each other."""
+        rows = await self._read(_memes_version_query())
+        return tuple(rows[0].values())
+
+    async def get_meme_by_id(self, meme_id: int, primary: bool = False) -> MemesTable | None:
+        """Meme by its id, from a replica unless `primary` is set, e.g. to fill a cache that must not
+        keep a row written before the latest write."""
+        query = select(*MEME_COLUMNS).filter_by(id=meme_id)
+        rows = (await self.session.execute(query)).mappings().all() if primary else await self._read(query)
+        return rows[0] if rows else None
+
+    async def get_memes_by_ids(self, meme_ids: list[int]) -> list[MemesTable]:
+        query = select(*MEME_COLUMNS).where(MemesTable.id == any_(_ids_param(meme_ids)))
         result = await self.session.execute(query)
-        return result.mappings().one_or_none()
+        return result.mappings().all()
 
     async def add_meme(self, meme: Meme) -> type[MemesTable]:
+        """Adds meme. If it has `content_hash` and a file with the same content is stored already,
+        the meme references that file and the returned `filename` differs from `meme.filename`."""
+        filename = meme.filename
+        if meme.content_hash is not None:
+            filename = await self._acquire_file(meme)
+
         query = (
             insert(MemesTable)
-            .values(filename=meme.filename, description=meme.description, content_type=meme.content_type.value)
-            .returning(*MemesTable.__table__.columns)
+            .values(
+                filename=filename,
+                description=meme.description,
+                content_type=meme.content_type.value,
+                content_hash=meme.content_hash,
+            )
+            .returning(*MEME_COLUMNS)
         )
         result = await self.session.execute(query)
-        await self.session.commit()
+        await self._commit()
         return result.mappings().one()
 
-    async def update_meme_by_id(self, meme_id: int, **kwargs) -> MemesTable | None:
+    async def add_meme_of_stored_file(self, meme: Meme) -> MemesTable | None:
+        """Adds meme that references the stored file with `meme.content_hash`, without uploading it again.
+        Returns None if no file of the same type has that content."""
+        query = (
+            update(MemeFilesTable)
+            .filter_by(content_hash=meme.content_hash, content_type=meme.content_type.value)
+            .values(ref_count=MemeFilesTable.ref_count + 1)
+            .returning(MemeFilesTable.filename)
+        )
+        # the file can't be released while the reference is added, its row is locked by the update
+        filename = await self.session.scalar(query)
+        if filename is None:
+            return None
 
-        if any(i in kwargs.keys() for i in ("updated_at", "created_at", "id", "content_type")):
+        query = (
+            insert(MemesTable)
+            .values(
+                filename=filename,
+                description=meme.description,
+                content_type=meme.content_type.value,
+                content_hash=meme.content_hash,
+            )
+            .returning(*MEME_COLUMNS)
+        )
+        result = await self.session.execute(query)
+        await self._commit()
+        return result.mappings().one()
+
+    async def set_content_hash(self, meme_id: int, filename: str, content_hash: str) -> str | None:
+        """Registers the content of a file stored without a known hash, e.g. uploaded by a client with a presigned url,
+        so it is shared like uploaded files are. If the same content is stored already, the meme references that file
+        and `updated_at` is set, as its links change.
+
+        Returns:
+            str | None: name of the stored file of the meme, if it differs from `filename` the file should be deleted.
+                None if the meme was deleted, its file replaced or its hash is set already.
+        """
+        query = (
+            select(MemesTable.id)
+            .filter_by(id=meme_id, filename=filename, content_hash=None)
+            # the file can't be replaced while it is registered
+            .with_for_update()
+        )
+        if await self.session.scalar(query) is None:
+            await self._rollback()
+            return None
+
+        stored = await self._acquire_file(Meme(filename=filename, content_hash=content_hash))
+        values = {"content_hash": content_hash}
+        if stored != filename:
+            values.update(filename=stored, updated_at=func.now())
+        await self.session.execute(update(MemesTable).filter_by(id=meme_id).values(**values))
+        await self._commit()
+        return stored
+
+    async def add_memes_bulk(self, memes: list[Meme]) -> list[MemesTable]:
+        """Adds all memes with a single multi-row INSERT ... RETURNING in one transaction. Memes with
+        `content_hash` share stored files like in `add_meme`. Returns the memes in the order of `memes`."""
+        if not memes:
+            return []
+
+        hashed = [meme for meme in memes if meme.content_hash is not None]
+        stored = await self._acquire_files(hashed) if hashed else {}
+        query = (
+            insert(MemesTable)
+            .values(
+                [
+                    {
+                        "filename": stored.get(meme.content_hash, meme.filename),
+                        "description": meme.description,
+                        "content_type": meme.content_type.value,
+                        "content_hash": meme.content_hash,
+                    }
+                    for meme in memes
+                ]
+            )
+            .returning(*MEME_COLUMNS)
+        )
+        result = await self.session.execute(query)
+        await self._commit()
+        return result.mappings().all()
+
+    async def update_meme_by_id(self, meme_id: int, file: Meme | None = None, **kwargs) -> dict | None:
+        """Updates meme. If `file` is given, the meme is switched to it like in `add_meme`
+        and the previous meme is returned under the `replaced` key, see `delete_meme_by_id`."""
+
+        forbidden = ("updated_at", "created_at", "id", "content_type", "content_hash", "image_hash", "derivatives")
+        if any(i in kwargs.keys() for i in forbidden):
             raise ValueError("Can't update provided fields.")
 
+        replaced = None
+        if file is not None:
+            query = select(*MEME_COLUMNS).filter_by(id=meme_id).with_for_update()
+            replaced = (await self.session.execute(query)).mappings().one_or_none()
+            if replaced is None:
+                await self._rollback()
+                return None
+            kwargs["filename"] = file.filename if file.content_hash is None else await self._acquire_file(file)
+            kwargs["content_type"] = file.content_type.value
+            kwargs["content_hash"] = file.content_hash
+            # hash and derivatives of the new file are made after the upload
+            kwargs["image_hash"] = None
+            kwargs["derivatives"] = []
+
         query = (
             update(MemesTable)
             .filter_by(id=meme_id)
             .values(**kwargs, updated_at=func.now())
-            .returning(*MemesTable.__table__.columns)
+            .returning(*MEME_COLUMNS)
+        )
+        result = await self.session.execute(query)
+        meme = result.mappings().one_or_none()
+        if meme is None:
+            await self._rollback()
+            return None
+
+        meme = dict(meme)
+        meme["replaced"] = (await self._release_files([replaced]))[0] if replaced is not None else None
+        await self._commit()
+        return meme
+
+    async def delete_meme_by_id(self, meme_id: int) -> dict | None:
+        """Deletes meme.
+
+        Returns:
+            dict | None: deleted meme, `released` key is True if its file is not referenced anymore
+                and should be removed from the storage. None if there is no such meme.
+        """
+        query = delete(MemesTable).filter_by(id=meme_id).returning(*MEME_COLUMNS)
+        meme = (await self.session.execute(query)).mappings().one_or_none()
+        if meme is None:
+            return None
+        meme = (await self._release_files([meme]))[0]
+        await self._commit()
+        return meme
+
+    async def update_memes_descriptions(self, descriptions: dict[int, str | None]) -> list[MemesTable]:
+        """Updates descriptions of many memes with a single statement.
+
+        Args:
+            descriptions (dict[int, str | None]): new description by meme id.
+
+        Returns:
+            list[MemesTable]: updated memes, missing ids are skipped.
+        """
+        if not descriptions:
+            return []
+
+        # unnest of two arrays of the same length zips them into rows
+        ids = _ids_param(list(descriptions.keys()))
+        new_descriptions = bindparam("descriptions", list(descriptions.values()), type_=ARRAY(String))
+        values = select(func.unnest(ids).label("id"), func.unnest(new_descriptions).label("description")).subquery()
+        query = (
+            update(MemesTable)
+            .where(MemesTable.id == values.c.id)
+            .values(description=values.c.description, updated_at=func.now())
+            .returning(*MEME_COLUMNS)
+        )
+        result = await self.session.execute(query)
+        await self._commit()
+        return result.mappings().all()
+
+    async def delete_memes_by_ids(self, meme_ids: list[int]) -> list[dict]:
+        """Deletes many memes in one transaction.
+
+        Returns:
+            list[dict]: deleted memes with `released` key like in `delete_meme_by_id`, missing ids are skipped.
+        """
+        query = (
+            delete(MemesTable)
+            .where(MemesTable.id == any_(_ids_param(meme_ids)))
+            .returning(*MEME_COLUMNS)
         )
         result = await self.session.execute(query)
-        await self.session.commit()
+        memes = await self._release_files(result.mappings().all())
+        await self._commit()
+        return memes
+
+    async def add_pending_upload(
+        self,
+        meme: Meme,
+        size: int | None = None,
+        multipart_upload_id: str | None = None,
+        expires_in: timedelta = timedelta(hours=1),
+    ) -> PendingUploadsTable:
+        """Registers upload sent by a client straight to the storage, `meme.id` becomes the id of the upload.
+        It can be completed for `expires_in`, the lifetime of its presigned urls."""
+        query = (
+            insert(PendingUploadsTable)
+            .values(
+                id=meme.id,
+                filename=meme.filename,
+                description=meme.description,
+                content_type=meme.content_type.value,
+                size=size,
+                multipart_upload_id=multipart_upload_id,
+                expires_at=func.now() + expires_in,
+            )
+            .returning(*PendingUploadsTable.__table__.columns)
+        )
+        result = await self.session.execute(query)
+        await self._commit()
+        return result.mappings().one()
+
+    async def get_pending_upload(self, upload_id: str) -> PendingUploadsTable | None:
+        """Upload that is not expired yet."""
+        query = select(PendingUploadsTable.__table__.columns).filter_by(id=upload_id).where(_not_expired())
+        result = await self.session.execute(query)
         return result.mappings().one_or_none()
 
-    async def delete_meme_by_id(self, meme_id: int) -> None:
-        query = delete(MemesTable).filter_by(id=meme_id)
+    async def complete_pending_upload(self, upload_id: str) -> MemesTable | None:
+        """Turns pending upload into a meme in one transaction. Returns None if there is no such upload
+        or it is expired."""
+        query = (
+            delete(PendingUploadsTable)
+            .filter_by(id=upload_id)
+            .where(_not_expired())
+            .returning(*PendingUploadsTable.__table__.columns)
+        )
+        upload = (await self.session.execute(query)).mappings().one_or_none()
+        if upload is None:
+            return None
+
+        query = (
+            insert(MemesTable)
+            .values(filename=upload["filename"], description=upload["description"], content_type=upload["content_type"])
+            .returning(*MEME_COLUMNS)
+        )
+        result = await self.session.execute(query)
+        await self._commit()
+        return result.mappings().one()
+
+    async def delete_pending_upload(self, upload_id: str) -> None:
+        query = delete(PendingUploadsTable).filter_by(id=upload_id)
+        await self.session.execute(query)
+        await self._commit()
+
+    async def get_expired_uploads(self, limit=100) -> list[PendingUploadsTable]:
+        """Uploads that can't be completed anymore, the earliest expired first."""
+        query = (
+            select(PendingUploadsTable.__table__.columns)
+            .where(~_not_expired())
+            .order_by(PendingUploadsTable.expires_at)
+            .limit(limit)
+        )
+        result = await self.session.execute(query)
+        return result.mappings().all()
+
+    async def find_similar_memes(self, meme_id: int, max_distance: int = 6, limit=50) -> list[dict]:
+        """Finds memes whose images are within `max_distance` bits of the image of the meme by perceptual hash,
+        closest first. Candidates are looked up by exact chunks of the hash in expression indexes
+        (multi-index hashing), so only a small part of the table is read.
+
+        Returns:
+            list[dict]: memes with `distance` key, empty if the meme has no hash.
+
+        Raises:
+            ValueError: if `max_distance` is too large, see `chunk_candidates`.
+        """
+        image_hash = await self.session.scalar(select(MemesTable.image_hash).filter_by(id=meme_id))
+        if image_hash is None:
+            return []
+
+        candidates = chunk_candidates(image_hash, max_distance)
+        distance = func.bit_count(cast(MemesTable.image_hash.op("#")(image_hash), BIT(64)))
+        query = (
+            select(*MEME_COLUMNS, distance.label("distance"))
+            .where(
+                or_(
+                    *(
+                        image_hash_chunk(index) == any_(bindparam(f"chunk_{index}", values, type_=ARRAY(BigInteger)))
+                        for index, values in enumerate(candidates)
+                    )
+                ),
+                distance <= max_distance,
+                MemesTable.id != meme_id,
+            )
+            .order_by(distance, MemesTable.id)
+            .limit(limit)
+        )
+        result = await self.session.execute(query)
+        return result.mappings().all()
+
+    async def get_memes_without_image_hash(self, after_id: int | None = None, limit=100) -> list[MemesTable]:
+        """Images without perceptual hash ordered by `id`, starting after `after_id`."""
+        query = select(*MEME_COLUMNS).where(MemesTable.image_hash.is_(None), MemesTable.content_type.like("image/%"))
+        if after_id is not None:
+            query = query.where(MemesTable.id > after_id)
+        result = await self.session.execute(query.order_by(MemesTable.id).limit(limit))
+        return result.mappings().all()
+
+    async def set_image_hashes(self, hashes: dict[int, int]) -> None:
+        """Sets perceptual hashes of many memes with a single statement, `updated_at` is kept as it is.
+
+        Args:
+            hashes (dict[int, int]): hash by meme id.
+        """
+        if not hashes:
+            return
+
+        ids = _ids_param(list(hashes.keys()))
+        values = bindparam("hashes", list(hashes.values()), type_=ARRAY(BigInteger))
+        values = select(func.unnest(ids).label("id"), func.unnest(values).label("image_hash")).subquery()
+        query = update(MemesTable).where(MemesTable.id == values.c.id).values(image_hash=values.c.image_hash)
         await self.session.execute(query)
-        await self.session.commit()
+        await self._commit()
+
+    async def get_memes_without_derivatives(self, after_id: int | None = None, limit=100) -> list[MemesTable]:
+        """Images and videos without recorded derivatives ordered by `id`, starting after `after_id`."""
+        query = select(*MEME_COLUMNS).where(
+            MemesTable.derivatives == [],
+            or_(MemesTable.content_type.like("image/%"), MemesTable.content_type.like("video/%")),
+        )
+        if after_id is not None:
+            query = query.where(MemesTable.id > after_id)
+        result = await self.session.execute(query.order_by(MemesTable.id).limit(limit))
+        return result.mappings().all()
+
+    async def set_derivatives(self, derivatives: dict[str, list[str]]) -> list[int]:
+        """Records derivatives of many files with a single statement, for every meme of a file.
+        `updated_at` is set too, as links of the memes change with them.
+
+        Args:
+            derivatives (dict[str, list[str]]): keys of the derivatives by the name of the file.
+
+        Returns:
+            list[int]: ids of the updated memes.
+        """
+        if not derivatives:
+            return []
+
+        names = bindparam("names", list(derivatives), type_=ARRAY(String))
+        # keys of the file of each row are unpacked from a JSON object of all files
+        keys = bindparam("derivatives", derivatives, type_=JSONB).op("->")(MemesTable.filename)
+        keys = select(func.jsonb_array_elements_text(keys)).correlate(MemesTable).scalar_subquery()
+        query = (
+            update(MemesTable)
+            .where(MemesTable.filename == any_(names))
+            .values(derivatives=func.array(keys), updated_at=func.now())
+            .returning(MemesTable.id)
+        )
+        result = await self.session.scalars(query)
+        meme_ids = result.all()
+        await self._commit()
+        return meme_ids
+
+    async def get_stored_filenames(self, filenames: list[str]) -> set[str]:
+        """Names among `filenames` that are referenced by memes, shared files or pending uploads
+        that are not expired. Files of expired uploads are left to the `expire_uploads` job and the reconciler."""
+        names = bindparam("names", filenames, type_=ARRAY(String))
+        query = union(
+            select(MemeFilesTable.filename).where(MemeFilesTable.filename == any_(names)),
+            select(MemesTable.filename).where(MemesTable.filename == any_(names)),
+            select(PendingUploadsTable.filename).where(PendingUploadsTable.filename == any_(names), _not_expired()),
+        )
+        result = await self.session.scalars(query)
+        return set(result.all())
+
+    async def _commit(self) -> None:
+        if self.autocommit:
+            await self.session.commit()
+
+    async def _rollback(self) -> None:
+        # in a unit of work the caller decides what to do with the transaction
+        if self.autocommit:
+            await self.session.rollback()
+
+    async def _read(self, query) -> list:
+        """Runs read-only query on the next replica. If it can't be reached, the other replicas
+        are tried and then the primary."""
+        return (await self._read_many(query))[0]
+
+    async def _read_many(self, *queries) -> list[list]:
+        """Same as `_read`, but the queries are run one after another on the same database."""
+        for index, replica in self.replicas.candidates() if self.replicas else []:
+            try:
+                async with replica() as session:
+                    return [(await session.execute(query)).mappings().all() for query in queries]
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                logging.warning(f"Replica {index} is unavailable, skipping it: {e!r}")
+                self.replicas.mark_failed(index)
+
+        return [(await self.session.execute(query)).mappings().all() for query in queries]
+
+    async def _acquire_file(self, meme: Meme) -> str:
+        """Adds a reference to the stored file with the content of the meme,
+        the file is registered under `meme.filename` if it is new. Returns the name of the stored file."""
+        return (await self._acquire_files([meme]))[meme.content_hash]
+
+    async def _acquire_files(self, memes: list[Meme]) -> dict[str, str]:
+        """Same as `_acquire_file` for many memes with a single statement, memes with the same content
+        share the file of the first one. Returns names of the stored files by content hash."""
+        counts = Counter(meme.content_hash for meme in memes)
+        first = {}
+        for meme in memes:
+            first.setdefault(meme.content_hash, meme)
+        query = pg_insert(MemeFilesTable).values(
+            [
+                {
+                    "content_hash": content_hash,
+                    "filename": meme.filename,
+                    "content_type": meme.content_type.value,
+                    "ref_count": counts[content_hash],
+                }
+                # rows are locked in the same order by concurrent inserts, so they can't deadlock
+                for content_hash, meme in sorted(first.items())
+            ]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[MemeFilesTable.content_hash],
+            set_={"ref_count": MemeFilesTable.ref_count + query.excluded.ref_count},
+        ).returning(MemeFilesTable.content_hash, MemeFilesTable.filename)
+        return dict((await self.session.execute(query)).all())
+
+    async def _release_files(self, memes: list) -> list[dict]:
+        """Drops references of deleted or replaced memes to their files, files without references are unregistered.
+        Memes without `content_hash` own their files. Returns memes with `released` key set
+        if their file is not referenced anymore."""
+        counts = Counter(meme["content_hash"] for meme in memes if meme["content_hash"] is not None)
+        released = set()
+        if counts:
+            hashes = bindparam("hashes", list(counts.keys()), type_=ARRAY(String))
+            references = bindparam("references", list(counts.values()), type_=ARRAY(Integer))
+            values = select(
+                func.unnest(hashes).label("content_hash"), func.unnest(references).label("references")
+            ).subquery()
+            await self.session.execute(
+                update(MemeFilesTable)
+                .where(MemeFilesTable.content_hash == values.c.content_hash)
+                .values(ref_count=MemeFilesTable.ref_count - values.c.references)
+            )
+            result = await self.session.execute(
+                delete(MemeFilesTable)
+                .where(MemeFilesTable.content_hash == any_(hashes), MemeFilesTable.ref_count <= 0)
+                .returning(MemeFilesTable.content_hash)
+            )
+            released = set(result.scalars().all())
+
+        return [
+            {**meme, "released": meme["content_hash"] is None or meme["content_hash"] in released} for meme in memes
+        ]
+
+
+def _memes_version_query():
+    # separate subqueries, so each maximum is read from its index
+    return select(
+        select(func.max(MemesTable.updated_at)).scalar_subquery().label("updated_at"),
+        select(func.max(MemesTable.id)).scalar_subquery().label("id"),
+        select(func.count()).select_from(MemesTable).scalar_subquery().label("count"),
+    )
+
+
+def _not_expired():
+    return PendingUploadsTable.expires_at > func.now()
+
+
+def _ids_param(meme_ids: list[int]):
+    return bindparam("ids", meme_ids, type_=ARRAY(Integer))
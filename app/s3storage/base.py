@@ -0,0 +1,56 @@
+from typing import AsyncIterable, AsyncIterator, Iterable, Protocol, runtime_checkable
+
+from app.s3storage.meme import DeleteResult, FileStream, PoolStats
+
+
+@runtime_checkable
+class Storage(Protocol):
+    """Storage of files, implemented by `MemeStorage` and `InMemoryStorage`."""
+
+    bucket_name: str
+    multipart_part_size: int
+    stats: PoolStats
+
+    async def start(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def upload_file_via_request(self, filename: str, file: bytes, content_type: str | None = None): ...
+
+    async def upload_stream(
+        self, filename: str, stream: AsyncIterable[bytes], content_type: str | None = None
+    ) -> None: ...
+
+    async def get_file(self, filename: str) -> bytes: ...
+
+    async def stream_file(
+        self,
+        filename: str,
+        byte_range: str | None = None,
+        if_none_match: str | None = None,
+        chunk_size: int = 64 * 1024,
+    ) -> FileStream: ...
+
+    async def get_file_url(self, filename: str) -> str: ...
+
+    def get_presigned_url(self, filename: str, expires_in: int = 300) -> str: ...
+
+    async def create_presigned_upload(
+        self, filename: str, content_type: str, size: int | None = None, expires_in: int = 3600
+    ) -> tuple[str | None, list[str]]: ...
+
+    async def complete_multipart_upload(self, filename: str, upload_id: str, parts: list[dict]) -> None: ...
+
+    async def abort_multipart_upload(self, filename: str, upload_id: str) -> None: ...
+
+    async def head_file(self, filename: str) -> dict | None: ...
+
+    async def delete_file(self, filename: str) -> None: ...
+
+    async def delete_many(
+        self, filenames: Iterable[str] | AsyncIterable[str], batch_size: int = 1000, concurrency: int = 4
+    ) -> DeleteResult: ...
+
+    def iter_objects(self, prefix: str = "", page_size: int = 1000) -> AsyncIterator[dict]: ...
+
+    def iter_keys(self, prefix: str = "", page_size: int = 1000) -> AsyncIterator[str]: ...
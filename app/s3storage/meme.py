@@ -1,13 +1,45 @@
 import asyncio
 import logging
-from contextlib import asynccontextmanager
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
-
-from aiobotocore.session import get_session
+from typing import AsyncIterable, AsyncIterator, Iterable
 
 from app.config import settings
+from app.telemetry.tracing import instrumented
+from app.utils.lazy import Lazy
+
+
+@dataclass
+class PoolStats:
+    """Usage of the S3 connection pool, used to size `max_pool_connections`."""
+
+    max_connections: int
+    open_clients: int = 0
+    in_use: int = 0
+    peak_in_use: int = 0
+    acquired_total: int = 0
+    short_lived_total: int = 0
+
+
+@dataclass
+class FileStream:
+    """Part of a file streamed from the storage. `body` is None when there is nothing to send,
+    e.g. on 304 Not Modified or 416 Range Not Satisfiable."""
 
+    status_code: int
+    headers: dict[str, str]
+    body: AsyncIterator[bytes] | None = None
 
+
+@dataclass
+class DeleteResult:
+    deleted: int = 0
+    errors: list[dict] = field(default_factory=list)
+
+
+@instrumented("s3")
 class MemeStorage:
     def __init__(
         self,
@@ -16,6 +48,11 @@ class MemeStorage:
         endpoint_url: str,
         bucket_name: str,
         policy_file: str = "policy.json",
+        max_pool_connections: int = 10,
+        bootstrap_marker: str | None = None,
+        bootstrap_ttl_minutes: float = 10,
+        multipart_part_size: int = 8 * 1024 * 1024,
+        multipart_concurrency: int = 4,
     ):
         """Connection to the S3 storage. Can put, delete and get files.
 
@@ -25,6 +62,13 @@ class MemeStorage:
             endpoint_url (str): url for the API. If use minio it is probably the default value - localhost:9000.
             bucket_name (str): bucket name to store files.
             policy_file (str, optional): policy file for custom policies. Defaults to "policy.json".
+            max_pool_connections (int, optional): size of the HTTP connection pool of the client. Defaults to 10.
+            bootstrap_marker (str | None, optional): file marking that bucket and policy were verified.
+                If set, `start` skips the verification while the marker is fresh. Defaults to None.
+            bootstrap_ttl_minutes (float, optional): how long the marker stays fresh. Defaults to 10.
+            multipart_part_size (int, optional): part size in bytes for streaming uploads,
+                S3 requires at least 5 MiB. Defaults to 8 MiB.
+            multipart_concurrency (int, optional): max number of parts uploaded at once. Defaults to 4.
         """
 
         # init configs for the session
@@ -34,24 +78,101 @@ class MemeStorage:
             "endpoint_url": endpoint_url,
         }
 
+        # imported here, aiobotocore and aiohttp take a good part of the import of the app
+        from aiobotocore.config import AioConfig
+        from aiobotocore.session import get_session
+
+        self.client_config = AioConfig(max_pool_connections=max_pool_connections)
+
         self.bucket_name = bucket_name
+        self.policy_file = policy_file
+
+        self.bootstrap_marker = Path(bootstrap_marker) if bootstrap_marker else None
+        self.bootstrap_ttl = bootstrap_ttl_minutes * 60
+
+        self.multipart_part_size = multipart_part_size
+        self.multipart_concurrency = multipart_concurrency
 
         self.session = get_session()
 
-        # create bucket if it does not exist
-        if not asyncio.run(self.bucket_exists()):
-            asyncio.run(self.create_bucket())
+        # synchronous client used only to sign urls, it never sends requests
+        self._signer = None
+
+        # long-lived clients, one per event loop, opened with `start` and closed with `close`
+        self._clients: dict[asyncio.AbstractEventLoop, tuple[AsyncExitStack, object]] = {}
+        self.stats = PoolStats(max_connections=max_pool_connections)
+
+    async def start(self) -> None:
+        """Opens a long-lived client for the running event loop and makes sure
+        the bucket and its policy exist. Call it on application startup."""
+        loop = asyncio.get_running_loop()
+        if loop in self._clients:
+            return
+
+        stack = AsyncExitStack()
+        client = await stack.enter_async_context(
+            self.session.create_client("s3", config=self.client_config, **self.config)
+        )
+        self._clients[loop] = (stack, client)
+        self.stats.open_clients = len(self._clients)
+        logging.info(f"Opened S3 client with {self.stats.max_connections} pooled connections")
+
+        await self.bootstrap()
+
+    async def bootstrap(self) -> None:
+        """Creates the bucket and adds the policy if they do not exist.
+        Skipped while the bootstrap marker is fresh."""
+        if self._bootstrap_verified_recently():
+            logging.info(f"Bucket '{self.bucket_name}' was verified recently, skipping bootstrap")
+            return
 
-        # add policy if it does not exist
-        if not asyncio.run(self.get_policy()):
-            asyncio.run(self.add_policy(policy_file))
+        exists, policy = await asyncio.gather(self.bucket_exists(), self.get_policy())
+
+        if not exists:
+            await self.create_bucket()
+        if not exists or not policy:
+            await self.add_policy(self.policy_file)
+
+        if self.bootstrap_marker is not None:
+            self.bootstrap_marker.parent.mkdir(parents=True, exist_ok=True)
+            self.bootstrap_marker.touch()
 
         logging.info("All set!")
 
+    def _bootstrap_verified_recently(self) -> bool:
+        if self.bootstrap_marker is None:
+            return False
+        try:
+            return time.time() - self.bootstrap_marker.stat().st_mtime < self.bootstrap_ttl
+        except FileNotFoundError:
+            return False
+
+    async def close(self) -> None:
+        """Closes the long-lived client of the running event loop. Call it on application shutdown."""
+        entry = self._clients.pop(asyncio.get_running_loop(), None)
+        self.stats.open_clients = len(self._clients)
+        if entry is not None:
+            await entry[0].aclose()
+            logging.info(f"Closed S3 client, pool usage: {self.stats}")
+
     @asynccontextmanager
     async def get_client(self):
-        async with self.session.create_client("s3", **self.config) as client:
-            yield client
+        """Yields the long-lived client of the running event loop.
+        Falls back to a short-lived client if `start` was not called, e.g. in scripts."""
+        entry = self._clients.get(asyncio.get_running_loop())
+
+        self.stats.in_use += 1
+        self.stats.acquired_total += 1
+        self.stats.peak_in_use = max(self.stats.peak_in_use, self.stats.in_use)
+        try:
+            if entry is not None:
+                yield entry[1]
+            else:
+                self.stats.short_lived_total += 1
+                async with self.session.create_client("s3", config=self.client_config, **self.config) as client:
+                    yield client
+        finally:
+            self.stats.in_use -= 1
 
     async def upload_local_file(self, filepath: str, filename: str | None = None) -> None:
         """Upload local file from disk.
@@ -68,15 +189,99 @@ class MemeStorage:
             with open(filepath, "rb") as f:
                 await client.put_object(Bucket=self.bucket_name, Key=filename, Body=f)
 
-    async def upload_file_via_request(self, filename: str, file: bytes):
+    async def upload_file_via_request(self, filename: str, file: bytes, content_type: str | None = None):
         """Upload file via request form from FastAPI.
 
         Args:
             filename (str): filename.
             file (bytes): file in bytes.
+            content_type (str | None, optional): MIME type of the file. Defaults to None.
+        """
+        extra = {"ContentType": content_type} if content_type else {}
+        async with self.get_client() as client:
+            await client.put_object(Bucket=self.bucket_name, Key=filename, Body=file, **extra)
+
+    async def upload_stream(
+        self, filename: str, stream: AsyncIterable[bytes], content_type: str | None = None
+    ) -> None:
+        """Upload file from a stream of chunks. Files bigger than one part are sent with a multipart upload,
+        parts are uploaded concurrently, so memory use is bounded by part size and concurrency.
+        The multipart upload is aborted if anything fails.
+
+        Args:
+            filename (str): filename.
+            stream (AsyncIterable[bytes]): chunks of the file.
+            content_type (str | None, optional): MIME type of the file. Defaults to None.
         """
+        extra = {"ContentType": content_type} if content_type else {}
+        parts = self._iter_parts(stream)
+        first = await anext(parts, b"")
+        second = await anext(parts, None)
+
         async with self.get_client() as client:
-            await client.put_object(Bucket=self.bucket_name, Key=filename, Body=file)
+            if second is None:
+                await client.put_object(Bucket=self.bucket_name, Key=filename, Body=first, **extra)
+                return
+
+            upload = await client.create_multipart_upload(Bucket=self.bucket_name, Key=filename, **extra)
+            upload_id = upload["UploadId"]
+
+            semaphore = asyncio.Semaphore(self.multipart_concurrency)
+            tasks: list[asyncio.Task] = []
+            errors: list[BaseException] = []
+
+            async def upload_part(number: int, body: bytes) -> dict:
+                try:
+                    response = await client.upload_part(
+                        Bucket=self.bucket_name, Key=filename, UploadId=upload_id, PartNumber=number, Body=body
+                    )
+                    return {"PartNumber": number, "ETag": response["ETag"]}
+                except Exception as e:
+                    errors.append(e)
+                    raise
+                finally:
+                    semaphore.release()
+
+            async def bodies():
+                yield first
+                yield second
+                async for body in parts:
+                    yield body
+
+            try:
+                number = 0
+                async for body in bodies():
+                    await semaphore.acquire()
+                    if errors:
+                        raise errors[0]
+                    number += 1
+                    tasks.append(asyncio.create_task(upload_part(number, body)))
+
+                completed = await asyncio.gather(*tasks)
+                await client.complete_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=filename,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": completed},
+                )
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await client.abort_multipart_upload(Bucket=self.bucket_name, Key=filename, UploadId=upload_id)
+                logging.warning(f"Aborted multipart upload of '{filename}'")
+                raise
+
+    async def _iter_parts(self, stream: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        """Regroups chunks of any size into parts of `multipart_part_size`, the last one may be smaller."""
+        buffer = bytearray()
+        async for chunk in stream:
+            buffer += chunk
+            while len(buffer) >= self.multipart_part_size:
+                yield bytes(buffer[: self.multipart_part_size])
+                del buffer[: self.multipart_part_size]
+        if buffer:
+            yield bytes(buffer)
 
     async def get_file(self, filename: str) -> bytes:
         """Get raw file in bytes.
@@ -86,11 +291,87 @@ class MemeStorage:
 
         Returns:
             bytes: file
+
+        Raises:
+            FileNotFoundError: if there is no such file.
         """
         async with self.get_client() as client:
-            response = await client.get_object(Bucket=self.bucket_name, Key=filename)
+            try:
+                response = await client.get_object(Bucket=self.bucket_name, Key=filename)
+            except client.exceptions.NoSuchKey:
+                raise FileNotFoundError(filename)
             return await response["Body"].read()
 
+    async def stream_file(
+        self,
+        filename: str,
+        byte_range: str | None = None,
+        if_none_match: str | None = None,
+        chunk_size: int = 64 * 1024,
+    ) -> FileStream:
+        """Stream file or a range of it in chunks. Connection is held until the body is consumed or closed.
+
+        Args:
+            filename (str): name of the file in the storage.
+            byte_range (str | None, optional): value of the HTTP Range header. Defaults to None.
+            if_none_match (str | None, optional): value of the HTTP If-None-Match header. Defaults to None.
+            chunk_size (int, optional): size of the chunks. Defaults to 64 KiB.
+
+        Raises:
+            FileNotFoundError: if there is no such file.
+
+        Returns:
+            FileStream: status code, headers and body to send.
+        """
+        params = {}
+        if byte_range:
+            params["Range"] = byte_range
+        if if_none_match:
+            params["IfNoneMatch"] = if_none_match
+
+        stack = AsyncExitStack()
+        client = await stack.enter_async_context(self.get_client())
+        try:
+            response = await client.get_object(Bucket=self.bucket_name, Key=filename, **params)
+        except client.exceptions.NoSuchKey:
+            await stack.aclose()
+            raise FileNotFoundError(filename)
+        except client.exceptions.ClientError as e:
+            await stack.aclose()
+            status_code = e.response["ResponseMetadata"]["HTTPStatusCode"]
+            if status_code not in (304, 416):
+                raise
+            response_headers = e.response["ResponseMetadata"]["HTTPHeaders"]
+            headers = {k: v for k, v in response_headers.items() if k in ("etag", "content-range")}
+            return FileStream(status_code=status_code, headers=headers)
+        except BaseException:
+            await stack.aclose()
+            raise
+
+        headers = {
+            "accept-ranges": "bytes",
+            "content-length": str(response["ContentLength"]),
+            "content-type": response["ContentType"],
+            "etag": response["ETag"],
+        }
+        if "ContentRange" in response:
+            headers["content-range"] = response["ContentRange"]
+
+        async def body() -> AsyncIterator[bytes]:
+            try:
+                stream = response["Body"]
+                async with stream:
+                    async for chunk in stream.iter_chunks(chunk_size):
+                        yield chunk
+            finally:
+                await stack.aclose()
+
+        return FileStream(
+            status_code=response["ResponseMetadata"]["HTTPStatusCode"],
+            headers=headers,
+            body=body(),
+        )
+
     async def get_file_url(self, filename: str) -> str:
         """Generates url for a file. File will be accessible from a browser, if a proper policy is set.
 
@@ -102,6 +383,115 @@ class MemeStorage:
         """
         return f"{self.config['endpoint_url']}/{self.bucket_name}/{filename}"
 
+    def get_presigned_url(self, filename: str, expires_in: int = 300) -> str:
+        """Generates short-lived url for a file, works for private buckets. Signing is local, no requests are sent.
+
+        Args:
+            filename (str): name of the file in the storage.
+            expires_in (int, optional): lifetime of the url in seconds. Defaults to 300.
+
+        Returns:
+            str: url string
+        """
+        if self._signer is None:
+            import botocore.session
+
+            self._signer = botocore.session.get_session().create_client("s3", **self.config)
+        return self._signer.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket_name, "Key": filename}, ExpiresIn=expires_in
+        )
+
+    async def create_presigned_upload(
+        self, filename: str, content_type: str, size: int | None = None, expires_in: int = 3600
+    ) -> tuple[str | None, list[str]]:
+        """Prepares upload straight from a client. Files bigger than one part are uploaded with a multipart upload,
+        the client sends part i (1-based) of `multipart_part_size` bytes to the i-th url.
+
+        Args:
+            filename (str): name of the file in the storage.
+            content_type (str): MIME type of the file.
+            size (int | None, optional): size of the file in bytes, if known. Defaults to None.
+            expires_in (int, optional): lifetime of the urls in seconds. Defaults to 3600.
+
+        Returns:
+            tuple[str | None, list[str]]: id of the multipart upload or None, and urls to PUT the file or its parts to.
+        """
+        async with self.get_client() as client:
+            if size is None or size <= self.multipart_part_size:
+                url = await client.generate_presigned_url(
+                    "put_object",
+                    Params={"Bucket": self.bucket_name, "Key": filename, "ContentType": content_type},
+                    ExpiresIn=expires_in,
+                )
+                return None, [url]
+
+            upload = await client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=filename, ContentType=content_type
+            )
+            upload_id = upload["UploadId"]
+            parts = -(-size // self.multipart_part_size)
+            urls = await asyncio.gather(
+                *(
+                    client.generate_presigned_url(
+                        "upload_part",
+                        Params={"Bucket": self.bucket_name, "Key": filename, "UploadId": upload_id, "PartNumber": i},
+                        ExpiresIn=expires_in,
+                    )
+                    for i in range(1, parts + 1)
+                )
+            )
+            return upload_id, list(urls)
+
+    async def complete_multipart_upload(self, filename: str, upload_id: str, parts: list[dict]) -> None:
+        """Completes multipart upload made by a client.
+
+        Args:
+            filename (str): name of the file in the storage.
+            upload_id (str): id of the multipart upload.
+            parts (list[dict]): `PartNumber` and `ETag` of each part.
+
+        Raises:
+            ValueError: if parts are missing or do not match the uploaded ones.
+        """
+        async with self.get_client() as client:
+            try:
+                await client.complete_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=filename,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": sorted(parts, key=lambda part: part["PartNumber"])},
+                )
+            except client.exceptions.ClientError as e:
+                if e.response["ResponseMetadata"]["HTTPStatusCode"] >= 500:
+                    raise
+                raise ValueError(e.response["Error"].get("Message", "Could not complete multipart upload."))
+
+    async def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        """Aborts multipart upload made by a client, its uploaded parts are deleted.
+        Uploads that are completed or aborted already are skipped."""
+        async with self.get_client() as client:
+            try:
+                await client.abort_multipart_upload(Bucket=self.bucket_name, Key=filename, UploadId=upload_id)
+            except client.exceptions.NoSuchUpload:
+                pass
+
+    async def head_file(self, filename: str) -> dict | None:
+        """Get metadata of a file without its content.
+
+        Args:
+            filename (str): name of the file in the storage.
+
+        Returns:
+            dict | None: `ContentLength`, `ContentType`, `ETag` and others, None if there is no such file.
+        """
+        async with self.get_client() as client:
+            try:
+                return await client.head_object(Bucket=self.bucket_name, Key=filename)
+            except client.exceptions.ClientError as e:
+                if e.response["ResponseMetadata"]["HTTPStatusCode"] == 404:
+                    return None
+                raise
+
     async def delete_file(self, filename: str) -> None:
         """Deletes a file from a bucket.
 
@@ -111,6 +501,69 @@ class MemeStorage:
         async with self.get_client() as client:
             await client.delete_object(Bucket=self.bucket_name, Key=filename)
 
+    async def delete_many(
+        self,
+        filenames: Iterable[str] | AsyncIterable[str],
+        batch_size: int = 1000,
+        concurrency: int = 4,
+    ) -> DeleteResult:
+        """Deletes files with DeleteObjects requests, a few of them are sent at once.
+
+        Args:
+            filenames (Iterable[str] | AsyncIterable[str]): names of the files in the storage, e.g. from `iter_keys`.
+            batch_size (int, optional): files per request, S3 allows at most 1000. Defaults to 1000.
+            concurrency (int, optional): max number of requests at once. Defaults to 4.
+
+        Returns:
+            DeleteResult: number of deleted files and the errors reported by the storage.
+        """
+        result = DeleteResult()
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks: set[asyncio.Task] = set()
+
+        async def delete_batch(client, batch: list[str]) -> None:
+            try:
+                response = await client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+                errors = response.get("Errors", [])
+                result.deleted += len(batch) - len(errors)
+                result.errors.extend(errors)
+            finally:
+                semaphore.release()
+
+        async def submit(client, batch: list[str]) -> None:
+            await semaphore.acquire()
+            for task in [task for task in tasks if task.done()]:
+                tasks.discard(task)
+                task.result()
+            tasks.add(asyncio.create_task(delete_batch(client, batch)))
+
+        if not isinstance(filenames, AsyncIterable):
+            filenames = _aiter(filenames)
+
+        async with self.get_client() as client:
+            try:
+                batch = []
+                async for filename in filenames:
+                    batch.append(filename)
+                    if len(batch) == batch_size:
+                        await submit(client, batch)
+                        batch = []
+                if batch:
+                    await submit(client, batch)
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+        if result.errors:
+            logging.warning(f"Could not delete {len(result.errors)} files from bucket '{self.bucket_name}'")
+        return result
+
     async def add_policy(self, policy_file: str) -> None:
         """Add policy to the bucket.
 
@@ -175,14 +628,51 @@ class MemeStorage:
                 logging.info(f"Bucket '{self.bucket_name}' does not exist.")
 
     async def list_files(self) -> list[dict]:
-        """List all files in the bucket."""
-        async with self.get_client() as client:
-            return (await client.list_objects_v2(Bucket=self.bucket_name))["Contents"]
+        """List all files in the bucket. Loads the whole listing, use `iter_keys` for big buckets."""
+        return [obj async for obj in self.iter_objects()]
 
+    async def iter_objects(self, prefix: str = "", page_size: int = 1000) -> AsyncIterator[dict]:
+        """Iterates over all files in the bucket page by page, only one page is kept in memory.
 
-s3_storage = MemeStorage(
-    access_key=settings.MINIO_ROOT_USER,
-    secret_key=settings.MINIO_ROOT_PASSWORD,
-    endpoint_url=settings.ENDPOINT_URL,
-    bucket_name=settings.BUCKET_NAME,
-)
+        Args:
+            prefix (str, optional): only files starting with the prefix. Defaults to "".
+            page_size (int, optional): files per request, S3 allows at most 1000. Defaults to 1000.
+        """
+        async with self.get_client() as client:
+            paginator = client.get_paginator("list_objects_v2")
+            pages = paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, PaginationConfig={"PageSize": page_size})
+            async for page in pages:
+                for obj in page.get("Contents", []):
+                    yield obj
+
+    async def iter_keys(self, prefix: str = "", page_size: int = 1000) -> AsyncIterator[str]:
+        """Iterates over names of all files in the bucket, see `iter_objects`."""
+        async for obj in self.iter_objects(prefix, page_size):
+            yield obj["Key"]
+
+
+async def _aiter(iterable: Iterable):
+    for item in iterable:
+        yield item
+
+
+def create_storage():
+    if settings.STORAGE_BACKEND == "memory":
+        from app.s3storage.memory import InMemoryStorage
+
+        return InMemoryStorage(settings.BUCKET_NAME, settings.S3_MULTIPART_PART_SIZE_MB * 1024 * 1024)
+    settings.require("MINIO_ROOT_USER", "MINIO_ROOT_PASSWORD")
+    return MemeStorage(
+        access_key=settings.MINIO_ROOT_USER,
+        secret_key=settings.MINIO_ROOT_PASSWORD,
+        endpoint_url=settings.ENDPOINT_URL,
+        bucket_name=settings.BUCKET_NAME,
+        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+        bootstrap_marker=settings.S3_BOOTSTRAP_MARKER,
+        bootstrap_ttl_minutes=settings.S3_BOOTSTRAP_TTL_MINUTES,
+        multipart_part_size=settings.S3_MULTIPART_PART_SIZE_MB * 1024 * 1024,
+        multipart_concurrency=settings.S3_MULTIPART_CONCURRENCY,
+    )
+
+
+s3_storage: Lazy[MemeStorage] = Lazy(create_storage, "storage")
@@ -0,0 +1,148 @@
+import hashlib
+import re
+from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator, Iterable
+from uuid import uuid4
+
+from app.s3storage.meme import DeleteResult, FileStream, PoolStats, _aiter
+
+RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class InMemoryStorage:
+    def __init__(self, bucket_name: str = "memes", multipart_part_size: int = 8 * 1024 * 1024):
+        """Storage of files in a dict, for tests and benchmarks without S3. Behaves like `MemeStorage`
+        for ranges, ETags and listings. Urls it makes can't be opened, so presigned uploads can only be
+        completed if the file is put with `upload_file_via_request` first.
+
+        Args:
+            bucket_name (str, optional): name used in urls. Defaults to "memes".
+            multipart_part_size (int, optional): part size reported for presigned uploads. Defaults to 8 MiB.
+        """
+        self.bucket_name = bucket_name
+        self.multipart_part_size = multipart_part_size
+        self.stats = PoolStats(max_connections=0)
+        self.files: dict[str, dict] = {}
+        self.multipart_uploads: dict[str, str] = {}
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def upload_file_via_request(self, filename: str, file: bytes, content_type: str | None = None):
+        self.files[filename] = {
+            "Body": bytes(file),
+            "ContentType": content_type or "binary/octet-stream",
+            "ETag": f'"{hashlib.md5(file).hexdigest()}"',
+            "LastModified": datetime.now(timezone.utc),
+        }
+
+    async def upload_stream(
+        self, filename: str, stream: AsyncIterable[bytes], content_type: str | None = None
+    ) -> None:
+        await self.upload_file_via_request(filename, b"".join([chunk async for chunk in stream]), content_type)
+
+    async def get_file(self, filename: str) -> bytes:
+        """Raises `FileNotFoundError` if there is no such file."""
+        return self._get(filename)["Body"]
+
+    async def stream_file(
+        self,
+        filename: str,
+        byte_range: str | None = None,
+        if_none_match: str | None = None,
+        chunk_size: int = 64 * 1024,
+    ) -> FileStream:
+        """Same as `MemeStorage.stream_file`."""
+        file = self._get(filename)
+        body, size = file["Body"], len(file["Body"])
+        if if_none_match and file["ETag"] in {tag.strip() for tag in if_none_match.split(",")} | {"*"}:
+            return FileStream(status_code=304, headers={"etag": file["ETag"]})
+
+        headers = {"accept-ranges": "bytes", "content-type": file["ContentType"], "etag": file["ETag"]}
+        status_code = 200
+        match = RANGE.fullmatch(byte_range) if byte_range else None
+        if match and any(match.groups()):
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            else:
+                start, end = max(size - int(last), 0), size - 1
+            if start >= size or start > end:
+                return FileStream(status_code=416, headers={"content-range": f"bytes */{size}"})
+            body = body[start : end + 1]
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            status_code = 206
+        headers["content-length"] = str(len(body))
+
+        async def chunks() -> AsyncIterator[bytes]:
+            for offset in range(0, len(body), chunk_size):
+                yield body[offset : offset + chunk_size]
+
+        return FileStream(status_code=status_code, headers=headers, body=chunks())
+
+    async def get_file_url(self, filename: str) -> str:
+        return f"memory://{self.bucket_name}/{filename}"
+
+    def get_presigned_url(self, filename: str, expires_in: int = 300) -> str:
+        return f"memory://{self.bucket_name}/{filename}?expires_in={expires_in}"
+
+    async def create_presigned_upload(
+        self, filename: str, content_type: str, size: int | None = None, expires_in: int = 3600
+    ) -> tuple[str | None, list[str]]:
+        url = self.get_presigned_url(filename, expires_in)
+        if size is None or size <= self.multipart_part_size:
+            return None, [url]
+        upload_id = uuid4().hex
+        self.multipart_uploads[upload_id] = filename
+        return upload_id, [f"{url}&part_number={i}" for i in range(1, -(-size // self.multipart_part_size) + 1)]
+
+    async def complete_multipart_upload(self, filename: str, upload_id: str, parts: list[dict]) -> None:
+        if self.multipart_uploads.pop(upload_id, None) != filename or filename not in self.files:
+            raise ValueError("The specified multipart upload does not exist.")
+
+    async def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        self.multipart_uploads.pop(upload_id, None)
+
+    async def head_file(self, filename: str) -> dict | None:
+        file = self.files.get(filename)
+        if file is None:
+            return None
+        return {key: value for key, value in file.items() if key != "Body"} | {"ContentLength": len(file["Body"])}
+
+    async def delete_file(self, filename: str) -> None:
+        self.files.pop(filename, None)
+
+    async def delete_many(
+        self, filenames: Iterable[str] | AsyncIterable[str], batch_size: int = 1000, concurrency: int = 4
+    ) -> DeleteResult:
+        if not isinstance(filenames, AsyncIterable):
+            filenames = _aiter(filenames)
+        result = DeleteResult()
+        async for filename in filenames:
+            self.files.pop(filename, None)
+            result.deleted += 1
+        return result
+
+    async def list_files(self) -> list[dict]:
+        return [obj async for obj in self.iter_objects()]
+
+    async def iter_objects(self, prefix: str = "", page_size: int = 1000) -> AsyncIterator[dict]:
+        """Files in the order of their names, like S3 lists them."""
+        for key in sorted(key for key in self.files if key.startswith(prefix)):
+            file = self.files.get(key)
+            if file is not None:
+                size = len(file["Body"])
+                yield {"Key": key, "Size": size, "ETag": file["ETag"], "LastModified": file["LastModified"]}
+
+    async def iter_keys(self, prefix: str = "", page_size: int = 1000) -> AsyncIterator[str]:
+        async for obj in self.iter_objects(prefix, page_size):
+            yield obj["Key"]
+
+    def _get(self, filename: str) -> dict:
+        try:
+            return self.files[filename]
+        except KeyError:
+            raise FileNotFoundError(filename)
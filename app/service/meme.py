@@ -1,18 +1,173 @@
+from datetime import timedelta
+from typing import AsyncIterable, Callable, Literal
+
+from app.domain.entities import Meme
+from app.domain.exceptions import MemeNotFoundException
+from app.media.derivatives import derivatives
+from app.media.validation import max_upload_size, validate_upload
+from app.repository.pagination import KeysetPage
+from app.service.unit_of_work import UnitOfWork
+from app.utils.naming import unique_filename
+
+UPLOAD_EXPIRY_MARGIN = timedelta(minutes=1)
+
+
+def stored_files(meme) -> list[str]:
+    """Names of the original and the derivatives of a meme in the storage."""
+    return [meme["filename"], *derivatives.keys(meme["filename"], meme["content_type"])]
+
+
 class MemeService:
-    async def get_by_id():
-        pass
+    def __init__(self, repository, unit_of_work: Callable[[], UnitOfWork]):
+        """Use cases of memes. Reads go to the repository, writes that touch both the database
+        and the storage are done in a unit of work.
+
+        Args:
+            repository: repository to read memes from, e.g. `SQLAlchemyRepository`.
+            unit_of_work (Callable[[], UnitOfWork]): factory of units of work.
+        """
+        self.repository = repository
+        self.unit_of_work = unit_of_work
+
+    async def get_by_id(self, meme_id: int):
+        meme = await self.repository.get_meme_by_id(meme_id)
+        if meme is None:
+            raise MemeNotFoundException(meme_id)
+        return meme
+
+    async def get_all(
+        self,
+        order_by: Literal["id", "updated_at"] = "id",
+        descending: bool = False,
+        cursor: str | None = None,
+        size: int = 50,
+        with_version: bool = False,
+    ) -> KeysetPage:
+        """Page of memes, see `SQLAlchemyRepository.get_memes_page`.
+
+        Raises:
+            ValueError: if cursor is malformed or was made for another ordering.
+        """
+        return await self.repository.get_memes_page(order_by, descending, cursor, size, with_version)
+
+    async def add(self, filename: str, stream: AsyncIterable[bytes], description: str | None = None) -> dict:
+        """Uploads file and adds meme. If the same content is stored already, the meme references
+        that file and the uploaded one is deleted. Derivatives and hash of the file are made by a job.
+
+        Raises:
+            ContentTypeMismatchException: if the content does not match the extension.
+            FileTooLargeException: if the file is bigger than allowed for its type.
+        """
+        file = Meme(filename=unique_filename(filename), description=description)
+        async with self.unit_of_work() as uow:
+            file, size = await uow.upload(file, self._validated(filename, file, stream))
+            meme = await uow.memes.add_meme(file)
+            await self._process_upload(uow, file, meme, size)
+            await uow.commit()
+        return meme
+
+    async def add_stored(self, meme: Meme, size: int | None = None) -> dict | None:
+        """Adds meme whose content is stored already, found by `meme.content_hash` declared by the client,
+        so the file is not uploaded again. Returns None if no stored file has that content."""
+        async with self.unit_of_work() as uow:
+            stored = await uow.memes.add_meme_of_stored_file(meme)
+            if stored is None:
+                return None
+            payload = {"meme_id": stored["id"], "filename": stored["filename"], "content_type": stored["content_type"]}
+            await uow.jobs.add_job("process_file", {**payload, "size": size, "derivatives": False})
+            await uow.commit()
+        return stored
+
+    async def update(self, meme_id: int, description: str):
+        async with self.unit_of_work() as uow:
+            meme = await uow.memes.update_meme_by_id(meme_id, description=description)
+            if meme is None:
+                raise MemeNotFoundException(meme_id)
+            await uow.commit()
+        return meme
+
+    async def update_many(self, descriptions: dict[int, str | None]) -> list[dict]:
+        """Updates descriptions of many memes in one transaction, missing ids are skipped."""
+        async with self.unit_of_work() as uow:
+            memes = await uow.memes.update_memes_descriptions(descriptions)
+            await uow.commit()
+        return memes
+
+    async def replace(
+        self, meme_id: int, filename: str, stream: AsyncIterable[bytes], description: str | None = None
+    ) -> dict:
+        """Uploads new file of a meme. The previous file is deleted after the commit if no other meme references it.
+        Raises the same as `add`."""
+        # checked first, so the file is not uploaded in vain
+        await self.get_by_id(meme_id)
+
+        file = Meme(filename=unique_filename(filename))
+        kwargs = {"description": description} if description else {}
+        async with self.unit_of_work() as uow:
+            file, size = await uow.upload(file, self._validated(filename, file, stream))
+            meme = await uow.memes.update_meme_by_id(meme_id, file=file, **kwargs)
+            if meme is None:
+                raise MemeNotFoundException(meme_id)
+            await self._process_upload(uow, file, meme, size)
+            if meme["replaced"] and meme["replaced"]["released"]:
+                await uow.delete_after_commit(stored_files(meme["replaced"]))
+            await uow.commit()
+        return meme
+
+    async def delete(self, meme_id: int):
+        async with self.unit_of_work() as uow:
+            meme = await uow.memes.delete_meme_by_id(meme_id)
+            if meme is None:
+                raise MemeNotFoundException(meme_id)
+            if meme["released"]:
+                await uow.delete_after_commit(stored_files(meme))
+            await uow.commit()
+        return meme
 
-    async def get_all():
-        pass
+    async def delete_many(self, meme_ids: list[int]) -> list[dict]:
+        """Deletes memes in one transaction, missing ids are skipped."""
+        async with self.unit_of_work() as uow:
+            memes = await uow.memes.delete_memes_by_ids(meme_ids)
+            await uow.delete_after_commit(
+                [filename for meme in memes if meme["released"] for filename in stored_files(meme)]
+            )
+            await uow.commit()
+        return memes
 
-    async def add():
-        pass
+    async def register_upload(
+        self, meme: Meme, size: int | None, multipart_upload_id: str | None, expires_in: timedelta
+    ) -> None:
+        """Registers upload sent by a client straight to the storage. It is cleaned up by a job
+        queued in the same transaction if it is not completed before it expires."""
+        async with self.unit_of_work() as uow:
+            await uow.memes.add_pending_upload(meme, size, multipart_upload_id, expires_in)
+            # run a bit later, so the upload is surely expired by then
+            await uow.jobs.add_job("expire_uploads", {}, delay=expires_in + UPLOAD_EXPIRY_MARGIN)
+            await uow.commit()
 
-    async def update():
-        pass
+    async def complete_upload(self, upload_id: str, size: int) -> dict | None:
+        """Turns upload of a client into a meme and queues processing of its file in one transaction,
+        which also shares the file if its content is stored already. Returns None if there is no such upload
+        or it is expired."""
+        async with self.unit_of_work() as uow:
+            meme = await uow.memes.complete_pending_upload(upload_id)
+            if meme is None:
+                return None
+            payload = {"meme_id": meme["id"], "filename": meme["filename"], "content_type": meme["content_type"]}
+            # the file is not hashed on the way to the storage, the job hashes it to share stored content
+            await uow.jobs.add_job("process_file", {**payload, "size": size, "derivatives": True, "deduplicate": True})
+            await uow.commit()
+        return meme
 
-    async def delete():
-        pass
+    def _validated(self, filename: str, file: Meme, stream: AsyncIterable[bytes]) -> AsyncIterable[bytes]:
+        content_type = file.content_type.value
+        return validate_upload(filename, stream, content_type, max_upload_size(content_type))
 
-    async def replace():
-        pass
+    async def _process_upload(self, uow: UnitOfWork, file: Meme, meme: dict, size: int) -> None:
+        """Queues derivatives and hashing of the uploaded file. If the same content was stored already,
+        the uploaded file is deleted instead of getting derivatives."""
+        new_file = meme["filename"] == file.filename
+        if not new_file:
+            await uow.delete_after_commit([file.filename])
+        payload = {"meme_id": meme["id"], "filename": meme["filename"], "content_type": meme["content_type"]}
+        await uow.jobs.add_job("process_file", {**payload, "size": size, "derivatives": new_file})
@@ -0,0 +1,141 @@
+import hashlib
+import logging
+from dataclasses import replace
+from typing import AsyncIterable
+
+from app.cache.meme import CachedRepository, MemeCache
+from app.config import settings
+from app.domain.entities import Meme
+from app.repository.backends import memory_jobs, memory_repository
+from app.repository.base import JobQueue, MemeRepository
+from app.repository.jobs import JobRepository
+from app.repository.orm import async_session
+from app.repository.repository import SQLAlchemyRepository
+from app.utils.stream import iter_hashed
+
+
+class UnitOfWork:
+    def __init__(self, session_factory, storage, cache: MemeCache | None = None):
+        """Writes of the database and the storage that succeed or fail together. Database writes
+        and background jobs are committed in one transaction. Files are uploaded before the commit and
+        deleted if it does not happen, files of deleted memes are deleted by a job after it. If a file
+        can't be deleted, it is left to `reconcile_storage`.
+
+        Example:
+            async with UnitOfWork(async_session, s3_storage) as uow:
+                meme, _ = await uow.upload(meme, stream)
+                await uow.memes.add_meme(meme)
+                await uow.commit()
+
+        Args:
+            session_factory: factory of database sessions, e.g. `async_session`.
+            storage: storage of the files, e.g. `MemeStorage`.
+            cache (MemeCache | None, optional): cache of memes, invalidated after the commit. Defaults to None.
+        """
+        self.session_factory = session_factory
+        self.storage = storage
+        self.cache = cache
+
+    async def __aenter__(self) -> "UnitOfWork":
+        self.session = self.session_factory()
+        # reads in a transaction must see its writes, so replicas are not used
+        self._begin(SQLAlchemyRepository(self.session, autocommit=False), JobRepository(self.session, autocommit=False))
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        try:
+            if not self._committed:
+                await self._rollback()
+                await self._delete(self._uploaded, "uploaded in a rolled back unit of work")
+        finally:
+            await self._close()
+
+    def _begin(self, repository: MemeRepository, jobs: JobQueue) -> None:
+        self.memes = repository if self.cache is None else CachedRepository(repository, self.cache, deferred=True)
+        self.jobs = jobs
+        self._uploaded: list[str] = []
+        self._committed = False
+
+    async def upload(self, meme: Meme, stream: AsyncIterable[bytes]) -> tuple[Meme, int]:
+        """Uploads file of the meme. The file is deleted if the unit of work is not committed.
+        Returns the meme with `content_hash` of the file and size of the file."""
+        hasher = hashlib.sha256()
+        size = 0
+
+        async def counted():
+            nonlocal size
+            async for chunk in iter_hashed(stream, hasher):
+                size += len(chunk)
+                yield chunk
+
+        self._uploaded.append(meme.filename)
+        await self.storage.upload_stream(meme.filename, counted(), meme.content_type.value)
+        return replace(meme, content_hash=hasher.hexdigest()), size
+
+    async def delete_after_commit(self, filenames: list[str]) -> None:
+        """Queues a job that deletes the files once the unit of work is committed."""
+        if filenames:
+            await self.jobs.add_job("delete_files", {"filenames": filenames})
+
+    async def commit(self) -> None:
+        await self._commit()
+        self._committed = True
+        if isinstance(self.memes, CachedRepository):
+            await self.memes.flush_invalidations()
+
+    async def _delete(self, filenames: list[str], reason: str) -> None:
+        if not filenames:
+            return
+        try:
+            result = await self.storage.delete_many(filenames)
+            errors = [error["Key"] for error in result.errors]
+        except Exception:
+            logging.exception(f"Could not delete files {reason}")
+            errors = filenames
+        if errors:
+            logging.warning(f"Files {reason} are left to the reconciler: {errors}")
+
+    async def _commit(self) -> None:
+        await self.session.commit()
+
+    async def _rollback(self) -> None:
+        await self.session.rollback()
+
+    async def _close(self) -> None:
+        await self.session.close()
+
+
+class InMemoryUnitOfWork(UnitOfWork):
+    def __init__(self, repository: MemeRepository, jobs: JobQueue, storage, cache: MemeCache | None = None):
+        """Unit of work over `InMemoryRepository`. Its writes take effect at once and are not rolled back,
+        uploaded files are still deleted if it is not committed.
+
+        Args:
+            repository (MemeRepository): repository of memes, e.g. `InMemoryRepository`.
+            jobs (JobQueue): queue of background jobs, e.g. `InMemoryJobRepository`.
+            storage: storage of the files, e.g. `InMemoryStorage`.
+            cache (MemeCache | None, optional): cache of memes, invalidated after the commit. Defaults to None.
+        """
+        super().__init__(None, storage, cache)
+        self.repository = repository
+        self.job_queue = jobs
+
+    async def __aenter__(self) -> "InMemoryUnitOfWork":
+        self._begin(self.repository, self.job_queue)
+        return self
+
+    async def _commit(self) -> None:
+        pass
+
+    async def _rollback(self) -> None:
+        pass
+
+    async def _close(self) -> None:
+        pass
+
+
+def create_unit_of_work(storage, cache: MemeCache | None = None) -> UnitOfWork:
+    """Unit of work of the configured `REPOSITORY_BACKEND`."""
+    if settings.REPOSITORY_BACKEND == "memory":
+        return InMemoryUnitOfWork(memory_repository, memory_jobs, storage, cache)
+    return UnitOfWork(async_session, storage, cache)
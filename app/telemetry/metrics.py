@@ -0,0 +1,59 @@
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+OPERATION_DURATION = Histogram(
+    "memes_operation_duration_seconds",
+    "Duration of storage, database and handler operations.",
+    ["operation"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "memes_http_request_duration_seconds",
+    "Duration of HTTP requests from the first byte received to the last byte sent.",
+    ["method", "route", "status"],
+)
+UPLOAD_REJECTIONS = Counter(
+    "memes_upload_rejections_total",
+    "Uploads rejected with 429 by the rate limiter or the queue of transfers.",
+    ["reason"],
+)
+UPLOAD_QUEUE_WAIT = Histogram(
+    "memes_upload_queue_wait_seconds",
+    "Time uploads waited for a transfer slot, including the rejected ones.",
+)
+
+
+class PoolCollector:
+    def __init__(self, engine, storage):
+        """Reports usage of the database and S3 connection pools when metrics are scraped.
+
+        Args:
+            engine: SQLAlchemy engine, None if memes are not kept in the database.
+            storage: storage with `stats`, e.g. `MemeStorage`.
+        """
+        self.engine = engine
+        self.storage = storage
+
+    def collect(self):
+        if self.engine is not None:
+            yield from self.collect_db(self.engine.pool)
+
+        stats = self.storage.stats
+        s3 = GaugeMetricFamily("memes_s3_pool_connections", "Connections of the S3 pool.", labels=["state"])
+        s3.add_metric(["in_use"], stats.in_use)
+        s3.add_metric(["peak_in_use"], stats.peak_in_use)
+        s3.add_metric(["max"], stats.max_connections)
+        yield s3
+        yield GaugeMetricFamily("memes_s3_open_clients", "Long-lived S3 clients.", value=stats.open_clients)
+
+    def collect_db(self, pool):
+        db = GaugeMetricFamily("memes_db_pool_connections", "Connections of the database pool.", labels=["state"])
+        db.add_metric(["checked_out"], pool.checkedout())
+        db.add_metric(["checked_in"], pool.checkedin())
+        db.add_metric(["overflow"], max(pool.overflow(), 0))
+        yield db
+        yield GaugeMetricFamily("memes_db_pool_size", "Size of the database pool.", value=pool.size())
+
+
+async def metrics_endpoint() -> Response:
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
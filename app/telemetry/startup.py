@@ -0,0 +1,57 @@
+import logging
+import re
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+\d+ \| +(\S+)")
+
+
+@dataclass
+class StartupReport:
+    """Durations of the startup phases of a worker process, e.g. creating the engine or starting
+    the storage. Logged once the app is ready, so a slow cold start can be traced to a phase.
+    Phases measured during another one, e.g. reading settings while creating the engine, are its parts."""
+
+    # name, seconds and depth of each phase, a phase is listed before its parts
+    phases: list[tuple[str, float, int]] = field(default_factory=list)
+    _depth: int = 0
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        index, depth = len(self.phases), self._depth
+        self.phases.append((name, 0, depth))
+        self._depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth = depth
+            self.phases[index] = (name, time.perf_counter() - started, depth)
+
+    @property
+    def total(self) -> float:
+        return sum(seconds for _, seconds, depth in self.phases if depth == 0)
+
+    def summary(self) -> str:
+        lines = [f"{'  ' * depth + name:<28} {seconds * 1000:9.1f} ms" for name, seconds, depth in self.phases]
+        return "\n".join([*lines, f"{'total':<28} {self.total * 1000:9.1f} ms"])
+
+    def log(self) -> None:
+        logging.info(f"Started in {self.total * 1000:.1f} ms:\n{self.summary()}")
+
+
+def parse_import_time(output: str, depth: int = 1) -> list[tuple[str, float]]:
+    """Seconds spent importing the modules of each package, from the output of `python -X importtime`,
+    slowest first. Modules are grouped by their first `depth` dotted parts, e.g. "sqlalchemy" for depth 1.
+    Own times of the modules are summed, so packages imported by others are not counted twice."""
+    packages: dict[str, float] = {}
+    for match in IMPORT_TIME.finditer(output):
+        own, module = match.groups()
+        package = ".".join(module.split(".")[:depth])
+        packages[package] = packages.get(package, 0) + int(own) / 1_000_000
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+startup_report = StartupReport()
@@ -0,0 +1,114 @@
+import functools
+import inspect
+import time
+from typing import Literal
+
+from fastapi.routing import APIRoute
+from opentelemetry import trace
+
+from app.telemetry.metrics import HTTP_REQUEST_DURATION, OPERATION_DURATION
+
+tracer = trace.get_tracer("memes")
+
+
+def setup_tracing(exporter: Literal["none", "console", "otlp"], endpoint: str | None = None) -> None:
+    """Sends spans to stdout or to an OpenTelemetry collector. Spans are not recorded if `exporter` is "none".
+
+    Args:
+        exporter (Literal["none", "console", "otlp"]): where to send spans.
+        endpoint (str | None, optional): url of the collector, OTLP over HTTP. Defaults to the
+            `OTEL_EXPORTER_OTLP_TRACES_ENDPOINT` environment variable or the local collector.
+    """
+    if exporter == "none":
+        return
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if exporter == "otlp":
+        # optional dependency, opentelemetry-exporter-otlp-proto-http
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        span_exporter = OTLPSpanExporter(endpoint=endpoint)
+    else:
+        span_exporter = ConsoleSpanExporter()
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "memes"}))
+    provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(provider)
+
+
+def traced(name: str):
+    """Runs coroutine function in a span and records its duration in `OPERATION_DURATION`."""
+
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with tracer.start_as_current_span(name):
+                    return await func(*args, **kwargs)
+            finally:
+                OPERATION_DURATION.labels(name).observe(time.perf_counter() - started)
+
+        wrapper.traced_as = name
+        return wrapper
+
+    return decorate
+
+
+def instrumented(prefix: str):
+    """Class decorator, public coroutine methods are `traced` as `{prefix}.{method}`."""
+
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(method):
+                setattr(cls, name, traced(f"{prefix}.{name}")(method))
+        return cls
+
+    return decorate
+
+
+class TracedRoute(APIRoute):
+    """Route whose endpoint runs in its own span. The rest of the request span is spent
+    on receiving the body, e.g. spooling uploaded files, and resolving dependencies."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        # routes are created again with the same endpoint when the router is included
+        if inspect.iscoroutinefunction(endpoint) and not hasattr(endpoint, "traced_as"):
+            endpoint = traced(f"handler.{endpoint.__name__}")(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+class TelemetryMiddleware:
+    def __init__(self, app):
+        """Wraps every HTTP request in a server span and records its duration in `HTTP_REQUEST_DURATION`
+        by route template, so requests of different memes share a series."""
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        started = time.perf_counter()
+        with tracer.start_as_current_span(method, kind=trace.SpanKind.SERVER) as span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # set by the router once the request is matched
+                route = getattr(scope.get("route"), "path", "unmatched")
+                span.update_name(f"{method} {route}")
+                span.set_attribute("http.request.method", method)
+                span.set_attribute("http.route", route)
+                span.set_attribute("http.response.status_code", status_code)
+                HTTP_REQUEST_DURATION.labels(method, route, str(status_code)).observe(time.perf_counter() - started)
@@ -1,4 +1,30 @@
 import pytest
+import pytest_asyncio
 
-from app.repository.orm import async_session
+from app.config import settings
+from app.repository.orm import async_session, engine, replica_engines
 from app.repository.repository import SQLAlchemyRepository
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line("markers", "requires_postgres: needs the database of POSTGRES_* settings, skipped without")
+
+
+def pytest_runtest_setup(item: pytest.Item) -> None:
+    """Skips tests marked with `requires_postgres` if Postgres is not configured, so the rest run anywhere."""
+    if item.get_closest_marker("requires_postgres") is None:
+        return
+    try:
+        settings.require("POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB")
+    except ValueError as e:
+        pytest.skip(str(e))
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def dispose_engine():
+    """Every test runs in its own event loop, pooled connections can't outlive it."""
+    yield
+    if not engine.made:
+        return
+    for pooled_engine in [engine.get(), *replica_engines.get()]:
+        await pooled_engine.dispose()
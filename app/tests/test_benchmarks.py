@@ -0,0 +1,21 @@
+from benchmarks.api import compare, percentile
+
+
+def results(throughput, p99_ms, allocated_bytes=1000):
+    return {"scenarios": {"get": {"throughput": throughput, "p99_ms": p99_ms, "allocated_bytes": allocated_bytes}}}
+
+
+def test_percentile():
+    latencies = [float(i) for i in range(1, 101)]
+    assert percentile(latencies, 50) == 50.5
+    assert percentile(latencies, 99) == 99.01
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_compare_reports_regressions_only():
+    baseline = results(throughput=100, p99_ms=10)
+    assert compare(results(throughput=95, p99_ms=10.5), baseline) == [], "Changes within tolerance are noise."
+    assert compare(results(throughput=200, p99_ms=5), baseline) == []
+
+    regressions = compare(results(throughput=80, p99_ms=20, allocated_bytes=2000), baseline)
+    assert len(regressions) == 3
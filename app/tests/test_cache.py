@@ -0,0 +1,170 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.cache.meme import CachedRepository, InMemoryCache, MemeCache, RedisCache
+
+
+class FakeRepository:
+    def __init__(self):
+        self.memes = {1: {"id": 1, "filename": "image.jpg", "updated_at": datetime(2024, 6, 24, 7, 27)}}
+        self.reads = 0
+        self.replica_reads = 0
+
+    async def get_meme_by_id(self, meme_id: int, primary: bool = False):
+        self.reads += 1
+        self.replica_reads += not primary
+        await asyncio.sleep(0.01)
+        return self.memes.get(meme_id)
+
+    async def update_meme_by_id(self, meme_id: int, **kwargs):
+        self.memes[meme_id] = {**self.memes[meme_id], **kwargs}
+        return self.memes[meme_id]
+
+    async def delete_meme_by_id(self, meme_id: int):
+        self.memes.pop(meme_id, None)
+
+    async def get_memes_by_ids(self, meme_ids: list[int]):
+        self.reads += 1
+        await asyncio.sleep(0.01)
+        return [self.memes[meme_id] for meme_id in meme_ids if meme_id in self.memes]
+
+    async def delete_memes_by_ids(self, meme_ids: list[int]):
+        return [self.memes.pop(meme_id) for meme_id in meme_ids if meme_id in self.memes]
+
+    async def set_derivatives(self, derivatives: dict[str, list[str]]):
+        memes = [meme for meme in self.memes.values() if meme["filename"] in derivatives]
+        for meme in memes:
+            meme["derivatives"] = derivatives[meme["filename"]]
+        return [meme["id"] for meme in memes]
+
+
+@pytest.mark.asyncio
+async def test_in_memory_cache_evicts_least_recently_used():
+    cache = InMemoryCache(max_size=2)
+    await cache.set("1", {"id": 1})
+    await cache.set("2", {"id": 2})
+    await cache.get("1")
+    await cache.set("3", {"id": 3})
+
+    assert await cache.get("2") is None, "Least recently used entry should be evicted."
+    assert await cache.get("1") == {"id": 1}
+    assert await cache.get("3") == {"id": 3}
+
+
+@pytest.mark.asyncio
+async def test_in_memory_cache_expires_entries():
+    cache = InMemoryCache(ttl=0)
+    await cache.set("1", {"id": 1})
+    assert await cache.get("1") is None, "Expired entry should not be returned."
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_keeps_datetimes():
+    cache = RedisCache(FakeAsyncRedis())
+    meme = {"id": 1, "updated_at": datetime(2024, 6, 24, 7, 27)}
+    await cache.set("1", meme)
+    assert await cache.get("1") == meme
+
+
+@pytest.mark.asyncio
+async def test_read_through_counts_hits_and_misses():
+    repo = FakeRepository()
+    cache = MemeCache(InMemoryCache())
+    cached = CachedRepository(repo, cache)
+
+    assert (await cached.get_meme_by_id(1))["filename"] == "image.jpg"
+    assert (await cached.get_meme_by_id(1))["filename"] == "image.jpg"
+    assert repo.reads == 1, "Second read should be served from the cache."
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+    assert repo.replica_reads == 0, "Replicas could put back a row from before an invalidating write."
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_load_once():
+    repo = FakeRepository()
+    cache = MemeCache(InMemoryCache())
+    cached = CachedRepository(repo, cache)
+
+    results = await asyncio.gather(*(cached.get_meme_by_id(1) for _ in range(50)))
+    assert all(result["id"] == 1 for result in results)
+    assert repo.reads == 1, "Concurrent misses should be coalesced into one database read."
+    assert cache.stats.coalesced == 49
+
+
+@pytest.mark.asyncio
+async def test_waiters_load_again_when_the_load_is_cancelled():
+    repo = FakeRepository()
+    cached = CachedRepository(repo, MemeCache(InMemoryCache()))
+
+    first = asyncio.create_task(cached.get_meme_by_id(1))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cached.get_meme_by_id(1))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert (await waiter)["id"] == 1, "Waiters should not be cancelled with the request that loads the meme."
+    assert first.cancelled()
+    assert repo.reads == 2
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate_cache():
+    repo = FakeRepository()
+    cached = CachedRepository(repo, MemeCache(InMemoryCache()))
+
+    await cached.get_meme_by_id(1)
+    await cached.update_meme_by_id(1, description="new")
+    assert (await cached.get_meme_by_id(1))["description"] == "new", "Update should invalidate the cache."
+    await cached.set_derivatives({"image.jpg": ["thumbnails/320/image.jpg.webp"]})
+    assert (await cached.get_meme_by_id(1))["derivatives"], "Recorded derivatives should invalidate the cache."
+
+    await cached.delete_meme_by_id(1)
+    assert await cached.get_meme_by_id(1) is None, "Delete should invalidate the cache."
+
+
+@pytest.mark.asyncio
+async def test_write_during_load_is_not_overwritten():
+    repo = FakeRepository()
+    cache = MemeCache(InMemoryCache())
+    cached = CachedRepository(repo, cache)
+
+    load = asyncio.create_task(cached.get_meme_by_id(1))
+    await asyncio.sleep(0)
+    await cached.update_meme_by_id(1, description="new")
+    await load
+
+    assert await cache.backend.get("1") is None, "Stale load should not be cached after invalidation."
+
+
+@pytest.mark.asyncio
+async def test_batch_reads_and_deletes_go_through_cache():
+    repo = FakeRepository()
+    cache = MemeCache(InMemoryCache())
+    cached = CachedRepository(repo, cache)
+
+    await cached.get_meme_by_id(1)
+    assert [meme["id"] for meme in await cached.get_memes_by_ids([1, 2])] == [1]
+    assert repo.reads == 2, "Only missing memes should be read from the database."
+    assert cache.stats.hits == 1
+
+    await cached.delete_memes_by_ids([1, 2])
+    assert await cached.get_memes_by_ids([1]) == [], "Batch delete should invalidate the cache."
+
+
+@pytest.mark.asyncio
+async def test_batch_read_keeps_order_and_skips_stale_loads():
+    repo = FakeRepository()
+    repo.memes[2] = {"id": 2, "filename": "video.mp4", "updated_at": datetime(2024, 6, 24, 7, 28)}
+    cache = MemeCache(InMemoryCache())
+    cached = CachedRepository(repo, cache)
+
+    await cached.get_meme_by_id(2)
+    load = asyncio.create_task(cached.get_memes_by_ids([1, 3, 2]))
+    await asyncio.sleep(0)
+    await cached.update_meme_by_id(1, description="new")
+
+    assert [meme["id"] for meme in await load] == [1, 2], "Memes should be returned in the requested order."
+    assert await cache.backend.get("1") is None, "Stale load should not be cached after invalidation."
@@ -0,0 +1,138 @@
+import hashlib
+from contextlib import asynccontextmanager
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.domain.entities import Meme
+from app.jobs.handlers import make_handlers
+from app.media.derivatives import DerivativesPipeline, derivative_keys, render_thumbnails
+from app.repository.memory import InMemoryRepository
+from app.s3storage.memory import InMemoryStorage
+from app.utils.backfill import backfill_derivatives
+from app.web.schemas import MemesResponse
+
+
+def make_image(width: int, height: int, format: str = "PNG") -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, format=format)
+    return buffer.getvalue()
+
+
+class FakeStorage:
+    def __init__(self):
+        self.files = {}
+
+    async def upload_file_via_request(self, filename, file, content_type=None):
+        self.files[filename] = (file, content_type)
+
+
+def test_thumbnails_keep_aspect_ratio():
+    thumbnails = render_thumbnails(make_image(1000, 500), [320, 640])
+
+    for width, data in thumbnails.items():
+        with Image.open(BytesIO(data)) as image:
+            assert image.format == "WEBP"
+            assert image.size == (width, width // 2)
+
+
+def test_thumbnails_are_not_upscaled():
+    thumbnails = render_thumbnails(make_image(100, 80, "GIF"), [320])
+    with Image.open(BytesIO(thumbnails[320])) as image:
+        assert image.size == (100, 80), "Small image should not be upscaled."
+
+
+def test_derivative_keys():
+    assert derivative_keys("a.jpg", "image/jpeg", [320]) == ["thumbnails/320/a.jpg.webp"]
+    assert derivative_keys("a.mp4", "video/mp4", [320]) == ["posters/a.mp4.webp"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_uploads_thumbnails():
+    storage = FakeStorage()
+    pipeline = DerivativesPipeline(storage, [320], max_workers=1)
+    try:
+        keys = await pipeline.generate("a.png", "image/png", make_image(640, 640))
+    finally:
+        pipeline.close()
+
+    assert keys == ["thumbnails/320/a.png.webp"]
+    assert storage.files["thumbnails/320/a.png.webp"][1] == "image/webp"
+
+
+@pytest.mark.asyncio
+async def test_pipeline_does_not_raise_on_broken_image():
+    pipeline = DerivativesPipeline(FakeStorage(), [320], max_workers=1)
+    try:
+        assert await pipeline.generate("a.png", "image/png", b"not an image") == []
+    finally:
+        pipeline.close()
+
+
+@pytest.mark.asyncio
+async def test_only_made_derivatives_are_linked():
+    repository, storage = InMemoryRepository(), InMemoryStorage()
+    pipeline = DerivativesPipeline(storage, [320], max_workers=1)
+
+    @asynccontextmanager
+    async def open_repository():
+        yield repository
+
+    handlers = make_handlers(storage, pipeline, open_repository)
+    await storage.upload_file_via_request("a.png", make_image(640, 640), "image/png")
+    await storage.upload_file_via_request("broken.png", b"\x89PNG\r\n\x1a\n", "image/png")
+    first = await repository.add_meme(Meme("a.png", content_hash="same"))
+    broken = await repository.add_meme(Meme("broken.png"))
+    try:
+        assert MemesResponse(**first).thumbnails == {}, "Thumbnails should not be linked before they are made."
+        await handlers["process_file"](first["id"], "a.png", "image/png", None, derivatives=True)
+        await handlers["process_file"](broken["id"], "broken.png", "image/png", None, derivatives=True)
+        # the file is shared, so its derivatives were made for the first meme
+        second = await repository.add_meme(Meme("b.png", content_hash="same"))
+        await handlers["process_file"](second["id"], "a.png", "image/png", None, derivatives=False)
+    finally:
+        pipeline.close()
+
+    for meme_id in (first["id"], second["id"]):
+        thumbnails = MemesResponse(**await repository.get_meme_by_id(meme_id)).thumbnails
+        assert list(thumbnails) == [320] and thumbnails[320].endswith("thumbnails/320/a.png.webp")
+    assert MemesResponse(**await repository.get_meme_by_id(broken["id"])).thumbnails == {}
+
+    # derivatives made before they were recorded are found in the storage
+    repository.memes[first["id"]]["derivatives"] = []
+    assert await backfill_derivatives(pipeline, open_repository) == 1
+    assert (await repository.get_meme_by_id(first["id"]))["derivatives"] == ["thumbnails/320/a.png.webp"]
+
+
+@pytest.mark.asyncio
+async def test_files_uploaded_by_clients_are_shared():
+    repository, storage = InMemoryRepository(), InMemoryStorage()
+    pipeline = DerivativesPipeline(storage, [320], max_workers=1)
+
+    @asynccontextmanager
+    async def open_repository():
+        yield repository
+
+    handlers = make_handlers(storage, pipeline, open_repository)
+    data = make_image(100, 100)
+    for filename in ("a.png", "b.png", "c.png"):
+        await storage.upload_file_via_request(filename, data if filename != "c.png" else make_image(50, 50))
+    stored = await repository.add_meme(Meme("a.png", content_hash=hashlib.sha256(data).hexdigest()))
+    duplicate = await repository.add_meme(Meme("b.png"))
+    unique = await repository.add_meme(Meme("c.png"))
+    try:
+        await handlers["process_file"](stored["id"], "a.png", "image/png", None, derivatives=True)
+        for meme in (duplicate, unique):
+            await handlers["process_file"](
+                meme["id"], meme["filename"], "image/png", None, derivatives=True, deduplicate=True
+            )
+    finally:
+        pipeline.close()
+
+    duplicate = await repository.get_meme_by_id(duplicate["id"])
+    assert duplicate["filename"] == "a.png" and duplicate["content_hash"] == stored["content_hash"]
+    assert await storage.head_file("b.png") is None, "Uploaded copy of a stored file should be deleted."
+    assert duplicate["derivatives"] == ["thumbnails/320/a.png.webp"]
+    unique = await repository.get_meme_by_id(unique["id"])
+    assert unique["filename"] == "c.png" and unique["content_hash"] is not None
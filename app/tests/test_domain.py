@@ -78,3 +78,11 @@ def test_exception_file_named_as_format():
             "Can't save file named as extension. File should be named as followed: 'name.extension'"
             f"Should not support formats other than {list(MIMETypes.supported_types())}"
         )
+
+
+def test_meme_is_frozen_and_has_no_dict():
+    meme = Meme("image.PNG", description="My image")
+    assert meme.content_type is MIMETypes.png
+    assert not hasattr(meme, "__dict__"), "Memes should be slotted."
+    with pytest.raises(AttributeError):
+        meme.description = "Other"
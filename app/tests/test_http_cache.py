@@ -0,0 +1,70 @@
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from app.domain.entities import Meme
+from app.repository.orm import async_session
+from app.repository.repository import SQLAlchemyRepository
+from app.web import caching
+from app.web.caching import etag, etag_matches
+
+
+def test_etag_depends_on_every_part():
+    updated_at = datetime(2024, 6, 24, 7, 27)
+    tag = etag("meme", 1, updated_at)
+    assert tag.startswith('"') and tag.endswith('"')
+    assert tag == etag("meme", 1, updated_at)
+    assert tag != etag("meme", 1, datetime(2024, 6, 24, 7, 28))
+    assert tag != etag("meme", 2, updated_at)
+
+
+def test_etag_changes_before_presigned_urls_expire(monkeypatch: pytest.MonkeyPatch):
+    now = 900.0
+    monkeypatch.setattr(caching.time, "time", lambda: now)
+    monkeypatch.setattr(caching.settings, "S3_PRESIGN_GET_URLS", True)
+    monkeypatch.setattr(caching.settings, "S3_PRESIGN_GET_EXPIRES_SECONDS", 300)
+    tag = etag("memes", 1)
+    now += 100
+    assert etag("memes", 1) == tag
+    now += 100
+    assert etag("memes", 1) != tag, "Urls of a revalidated response should not be about to expire."
+
+
+def test_if_none_match_is_compared_weakly():
+    tag = etag("meme", 1)
+    assert etag_matches(tag, tag)
+    assert etag_matches(f'"other", W/{tag}', tag)
+    assert etag_matches("*", tag)
+    assert not etag_matches('"other"', tag)
+    assert not etag_matches(None, tag)
+
+
+@pytest.mark.asyncio
+@pytest.mark.requires_postgres
+async def test_memes_version_changes_on_every_write():
+    async with async_session() as session:
+        meme_repo = SQLAlchemyRepository(session)
+        before = await meme_repo.get_memes_version()
+
+        meme = await meme_repo.add_meme(Meme(f"{uuid4()}.jpg", content_hash=uuid4().hex))
+        added = await meme_repo.get_memes_version()
+        assert added != before
+
+        await meme_repo.update_meme_by_id(meme["id"], description="новое описание")
+        updated = await meme_repo.get_memes_version()
+        assert updated != added
+
+        page = await meme_repo.get_memes_page(limit=1, with_version=True)
+        assert page.version == updated
+
+        await meme_repo.set_image_hashes({meme["id"]: 1})
+        assert await meme_repo.get_memes_version() == updated, "Columns that are not returned should not count."
+
+        await meme_repo.set_derivatives({meme["filename"]: [f"posters/{meme['filename']}.webp"]})
+        derived = await meme_repo.get_memes_version()
+        assert derived != updated, "Links of the meme have changed."
+
+        await meme_repo.delete_meme_by_id(meme["id"])
+        # the table is as it was before the meme was added
+        assert await meme_repo.get_memes_version() not in (added, updated, derived)
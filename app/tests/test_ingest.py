@@ -0,0 +1,124 @@
+import json
+from contextlib import asynccontextmanager
+from itertools import count
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.s3storage.meme import DeleteResult
+from app.utils.ingest import ingest_directory
+
+
+class FakeStorage:
+    def __init__(self, fail_on: str | None = None):
+        self.fail_on = fail_on
+        self.keys = []
+
+    async def upload_stream(self, filename: str, stream, content_type: str | None = None):
+        async for _ in stream:
+            pass
+        if filename.endswith(self.fail_on or "\0"):
+            raise ConnectionError("storage is down")
+        self.keys.append(filename)
+
+    async def delete_many(self, filenames: list[str]) -> DeleteResult:
+        for filename in filenames:
+            self.keys.remove(filename)
+        return DeleteResult(deleted=len(filenames))
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    ids = count(1)
+
+    def __init__(self, inserts: list, files: dict):
+        self.inserts = inserts
+        self.files = files
+
+    async def execute(self, query):
+        params = query.compile(dialect=postgresql.dialect()).params
+        filenames = [value for key, value in params.items() if key.startswith("filename")]
+        if query.table.name == "meme_files":
+            hashes = [value for key, value in params.items() if key.startswith("content_hash")]
+            return FakeResult([(h, self.files.setdefault(h, filename)) for h, filename in zip(hashes, filenames)])
+        rows = [{"id": next(self.ids), "filename": filename} for filename in filenames]
+        self.inserts.append(len(rows))
+        return FakeResult(rows)
+
+    async def commit(self):
+        pass
+
+
+def make_session_factory(inserts: list):
+    files = {}
+
+    @asynccontextmanager
+    async def session_factory():
+        yield FakeSession(inserts, files)
+
+    return session_factory
+
+
+def make_memes(directory, n: int):
+    directory.mkdir()
+    for i in range(n):
+        (directory / f"meme {i}.jpg").write_bytes(b"x" * 9 + bytes([i]))
+    (directory / "notes.txt").write_text("not a meme")
+
+
+@pytest.mark.asyncio
+async def test_ingest_uploads_and_inserts_in_batches(tmp_path):
+    make_memes(tmp_path / "memes", 7)
+    storage, inserts = FakeStorage(), []
+
+    report = await ingest_directory(
+        tmp_path / "memes", storage, make_session_factory(inserts), tmp_path / "manifest", concurrency=3, batch_size=3
+    )
+
+    assert report.uploaded == 7
+    assert report.skipped == 1, "Unsupported files should be skipped."
+    assert report.bytes == 70
+    assert sorted(inserts) == [1, 3, 3], "Rows should be inserted in batches."
+    assert len(storage.keys) == 7
+    assert all(" " not in key for key in storage.keys)
+
+
+@pytest.mark.asyncio
+async def test_ingest_resumes_from_manifest(tmp_path):
+    make_memes(tmp_path / "memes", 4)
+    manifest = tmp_path / "manifest"
+
+    storage = FakeStorage(fail_on="meme-3.jpg")
+    report = await ingest_directory(tmp_path / "memes", storage, make_session_factory([]), manifest)
+    assert (report.uploaded, report.failed) == (3, 1)
+    assert len(manifest.read_text().splitlines()) == 3
+    assert all("id" in json.loads(line) for line in manifest.read_text().splitlines())
+
+    storage = FakeStorage()
+    report = await ingest_directory(tmp_path / "memes", storage, make_session_factory([]), manifest)
+    assert report.uploaded == 1, "Files from the manifest should not be uploaded again."
+    assert report.skipped == 4
+
+
+@pytest.mark.asyncio
+async def test_ingest_shares_files_with_the_same_content(tmp_path):
+    make_memes(tmp_path / "memes", 4)
+    (tmp_path / "memes" / "copy.jpg").write_bytes((tmp_path / "memes" / "meme 0.jpg").read_bytes())
+    storage, manifest = FakeStorage(), tmp_path / "manifest"
+
+    report = await ingest_directory(tmp_path / "memes", storage, make_session_factory([]), manifest, batch_size=2)
+
+    assert report.uploaded == 5
+    assert len(storage.keys) == 4, "Uploaded copy of a stored file should be deleted."
+    keys = {entry["source"]: entry["key"] for entry in map(json.loads, manifest.read_text().splitlines())}
+    assert keys["copy.jpg"] == keys["meme 0.jpg"]
@@ -0,0 +1,78 @@
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+
+from app.jobs.worker import JobWorker
+from app.repository.backends import open_job_queue
+from app.repository.jobs import JobRepository
+from app.repository.orm import JobsTable, async_session
+
+
+async def get_job(job_id: int):
+    async with async_session() as session:
+        result = await session.execute(select(JobsTable.__table__.columns).filter_by(id=job_id))
+        return result.mappings().one_or_none()
+
+
+async def add_job(kind: str, payload: dict) -> int:
+    async with async_session() as session:
+        return await JobRepository(session).add_job(kind, payload)
+
+
+@pytest.mark.asyncio
+@pytest.mark.requires_postgres
+async def test_finished_job_is_deleted():
+    kind = f"test-{uuid4()}"
+    done = []
+
+    async def handler(value: int):
+        done.append(value)
+
+    job_id = await add_job(kind, {"value": 1})
+    assert await JobWorker(open_job_queue, {kind: handler}).run_once() == 1
+    assert done == [1]
+    assert await get_job(job_id) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.requires_postgres
+async def test_failed_job_is_retried_with_backoff_then_dead():
+    kind = f"test-{uuid4()}"
+
+    async def handler():
+        raise RuntimeError("storage is down")
+
+    worker = JobWorker(open_job_queue, {kind: handler}, max_attempts=2, backoff=0)
+    job_id = await add_job(kind, {})
+
+    assert await worker.run_once() == 1
+    job = await get_job(job_id)
+    assert (job["status"], job["attempts"]) == ("pending", 1)
+    assert "storage is down" in job["last_error"]
+
+    assert await worker.run_once() == 1
+    job = await get_job(job_id)
+    assert (job["status"], job["attempts"]) == ("dead", 2)
+    assert await worker.run_once() == 0
+
+    async with async_session() as session:
+        assert await JobRepository(session).retry_dead_jobs([kind]) == 1
+    assert (await get_job(job_id))["status"] == "pending"
+
+
+@pytest.mark.asyncio
+@pytest.mark.requires_postgres
+async def test_claimed_job_is_skipped_by_other_workers():
+    kind = f"test-{uuid4()}"
+    await add_job(kind, {})
+    async with async_session() as first, async_session() as second:
+        claimed = await JobRepository(first).claim_jobs([kind], 10, timedelta(minutes=5))
+        assert len(claimed) == 1
+        assert await JobRepository(second).claim_jobs([kind], 10, timedelta(minutes=5)) == []
+
+
+def test_retry_delay_is_exponential_and_capped():
+    worker = JobWorker(open_job_queue, {}, backoff=5, max_backoff=60)
+    assert [worker.retry_delay(attempts).total_seconds() for attempts in (1, 2, 3, 5)] == [5, 10, 20, 60]
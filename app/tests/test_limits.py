@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from app.web import limits
+from app.web.limits import InMemoryRateLimiter, RedisRateLimiter, TransferSlots
+from app.web.middleware import UploadRateLimitMiddleware
+
+
+@pytest.mark.asyncio
+async def test_buckets_refill_at_the_rate(monkeypatch: pytest.MonkeyPatch):
+    now = 100.0
+    monkeypatch.setattr(limits.time, "monotonic", lambda: now)
+    limiter = InMemoryRateLimiter(rate=0.5, burst=2, max_keys=2)
+
+    assert [await limiter.acquire("a") for _ in range(3)] == [0, 0, 2]
+    assert await limiter.acquire("b") == 0, "Clients should have their own buckets."
+    now += 1
+    assert await limiter.acquire("a") == pytest.approx(1)
+    now += 1
+    assert await limiter.acquire("a") == 0
+
+    # "b" is the least recently seen and is forgotten with its bucket
+    await limiter.acquire("c")
+    assert list(limiter._buckets) == ["a", "c"]
+
+
+@pytest.mark.asyncio
+async def test_redis_buckets_are_shared():
+    pytest.importorskip("lupa", reason="fakeredis runs Lua scripts with lupa")
+    from fakeredis import FakeAsyncRedis
+
+    redis = FakeAsyncRedis()
+    first, second = RedisRateLimiter(redis, rate=0.01, burst=2), RedisRateLimiter(redis, rate=0.01, burst=2)
+    assert [await first.acquire("a"), await second.acquire("a")] == [0, 0]
+    assert await first.acquire("a") == pytest.approx(100, abs=1)
+    assert await second.acquire("b") == 0
+
+
+def test_uploads_over_the_rate_are_rejected():
+    app = FastAPI()
+    limiter = InMemoryRateLimiter(rate=0.1, burst=1)
+    app.add_middleware(UploadRateLimitMiddleware, limiter=lambda: limiter, routes={("POST", "/upload")})
+
+    @app.post("/upload")
+    @app.post("/other")
+    async def echo(request: Request):
+        return len(await request.body())
+
+    client = TestClient(app)
+    assert client.post("/upload", content=b"x").json() == 1
+    response = client.post("/upload", content=b"x")
+    assert response.status_code == 429 and response.headers["Retry-After"] == "10"
+    # unverified API keys would let a client get a new bucket with each request
+    assert client.post("/upload", content=b"x", headers={"X-API-Key": "new"}).status_code == 429
+    assert client.post("/other", content=b"x").status_code == 200, "Other routes should not be limited."
+
+
+@pytest.mark.asyncio
+async def test_transfers_wait_for_a_slot_in_a_queue():
+    slots = TransferSlots(max_in_flight=1, max_queued=1, queue_timeout=0.05)
+    order = []
+
+    async def transfer(name: str, seconds: float):
+        async with slots.acquire():
+            order.append(name)
+            await asyncio.sleep(seconds)
+
+    first = asyncio.create_task(transfer("first", 0.02))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(transfer("second", 0.1))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as full:
+        await transfer("third", 0)
+    assert full.value.status_code == 429 and full.value.headers == {"Retry-After": "1"}
+
+    await asyncio.gather(first, second)
+    assert order == ["first", "second"]
+
+    # the slot is held by "fourth" for longer than "fifth" can wait
+    fourth = asyncio.create_task(transfer("fourth", 0.1))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException):
+        await transfer("fifth", 0)
+    await fourth
+    assert order == ["first", "second", "fourth"] and slots.queued == 0
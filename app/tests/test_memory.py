@@ -0,0 +1,158 @@
+import hashlib
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+
+from app.domain.entities import Meme
+from app.jobs.handlers import make_handlers
+from app.jobs.worker import JobWorker
+from app.repository.base import JobQueue, MemeRepository
+from app.repository.jobs import JobRepository
+from app.repository.memory import InMemoryJobRepository, InMemoryRepository
+from app.repository.repository import SQLAlchemyRepository
+from app.s3storage.base import Storage
+from app.s3storage.memory import InMemoryStorage
+from app.s3storage.meme import MemeStorage
+from app.service.meme import MemeService
+from app.service.unit_of_work import InMemoryUnitOfWork
+
+
+async def stream(data: bytes):
+    yield data
+
+
+def test_backends_implement_protocols():
+    assert isinstance(SQLAlchemyRepository(None), MemeRepository)
+    assert isinstance(InMemoryRepository(), MemeRepository)
+    assert isinstance(JobRepository(None), JobQueue)
+    assert isinstance(InMemoryJobRepository(), JobQueue)
+    assert isinstance(MemeStorage("key", "secret", "http://localhost:9000", "memes"), Storage)
+    assert isinstance(InMemoryStorage(), Storage)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("order_by", ["id", "updated_at"])
+@pytest.mark.parametrize("descending", [False, True])
+async def test_pages_follow_cursors_both_ways(order_by: str, descending: bool):
+    repository = InMemoryRepository()
+    ids = [(await repository.add_meme(Meme(f"{i}.jpg")))["id"] for i in range(7)]
+    # touched memes move to the end of the updated_at order
+    await repository.update_meme_by_id(ids[1], description="первый")
+    await repository.update_meme_by_id(ids[0], description="второй")
+    expected = ids if order_by == "id" else [*ids[2:], ids[1], ids[0]]
+    expected = expected[::-1] if descending else expected
+
+    pages, cursor = [], None
+    while True:
+        page = await repository.get_memes_page(order_by, descending, cursor, limit=3)
+        pages.append([meme["id"] for meme in page.items])
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    assert pages == [expected[:3], expected[3:6], expected[6:]]
+
+    previous = await repository.get_memes_page(order_by, descending, page.previous_cursor, limit=3)
+    assert [meme["id"] for meme in previous.items] == expected[3:6]
+    assert previous.next_cursor is not None and previous.previous_cursor is not None
+
+
+@pytest.mark.asyncio
+async def test_shared_file_is_released_by_last_meme():
+    repository = InMemoryRepository()
+    first = await repository.add_meme(Meme("first.jpg", content_hash="same"))
+    second = await repository.add_meme(Meme("second.jpg", content_hash="same"))
+    assert second["filename"] == first["filename"] == "first.jpg"
+
+    assert (await repository.delete_meme_by_id(first["id"]))["released"] is False
+    assert await repository.get_stored_filenames(["first.jpg", "second.jpg"]) == {"first.jpg"}
+    assert (await repository.delete_meme_by_id(second["id"]))["released"] is True
+    assert await repository.get_stored_filenames(["first.jpg"]) == set()
+
+
+@pytest.mark.asyncio
+async def test_storage_serves_ranges_and_revalidation():
+    storage = InMemoryStorage()
+    await storage.upload_stream("b.jpg", stream(b"0123456789"), "image/jpeg")
+    await storage.upload_file_via_request("a.jpg", b"", "image/jpeg")
+
+    partial = await storage.stream_file("b.jpg", "bytes=2-4")
+    assert partial.status_code == 206 and b"".join([chunk async for chunk in partial.body]) == b"234"
+    assert (await storage.stream_file("b.jpg", "bytes=20-")).status_code == 416
+    etag = (await storage.head_file("b.jpg"))["ETag"]
+    assert (await storage.stream_file("b.jpg", if_none_match=etag)).status_code == 304
+
+    assert [key async for key in storage.iter_keys(page_size=1)] == ["a.jpg", "b.jpg"]
+    await storage.delete_many(["a.jpg", "b.jpg"])
+    assert await storage.head_file("b.jpg") is None
+    with pytest.raises(FileNotFoundError):
+        await storage.get_file("b.jpg")
+
+
+@pytest.mark.asyncio
+async def test_service_runs_on_memory_backends():
+    repository, jobs, storage = InMemoryRepository(), InMemoryJobRepository(), InMemoryStorage()
+    service = MemeService(repository, lambda: InMemoryUnitOfWork(repository, jobs, storage))
+    handlers = make_handlers(storage, None, None)
+    worker = JobWorker(lambda: InMemoryJobContext(jobs), {"delete_files": handlers["delete_files"]})
+
+    meme = await service.add("image.jpg", stream(b"\xff\xd8\xff" + uuid4().bytes), "описание")
+    copy = await service.add("copy.jpg", stream(await storage.get_file(meme["filename"])))
+    while await worker.run_once():
+        pass
+    assert copy["filename"] == meme["filename"]
+    assert [key async for key in storage.iter_keys()] == [meme["filename"]]
+
+    await service.delete(meme["id"])
+    await service.delete(copy["id"])
+    while await worker.run_once():
+        pass
+    assert [key async for key in storage.iter_keys()] == []
+    assert (await service.get_all()).items == []
+
+
+@pytest.mark.asyncio
+async def test_stored_content_is_not_uploaded_again():
+    repository, jobs, storage = InMemoryRepository(), InMemoryJobRepository(), InMemoryStorage()
+    service = MemeService(repository, lambda: InMemoryUnitOfWork(repository, jobs, storage))
+    data = b"\xff\xd8\xff" + uuid4().bytes
+    meme = await service.add("image.jpg", stream(data))
+
+    content_hash = hashlib.sha256(data).hexdigest()
+    copy = await service.add_stored(Meme("copy.jpg", "копия", content_hash=content_hash))
+    assert copy["filename"] == meme["filename"] and copy["description"] == "копия"
+    assert list(jobs.jobs.values())[-1]["payload"]["derivatives"] is False
+    assert await service.add_stored(Meme("copy.jpg", content_hash=hashlib.sha256(b"other").hexdigest())) is None
+    assert await service.add_stored(Meme("copy.png", content_hash=content_hash)) is None, "Types should match."
+    assert [key async for key in storage.iter_keys()] == [meme["filename"]]
+
+
+@pytest.mark.asyncio
+async def test_expired_uploads_are_cleaned_up():
+    repository, jobs, storage = InMemoryRepository(), InMemoryJobRepository(), InMemoryStorage(multipart_part_size=4)
+    service = MemeService(repository, lambda: InMemoryUnitOfWork(repository, jobs, storage))
+    handlers = make_handlers(storage, None, lambda: InMemoryJobContext(repository))
+
+    small, large, fresh = Meme("small.jpg"), Meme("large.mp4"), Meme("fresh.jpg")
+    await storage.upload_file_via_request(small.filename, b"\xff\xd8\xff", "image/jpeg")
+    upload_id, _ = await storage.create_presigned_upload(large.filename, "video/mp4", size=10)
+    await service.register_upload(small, None, None, timedelta(0))
+    await service.register_upload(large, 10, upload_id, timedelta(0))
+    await service.register_upload(fresh, None, None, timedelta(hours=1))
+    assert [job["kind"] for job in jobs.jobs.values()] == ["expire_uploads"] * 3
+
+    await handlers["expire_uploads"]()
+    assert await storage.head_file(small.filename) is None
+    assert storage.multipart_uploads == {}, "Multipart upload should be aborted."
+    assert list(repository.pending_uploads) == [fresh.id], "Uploads that are not expired should be kept."
+
+
+class InMemoryJobContext:
+    def __init__(self, jobs: InMemoryJobRepository):
+        self.jobs = jobs
+
+    async def __aenter__(self) -> InMemoryJobRepository:
+        return self.jobs
+
+    async def __aexit__(self, *exc) -> None:
+        pass
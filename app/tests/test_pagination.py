@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.repository.pagination import Cursor
+from app.repository.repository import SQLAlchemyRepository
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+        self.query = None
+
+    async def execute(self, query):
+        self.query = str(query.compile(dialect=postgresql.dialect()))
+        return FakeResult(self.rows)
+
+
+def test_cursor_round_trip():
+    cursor = Cursor("updated_at", True, (datetime(2024, 6, 24, 7, 27), 5), backwards=True)
+    assert Cursor.decode(cursor.encode(), "updated_at", True) == cursor
+
+
+def test_cursor_for_another_ordering_is_rejected():
+    cursor = Cursor("id", False, (5,)).encode()
+    with pytest.raises(ValueError):
+        Cursor.decode(cursor, "id", True)
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        Cursor.decode("not-a-cursor", "id", False)
+
+
+@pytest.mark.asyncio
+async def test_first_page_has_only_next_cursor():
+    session = FakeSession([{"id": 1}, {"id": 2}, {"id": 3}])
+    page = await SQLAlchemyRepository(session).get_memes_page(limit=2)
+
+    assert [row["id"] for row in page.items] == [1, 2]
+    assert page.previous_cursor is None
+    assert Cursor.decode(page.next_cursor, "id", False).keys == (2,)
+    assert "OFFSET" not in session.query, "Should not use offset."
+
+
+@pytest.mark.asyncio
+async def test_page_after_cursor_filters_by_keys():
+    session = FakeSession([{"id": 9, "updated_at": datetime(2024, 6, 24)}])
+    cursor = Cursor("updated_at", True, (datetime(2024, 6, 25), 10)).encode()
+    page = await SQLAlchemyRepository(session).get_memes_page("updated_at", True, cursor, limit=2)
+
+    assert "(memes.updated_at, memes.id) < (" in session.query
+    assert "ORDER BY memes.updated_at DESC, memes.id DESC" in session.query
+    assert page.next_cursor is None, "Last page should not have next cursor."
+    assert Cursor.decode(page.previous_cursor, "updated_at", True).backwards
+
+
+@pytest.mark.asyncio
+async def test_previous_page_scans_backwards():
+    session = FakeSession([{"id": 4}, {"id": 3}])
+    cursor = Cursor("id", False, (5,), backwards=True).encode()
+    page = await SQLAlchemyRepository(session).get_memes_page(cursor=cursor, limit=2)
+
+    assert "memes.id < " in session.query
+    assert "ORDER BY memes.id DESC" in session.query
+    assert [row["id"] for row in page.items] == [3, 4], "Rows should be returned in requested order."
+    assert page.next_cursor is not None
+
+
+def test_rank_cursor_round_trip():
+    cursor = Cursor("rank", True, (0.0607927, 12))
+    assert Cursor.decode(cursor.encode(), "rank", True) == cursor
@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import settings
+from app.repository.orm import async_session
+from app.repository.replicas import Replicas
+from app.repository.repository import SQLAlchemyRepository
+
+
+def test_replicas_take_turns_and_failed_ones_are_skipped():
+    replicas = Replicas(["a", "b", "c"], cooldown=60)
+    assert [name for _, name in replicas.candidates()] == ["a", "b", "c"]
+    assert [name for _, name in replicas.candidates()] == ["b", "c", "a"]
+
+    replicas.mark_failed(2)
+    assert [name for _, name in replicas.candidates()] == ["a", "b"]
+    assert [name for _, name in replicas.candidates()] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.requires_postgres
+async def test_unreachable_replica_fails_over_to_primary():
+    # nothing listens on port 1
+    dead = create_async_engine(settings.DATABASE_URL.replace(f":{settings.POSTGRES_PORT}/", ":1/"))
+    replicas = Replicas([async_sessionmaker(dead)], cooldown=60)
+    try:
+        async with async_session() as session:
+            meme_repo = SQLAlchemyRepository(session, replicas)
+            assert await meme_repo.get_memes() is not None
+            assert replicas.candidates() == [], "Failed replica should be skipped."
+    finally:
+        await dead.dispose()
@@ -1,8 +1,15 @@
+import random
+from datetime import timedelta
+from uuid import uuid4
+
 import pytest
+from app.domain.entities import Meme
 from app.repository.repository import SQLAlchemyRepository
 
 from app.repository.orm import async_session
 
+pytestmark = pytest.mark.requires_postgres
+
 
 @pytest.mark.asyncio
 async def test_get_memes():
@@ -26,3 +33,150 @@ async def test_get_memes():
 #         meme_repo = SQLAlchemyRepository(session)
 #         result = await meme_repo.get_meme_by_id(9999)
 #         assert result is None
+
+
+@pytest.mark.asyncio
+async def test_memes_with_same_content_share_file():
+    content_hash = uuid4().hex
+    async with async_session() as session:
+        meme_repo = SQLAlchemyRepository(session)
+        first = await meme_repo.add_meme(Meme(f"{uuid4()}.jpg", content_hash=content_hash))
+        second = await meme_repo.add_meme(Meme(f"{uuid4()}.jpg", content_hash=content_hash))
+        assert second["filename"] == first["filename"], "Same content should reuse the stored file."
+
+        deleted = await meme_repo.delete_meme_by_id(first["id"])
+        assert not deleted["released"], "File should be kept while it is referenced."
+
+        deleted = await meme_repo.delete_meme_by_id(second["id"])
+        assert deleted["released"], "File should be released with the last reference."
+
+
+@pytest.mark.asyncio
+async def test_bulk_added_memes_share_files():
+    stored_hash, new_hash = uuid4().hex, uuid4().hex
+    async with async_session() as session:
+        meme_repo = SQLAlchemyRepository(session)
+        stored = await meme_repo.add_meme(Meme(f"{uuid4()}.jpg", content_hash=stored_hash))
+        memes = [
+            Meme(f"{uuid4()}.jpg", content_hash=new_hash),
+            Meme(f"{uuid4()}.jpg", content_hash=stored_hash),
+            Meme(f"{uuid4()}.jpg"),
+            Meme(f"{uuid4()}.jpg", content_hash=new_hash),
+        ]
+        rows = await meme_repo.add_memes_bulk(memes)
+        assert [row["filename"] for row in rows] == [
+            memes[0].filename,
+            stored["filename"],
+            memes[2].filename,
+            memes[0].filename,
+        ], "Memes should be returned in order and share files with the same content."
+
+        deleted = await meme_repo.delete_memes_by_ids([stored["id"], rows[0]["id"], rows[1]["id"], rows[3]["id"]])
+        assert all(meme["released"] for meme in deleted), "Files should be released with the last reference."
+
+
+@pytest.mark.asyncio
+async def test_meme_of_stored_content_references_its_file():
+    content_hash = uuid4().hex
+    async with async_session() as session:
+        meme_repo = SQLAlchemyRepository(session)
+        assert await meme_repo.add_meme_of_stored_file(Meme(f"{uuid4()}.jpg", content_hash=content_hash)) is None
+        first = await meme_repo.add_meme(Meme(f"{uuid4()}.jpg", content_hash=content_hash))
+
+        second = await meme_repo.add_meme_of_stored_file(Meme(f"{uuid4()}.jpg", content_hash=content_hash))
+        assert second["filename"] == first["filename"]
+        assert await meme_repo.add_meme_of_stored_file(Meme(f"{uuid4()}.mp4", content_hash=content_hash)) is None
+
+        assert not (await meme_repo.delete_meme_by_id(first["id"]))["released"]
+        assert (await meme_repo.delete_meme_by_id(second["id"]))["released"]
+
+
+@pytest.mark.asyncio
+async def test_replacing_file_releases_previous_one():
+    async with async_session() as session:
+        meme_repo = SQLAlchemyRepository(session)
+        meme = await meme_repo.add_meme(Meme(f"{uuid4()}.jpg", content_hash=uuid4().hex))
+
+        new_file = Meme(f"{uuid4()}.mp4", content_hash=uuid4().hex)
+        updated = await meme_repo.update_meme_by_id(meme["id"], file=new_file)
+        assert updated["filename"] == new_file.filename
+        assert updated["content_type"] == "video/mp4"
+        assert updated["replaced"]["filename"] == meme["filename"]
+        assert updated["replaced"]["released"]
+
+        await meme_repo.delete_meme_by_id(meme["id"])
+
+
+@pytest.mark.asyncio
+async def test_completed_upload_becomes_meme():
+    async with async_session() as session:
+        meme_repo = SQLAlchemyRepository(session)
+        pending = Meme(f"{uuid4()}.mp4", description="video")
+        await meme_repo.add_pending_upload(pending, size=100, multipart_upload_id="upload")
+
+        meme = await meme_repo.complete_pending_upload(pending.id)
+        assert meme["filename"] == pending.filename
+        assert meme["description"] == "video"
+        assert await meme_repo.get_pending_upload(pending.id) is None, "Completed upload should not be pending."
+        assert await meme_repo.complete_pending_upload(pending.id) is None, "Upload can be completed only once."
+
+        await meme_repo.delete_meme_by_id(meme["id"])
+
+
+@pytest.mark.asyncio
+async def test_expired_upload_is_not_completed_nor_referenced():
+    async with async_session() as session:
+        meme_repo = SQLAlchemyRepository(session)
+        expired = Meme(f"{uuid4()}.jpg")
+        await meme_repo.add_pending_upload(expired, expires_in=timedelta(0))
+
+        assert await meme_repo.get_pending_upload(expired.id) is None
+        assert await meme_repo.complete_pending_upload(expired.id) is None, "Expired upload can't be completed."
+        assert await meme_repo.get_stored_filenames([expired.filename]) == set()
+        assert expired.id in [upload["id"] for upload in await meme_repo.get_expired_uploads(limit=1000)]
+
+        await meme_repo.delete_pending_upload(expired.id)
+
+
+@pytest.mark.asyncio
+async def test_search_memes_ranks_and_pages():
+    word = uuid4().hex
+    async with async_session() as session:
+        meme_repo = SQLAlchemyRepository(session)
+        memes = [
+            await meme_repo.add_meme(Meme(f"{uuid4()}.jpg", description=f"кот {word}")),
+            await meme_repo.add_meme(Meme(f"{uuid4()}.jpg", description=f"кот {word} {word}")),
+            await meme_repo.add_meme(Meme(f"{uuid4()}.jpg", description=f"коты {word}")),
+        ]
+
+        first = await meme_repo.search_memes(f"кот {word}", limit=2)
+        assert first.items[0]["id"] == memes[1]["id"], "Meme with more matching words should go first."
+        assert first.next_cursor is not None and first.previous_cursor is None
+
+        second = await meme_repo.search_memes(f"кот {word}", cursor=first.next_cursor, limit=2)
+        found = [meme["id"] for meme in first.items + second.items]
+        assert sorted(found) == sorted(meme["id"] for meme in memes), "Stemming should match other word forms."
+        assert second.next_cursor is None
+
+        back = await meme_repo.search_memes(f"кот {word}", cursor=second.previous_cursor, limit=2)
+        assert [meme["id"] for meme in back.items] == [meme["id"] for meme in first.items]
+
+        await meme_repo.delete_memes_by_ids([meme["id"] for meme in memes])
+
+
+@pytest.mark.asyncio
+async def test_find_similar_memes():
+    async with async_session() as session:
+        meme_repo = SQLAlchemyRepository(session)
+        memes = [await meme_repo.add_meme(Meme(f"{uuid4()}.jpg")) for _ in range(3)]
+        image_hash = random.getrandbits(63)
+        # close, at distance 5, and far away
+        await meme_repo.set_image_hashes(
+            {memes[0]["id"]: image_hash, memes[1]["id"]: image_hash ^ 0b11111, memes[2]["id"]: ~image_hash}
+        )
+
+        similar = await meme_repo.find_similar_memes(memes[0]["id"], max_distance=6)
+        assert [(meme["id"], meme["distance"]) for meme in similar] == [(memes[1]["id"], 5)]
+        assert await meme_repo.find_similar_memes(memes[0]["id"], max_distance=4) == []
+
+        await meme_repo.delete_memes_by_ids([meme["id"] for meme in memes])
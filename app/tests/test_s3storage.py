@@ -0,0 +1,306 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.s3storage.meme import MemeStorage
+
+
+def make_storage(**kwargs) -> MemeStorage:
+    return MemeStorage(
+        access_key="key",
+        secret_key="secret",
+        endpoint_url="http://localhost:9000",
+        bucket_name="memes",
+        **kwargs,
+    )
+
+
+async def skip_bootstrap():
+    pass
+
+
+@pytest.mark.asyncio
+async def test_reuses_long_lived_client():
+    storage = make_storage(max_pool_connections=3)
+    storage.bootstrap = skip_bootstrap
+    await storage.start()
+
+    async with storage.get_client() as first:
+        async with storage.get_client() as second:
+            assert first is second, "Should reuse the client opened on start."
+            assert storage.stats.in_use == 2
+
+    assert storage.stats.in_use == 0
+    assert storage.stats.peak_in_use == 2
+    assert storage.stats.short_lived_total == 0, "Should not create clients per call after start."
+    assert storage.stats.max_connections == 3
+
+    await storage.close()
+    assert storage.stats.open_clients == 0
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_creates_bucket_and_policy():
+    storage = make_storage()
+    calls = []
+
+    async def bucket_exists():
+        return False
+
+    async def get_policy():
+        return None
+
+    async def create_bucket():
+        calls.append("bucket")
+
+    async def add_policy(policy_file):
+        calls.append("policy")
+
+    storage.bucket_exists, storage.get_policy = bucket_exists, get_policy
+    storage.create_bucket, storage.add_policy = create_bucket, add_policy
+
+    await storage.bootstrap()
+    assert calls == ["bucket", "policy"]
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_skipped_while_marker_is_fresh(tmp_path):
+    storage = make_storage(bootstrap_marker=str(tmp_path / "bootstrap"))
+    checks = []
+
+    async def bucket_exists():
+        checks.append("bucket")
+        return True
+
+    async def get_policy():
+        return {"Policy": "{}"}
+
+    storage.bucket_exists, storage.get_policy = bucket_exists, get_policy
+
+    await storage.bootstrap()
+    await storage.bootstrap()
+    assert checks == ["bucket"], "Should not verify bucket again while the marker is fresh."
+
+    storage.bootstrap_ttl = 0
+    await storage.bootstrap()
+    assert checks == ["bucket", "bucket"], "Should verify bucket again once the marker is stale."
+
+
+class FakeMultipartClient:
+    def __init__(self, fail_on_part: int | None = None):
+        self.fail_on_part = fail_on_part
+        self.objects = {}
+        self.parts = {}
+        self.aborted = False
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    async def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {"UploadId": "upload"}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        await asyncio.sleep(0)
+        self.in_flight -= 1
+        if PartNumber == self.fail_on_part:
+            raise RuntimeError("part failed")
+        self.parts[PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.objects[Key] = b"".join(self.parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+def with_client(storage: MemeStorage, client) -> MemeStorage:
+    @asynccontextmanager
+    async def get_client():
+        yield client
+
+    storage.get_client = get_client
+    return storage
+
+
+async def chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+@pytest.mark.asyncio
+async def test_small_stream_uses_single_put():
+    client = FakeMultipartClient()
+    storage = with_client(make_storage(multipart_part_size=10), client)
+
+    await storage.upload_stream("small.jpg", chunks(b"x" * 7, 3))
+    assert client.objects["small.jpg"] == b"x" * 7
+    assert not client.parts, "Should not start a multipart upload for a single part."
+
+
+@pytest.mark.asyncio
+async def test_large_stream_uses_multipart_upload():
+    client = FakeMultipartClient()
+    storage = with_client(make_storage(multipart_part_size=10, multipart_concurrency=2), client)
+    data = bytes(range(256)) * 4
+
+    await storage.upload_stream("video.mp4", chunks(data, 7))
+    assert client.objects["video.mp4"] == data, "Parts should be joined in order."
+    assert len(client.parts) == 103
+    assert client.peak_in_flight <= 2, "Should not upload more parts at once than configured."
+
+
+@pytest.mark.asyncio
+async def test_failed_part_aborts_multipart_upload():
+    client = FakeMultipartClient(fail_on_part=3)
+    storage = with_client(make_storage(multipart_part_size=10), client)
+
+    with pytest.raises(RuntimeError):
+        await storage.upload_stream("video.mp4", chunks(b"x" * 100, 10))
+    assert client.aborted, "Should abort the multipart upload on failure."
+    assert "video.mp4" not in client.objects
+
+
+class FakeBody:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def iter_chunks(self, chunk_size):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i : i + chunk_size]
+
+
+class FakeGetClient:
+    class exceptions:
+        ClientError = ClientError
+
+        class NoSuchKey(ClientError):
+            pass
+
+    def __init__(self, data: bytes, etag: str = '"abc"'):
+        self.data = data
+        self.etag = etag
+        self.params = None
+
+    async def get_object(self, Bucket, Key, **params):
+        self.params = params
+        if params.get("IfNoneMatch") == self.etag:
+            error = {"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304, "HTTPHeaders": {}}}
+            raise ClientError(error, "GetObject")
+
+        data, status_code, extra = self.data, 200, {}
+        if "Range" in params:
+            start, end = map(int, params["Range"].removeprefix("bytes=").split("-"))
+            data, status_code = self.data[start : end + 1], 206
+            extra["ContentRange"] = f"bytes {start}-{end}/{len(self.data)}"
+
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": status_code},
+            "ContentLength": len(data),
+            "ContentType": "video/mp4",
+            "ETag": self.etag,
+            "Body": FakeBody(data),
+            **extra,
+        }
+
+
+@pytest.mark.asyncio
+async def test_stream_file_range():
+    client = FakeGetClient(bytes(range(100)))
+    storage = with_client(make_storage(), client)
+
+    file = await storage.stream_file("video.mp4", byte_range="bytes=10-19", chunk_size=4)
+    assert file.status_code == 206
+    assert file.headers["content-range"] == "bytes 10-19/100"
+    assert file.headers["content-length"] == "10"
+    assert [chunk async for chunk in file.body] == [bytes(range(10, 14)), bytes(range(14, 18)), bytes([18, 19])]
+
+
+@pytest.mark.asyncio
+async def test_stream_file_not_modified():
+    client = FakeGetClient(b"data")
+    storage = with_client(make_storage(), client)
+
+    file = await storage.stream_file("video.mp4", if_none_match='"abc"')
+    assert file.status_code == 304
+    assert file.body is None, "Should not send body when the file was not modified."
+
+
+class FakePaginator:
+    def __init__(self, keys: list[str]):
+        self.keys = keys
+
+    async def paginate(self, Bucket, Prefix, PaginationConfig):
+        size = PaginationConfig["PageSize"]
+        keys = [key for key in self.keys if key.startswith(Prefix)]
+        for i in range(0, len(keys), size):
+            yield {"Contents": [{"Key": key} for key in keys[i : i + size]]}
+
+
+class FakeBucketClient:
+    def __init__(self, keys: list[str], fail_keys: set[str] = frozenset()):
+        self.keys = keys
+        self.fail_keys = fail_keys
+        self.requests = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def get_paginator(self, name):
+        return FakePaginator(self.keys)
+
+    async def delete_objects(self, Bucket, Delete):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        await asyncio.sleep(0)
+        self.in_flight -= 1
+        keys = [obj["Key"] for obj in Delete["Objects"]]
+        self.requests.append(len(keys))
+        return {"Errors": [{"Key": key, "Code": "AccessDenied"} for key in keys if key in self.fail_keys]}
+
+
+@pytest.mark.asyncio
+async def test_iter_keys_goes_through_all_pages():
+    keys = [f"{i}.jpg" for i in range(2500)]
+    storage = with_client(make_storage(), FakeBucketClient(keys))
+
+    assert [key async for key in storage.iter_keys()] == keys
+    assert len(await storage.list_files()) == 2500, "Should list more than one page."
+
+
+@pytest.mark.asyncio
+async def test_delete_many_in_batches():
+    keys = [f"{i}.jpg" for i in range(2500)]
+    client = FakeBucketClient(keys, fail_keys={"7.jpg"})
+    storage = with_client(make_storage(), client)
+
+    result = await storage.delete_many(storage.iter_keys(), concurrency=2)
+    assert sorted(client.requests) == [500, 1000, 1000], "Should delete at most 1000 files per request."
+    assert client.peak_in_flight <= 2, "Should not send more requests at once than configured."
+    assert result.deleted == 2499
+    assert [error["Key"] for error in result.errors] == ["7.jpg"]
+
+
+def test_presigned_url_is_signed_locally():
+    url = make_storage().get_presigned_url("image.jpg", expires_in=60)
+    assert url.startswith("http://localhost:9000/memes/image.jpg?")
+    assert "Expires=" in url or "X-Amz-Expires=60" in url
+
+
+@pytest.mark.asyncio
+async def test_small_presigned_upload_is_single_put():
+    storage = make_storage(multipart_part_size=10)
+    upload_id, urls = await storage.create_presigned_upload("image.jpg", "image/jpeg", size=10)
+    assert upload_id is None
+    assert len(urls) == 1 and urls[0].startswith("http://localhost:9000/memes/image.jpg?")
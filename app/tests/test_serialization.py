@@ -0,0 +1,32 @@
+import json
+from datetime import datetime, timezone
+
+from app.web.schemas import MemesPage
+from app.web.serialization import render_memes_page
+
+
+def row(id: int, filename: str, content_type: str, updated_at: datetime, derivatives: tuple[str, ...] = ()) -> dict:
+    return {
+        "id": id,
+        "description": None if id % 2 else "описание",
+        "filename": filename,
+        "content_type": content_type,
+        "content_hash": "not in the response",
+        "created_at": datetime(2024, 6, 24, 7, 27),
+        "updated_at": updated_at,
+        "derivatives": list(derivatives),
+    }
+
+
+def test_page_is_rendered_like_the_model():
+    rows = [
+        row(1, "a.jpg", "image/jpeg", datetime(2024, 6, 24, 7, 27, 1, 500)),
+        row(2, "b.mp4", "video/mp4", datetime(2024, 6, 24, 7, 27, tzinfo=timezone.utc), ("posters/b.mp4.webp",)),
+        row(3, "c.mp4", "video/mp4", datetime(2024, 6, 24, 7, 28)),
+    ]
+    expected = MemesPage(items=rows, next_cursor="next", previous_cursor=None, total=2).model_dump_json()
+    page = json.loads(render_memes_page(rows, "next", None, 2))
+    assert page == json.loads(expected)
+    assert page["items"][1]["poster"].endswith("posters/b.mp4.webp")
+    assert page["items"][2]["poster"] is None, "Posters should be linked only once they are made."
+    assert "derivatives" not in page["items"][0]
@@ -0,0 +1,43 @@
+import random
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.media.similarity import CHUNKS, MAX_DISTANCE, chunk, chunk_candidates, hamming_distance, image_hash
+
+
+def make_meme(size=(400, 300), format="PNG", quality=95, seed=0) -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(20):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x, y, x + size[0] // 4, y + size[1] // 4), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = BytesIO()
+    image.save(buffer, format=format, quality=quality)
+    return buffer.getvalue()
+
+
+def test_reposts_have_close_hashes():
+    original = image_hash(make_meme())
+    repost = image_hash(make_meme(size=(200, 150), format="JPEG", quality=40))
+    other = image_hash(make_meme(seed=1))
+
+    assert hamming_distance(original, repost) <= 6, "Resized and recompressed copy should be close."
+    assert hamming_distance(original, other) > 12, "Different images should be far apart."
+
+
+@pytest.mark.parametrize("distance", [0, 3, 4, MAX_DISTANCE])
+def test_close_hashes_share_candidate_chunk(distance):
+    rng = random.Random(distance)
+    value = rng.getrandbits(64)
+    for _ in range(100):
+        other = value ^ sum(1 << bit for bit in rng.sample(range(64), distance))
+        candidates = chunk_candidates(value, distance)
+        assert any(chunk(other, index) in candidates[index] for index in range(CHUNKS))
+
+
+def test_too_large_distance_is_rejected():
+    with pytest.raises(ValueError):
+        chunk_candidates(0, MAX_DISTANCE + 1)
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.telemetry.startup import StartupReport, parse_import_time, startup_report
+from app.utils.lazy import Lazy
+
+ROOT = Path(__file__).parents[2]
+
+
+def test_app_is_imported_without_configuration(tmp_path):
+    # no .env in the working directory and no settings in the environment
+    env = {"PATH": os.environ["PATH"], "PYTHONPATH": str(ROOT)}
+    code = "from app.main import app, create_app; create_app()"
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_memory_backends_serve_without_configuration(tmp_path):
+    env = {"PATH": os.environ["PATH"], "PYTHONPATH": str(ROOT)}
+    code = (
+        "from fastapi.testclient import TestClient; from app.main import create_app\n"
+        "with TestClient(create_app()) as client: assert client.get('/memes').status_code == 200\n"
+        "from app.config import settings\n"
+        "try: settings.DATABASE_URL\n"
+        "except ValueError as e: print(e)"
+    )
+    env |= {"REPOSITORY_BACKEND": "memory", "STORAGE_BACKEND": "memory", "JOBS_RUN_IN_APP": "false"}
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "POSTGRES_USER" in result.stdout, "Credentials should be required once the database is used."
+
+
+def test_lazy_object_is_made_once_on_first_use():
+    made = []
+    lazy = Lazy(lambda: made.append(1) or {"a": 1}, "test object")
+    assert not lazy.made and made == []
+
+    assert lazy.copy() == {"a": 1} and lazy.get() == {"a": 1}
+    assert made == [1] and lazy.made
+    assert "test object" in [name for name, _, _ in startup_report.phases]
+
+    lazy.reset()
+    lazy.get()
+    assert made == [1, 1]
+
+
+def test_nested_phases_are_parts_of_the_outer_one():
+    report = StartupReport()
+    with report.measure("engine"):
+        with report.measure("settings"):
+            pass
+    with report.measure("storage"):
+        pass
+
+    assert [(name, depth) for name, _, depth in report.phases] == [("engine", 0), ("settings", 1), ("storage", 0)]
+    assert report.total == report.phases[0][1] + report.phases[2][1]
+    assert "  settings" in report.summary()
+
+
+def test_import_time_is_summed_by_package():
+    output = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 |     sqlalchemy.util",
+            "import time:       300 |        400 |   sqlalchemy",
+            "import time:      1000 |       1400 | app.main",
+        ]
+    )
+    assert parse_import_time(output) == [("app", 0.001), ("sqlalchemy", pytest.approx(0.0004))]
+    assert parse_import_time(output, depth=2)[-1] == ("sqlalchemy.util", 0.0001)
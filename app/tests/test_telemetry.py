@@ -0,0 +1,52 @@
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.telemetry.tracing import TelemetryMiddleware, TracedRoute, instrumented
+
+
+def samples(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@instrumented("test")
+class Service:
+    async def work(self) -> int:
+        return 1
+
+    async def _helper(self) -> int:
+        return 2
+
+
+@pytest.mark.asyncio
+async def test_public_coroutines_are_timed():
+    before = samples("memes_operation_duration_seconds_count", operation="test.work")
+    assert await Service().work() == 1
+    assert await Service()._helper() == 2
+    assert samples("memes_operation_duration_seconds_count", operation="test.work") == before + 1
+    assert samples("memes_operation_duration_seconds_count", operation="test._helper") == 0
+
+
+def test_requests_are_timed_by_route():
+    router = APIRouter(prefix="/things", route_class=TracedRoute)
+
+    @router.get("/{id}")
+    async def get_thing(id: int):
+        return {"id": id}
+
+    app = FastAPI()
+    app.add_middleware(TelemetryMiddleware)
+    app.include_router(router)
+
+    labels = {"method": "GET", "route": "/things/{id}", "status": "200"}
+    before = samples("memes_http_request_duration_seconds_count", **labels)
+    handled_before = samples("memes_operation_duration_seconds_count", operation="handler.get_thing")
+    with TestClient(app) as client:
+        assert client.get("/things/1").json() == {"id": 1}
+        assert client.get("/things/2").status_code == 200
+
+    assert samples("memes_http_request_duration_seconds_count", **labels) == before + 2
+    assert samples("memes_operation_duration_seconds_count", operation="handler.get_thing") == handled_before + 2, (
+        "Endpoint should be wrapped once even though the router was included."
+    )
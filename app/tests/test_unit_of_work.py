@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+from app.domain.entities import Meme
+from app.domain.exceptions import MemeNotFoundException
+from app.jobs.handlers import make_handlers
+from app.jobs.worker import JobWorker
+from app.media.derivatives import thumbnail_key
+from app.repository.backends import open_job_queue, open_repository
+from app.repository.jobs import JobRepository
+from app.repository.orm import async_session
+from app.repository.repository import SQLAlchemyRepository
+from app.s3storage.meme import DeleteResult
+from app.service.meme import MemeService
+from app.service.unit_of_work import UnitOfWork
+from app.utils.reconcile import reconcile_storage
+
+pytestmark = pytest.mark.requires_postgres
+
+
+class FakeStorage:
+    def __init__(self, modified_at: datetime | None = None):
+        self.files: dict[str, bytes] = {}
+        self.modified_at = modified_at or datetime.now(timezone.utc)
+
+    async def upload_stream(self, filename: str, stream, content_type: str) -> None:
+        self.files[filename] = b"".join([chunk async for chunk in stream])
+
+    async def delete_many(self, filenames, batch_size: int = 1000) -> DeleteResult:
+        if not isinstance(filenames, list):
+            filenames = [filename async for filename in filenames]
+        for filename in filenames:
+            self.files.pop(filename, None)
+        return DeleteResult(deleted=len(filenames))
+
+    async def iter_objects(self, prefix: str = "", page_size: int = 1000):
+        for key in list(self.files):
+            yield {"Key": key, "LastModified": self.modified_at}
+
+
+JPEG = b"\xff\xd8\xff\xe0"
+PNG = b"\x89PNG\r\n\x1a\n"
+
+
+async def stream(data: bytes):
+    yield data
+
+
+def make_service(session, storage: FakeStorage) -> MemeService:
+    return MemeService(SQLAlchemyRepository(session), lambda: UnitOfWork(async_session, storage))
+
+
+async def run_delete_jobs(storage: FakeStorage) -> None:
+    handlers = make_handlers(storage, None, open_repository)
+    worker = JobWorker(open_job_queue, {"delete_files": handlers["delete_files"]}, concurrency=100)
+    while await worker.run_once():
+        pass
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_unit_of_work_deletes_uploaded_file():
+    storage = FakeStorage()
+    meme = Meme(f"{uuid4()}.jpg")
+    with pytest.raises(RuntimeError):
+        async with UnitOfWork(async_session, storage) as uow:
+            meme, _ = await uow.upload(meme, stream(b"image"))
+            added = await uow.memes.add_meme(meme)
+            raise RuntimeError("failed before the commit")
+
+    assert meme.filename not in storage.files
+    async with async_session() as session:
+        assert await SQLAlchemyRepository(session).get_meme_by_id(added["id"]) is None
+
+
+@pytest.mark.asyncio
+async def test_completed_upload_and_its_job_are_committed_together(monkeypatch: pytest.MonkeyPatch):
+    async with async_session() as session:
+        service = make_service(session, FakeStorage())
+        upload = Meme(f"{uuid4()}.jpg")
+        await service.register_upload(upload, None, None, timedelta(hours=1))
+
+        async def fail(*args, **kwargs):
+            raise RuntimeError("could not queue the job")
+
+        monkeypatch.setattr(JobRepository, "add_job", fail)
+        with pytest.raises(RuntimeError):
+            await service.complete_upload(upload.id, 100)
+        monkeypatch.undo()
+        assert await SQLAlchemyRepository(session).get_pending_upload(upload.id) is not None
+
+        meme = await service.complete_upload(upload.id, 100)
+        assert meme["filename"] == upload.filename
+        await service.delete(meme["id"])
+
+
+@pytest.mark.asyncio
+async def test_service_deletes_files_after_commit():
+    storage = FakeStorage()
+    async with async_session() as session:
+        service = make_service(session, storage)
+        meme = await service.add("image.jpg", stream(JPEG + uuid4().bytes), "описание")
+        assert meme["filename"] in storage.files
+
+        updated = await service.replace(meme["id"], "image.png", stream(PNG + uuid4().bytes))
+        assert updated["filename"] in storage.files
+        assert meme["filename"] in storage.files, "Replaced file should be deleted by a job after the commit."
+        await run_delete_jobs(storage)
+        assert meme["filename"] not in storage.files
+
+        [described] = await service.update_many({meme["id"]: "новое", -1: "нет такого"})
+        assert described["description"] == "новое"
+        assert (await service.get_by_id(meme["id"]))["description"] == "новое", "Batch update should be committed."
+
+        await service.delete(meme["id"])
+        await run_delete_jobs(storage)
+        assert updated["filename"] not in storage.files
+        with pytest.raises(MemeNotFoundException):
+            await service.delete(meme["id"])
+
+
+@pytest.mark.asyncio
+async def test_reconcile_storage_deletes_only_orphans():
+    storage = FakeStorage(modified_at=datetime.now(timezone.utc) - timedelta(days=1))
+    async with async_session() as session:
+        meme = await make_service(session, storage).add("image.jpg", stream(JPEG + uuid4().bytes))
+    orphan = f"{uuid4()}.jpg"
+    storage.files[orphan] = b""
+    storage.files[thumbnail_key(orphan, 320)] = b""
+    storage.files[thumbnail_key(meme["filename"], 320)] = b""
+
+    report = await reconcile_storage(storage, open_repository, dry_run=True)
+    assert report.orphans >= 2 and orphan in storage.files
+
+    await reconcile_storage(storage, open_repository)
+    assert set(storage.files) == {meme["filename"], thumbnail_key(meme["filename"], 320)}
+
+    young = FakeStorage()
+    young.files[orphan] = b""
+    assert (await reconcile_storage(young, open_repository)).orphans == 0
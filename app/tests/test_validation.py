@@ -0,0 +1,126 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from app.domain.exceptions import ContentTypeMismatchException, FileTooLargeException
+from app.media.validation import sniff_content_type, validate_upload
+from app.web.middleware import BodySizeLimitMiddleware
+from app.web.uploads import read_upload
+
+HEADS = {
+    "image/jpeg": b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01",
+    "image/png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\r",
+    "image/gif": b"GIF89a\x01\x00\x01\x00\x80\x00",
+    "image/webp": b"RIFF\x24\x00\x00\x00WEBPVP8 ",
+    "image/bmp": b"BM\x36\x00\x00\x00\x00\x00\x00\x00\x36\x00",
+    "video/mp4": b"\x00\x00\x00\x20ftypisom",
+    "video/webm": b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\xf7\x81",
+    "video/mpeg": b"\x00\x00\x01\xba\x44\x00\x04\x00\x04\x01\x01\x89",
+}
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+async def collect(stream) -> list[bytes]:
+    return [chunk async for chunk in stream]
+
+
+def test_content_types_are_sniffed():
+    for content_type, head in HEADS.items():
+        assert sniff_content_type(head) == content_type
+    assert sniff_content_type(b"MZ\x90\x00 not an image") is None
+    # other ISO media files have the same box, but not the brands of mp4
+    assert sniff_content_type(b"\x00\x00\x00\x18ftypheic") is None
+    assert sniff_content_type(b"\x00\x00\x00\x14ftypqt  ") is None
+
+
+@pytest.mark.asyncio
+async def test_upload_is_checked_once_enough_bytes_arrive():
+    body = HEADS["image/png"] + b"pixels"
+    stream = validate_upload("a.png", chunks(body[:3], body[3:7], body[7:]), "image/png", max_size=100)
+    assert b"".join(await collect(stream)) == body
+
+    with pytest.raises(ContentTypeMismatchException):
+        await collect(validate_upload("a.png", chunks(HEADS["image/jpeg"]), "image/png", max_size=100))
+    with pytest.raises(ContentTypeMismatchException):
+        await collect(validate_upload("a.png", chunks(), "image/png", max_size=100))
+
+
+@pytest.mark.asyncio
+async def test_upload_is_stopped_once_too_large():
+    received = []
+    stream = validate_upload("a.jpg", chunks(HEADS["image/jpeg"], b"x" * 50, b"x" * 50), "image/jpeg", max_size=100)
+    with pytest.raises(FileTooLargeException):
+        async for chunk in stream:
+            received.append(chunk)
+    assert len(received) == 2, "Chunks before the limit should be passed through."
+
+
+def test_oversized_body_is_rejected():
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, max_size=lambda: 100)
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return len(await request.body())
+
+    client = TestClient(app)
+    assert client.post("/echo", content=b"x" * 100).json() == 100
+    assert client.post("/echo", content=b"x" * 101).status_code == 413
+    # without Content-Length the body is counted while it is received
+    assert client.post("/echo", content=iter([b"x" * 60, b"x" * 60])).status_code == 413
+
+
+
+def form(size: int) -> list[bytes]:
+    head = b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n\r\n' + HEADS["image/jpeg"]
+    return [head, *[b"x" * 30] * (size // 30), b"\r\n--b--\r\n"]
+
+
+@pytest.mark.asyncio
+async def test_upload_is_stopped_while_the_form_is_received():
+    app = FastAPI()
+
+    @app.exception_handler(FileTooLargeException)
+    async def too_large(request: Request, exc: FileTooLargeException):
+        return PlainTextResponse(status_code=413)
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        upload = await read_upload(request)
+        stream = validate_upload(upload.filename, upload.stream, "image/jpeg", max_size=100)
+        return {"filename": upload.filename, "size": len(b"".join(await collect(stream)))}
+
+    async def post(parts: list[bytes]) -> tuple[int, int]:
+        """Status of the response and the number of chunks of the body the app read."""
+        messages = [{"type": "http.request", "body": part, "more_body": True} for part in parts]
+        messages[-1]["more_body"] = False
+        received, sent = 0, []
+
+        async def receive():
+            nonlocal received
+            received += 1
+            return messages[received - 1]
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": "/upload",
+            "query_string": b"",
+            "headers": [(b"content-type", b"multipart/form-data; boundary=b")],
+        }
+        await app(scope, receive, send)
+        return sent[0]["status"], received
+
+    assert await post(form(60)) == (200, 4)
+    status, received = await post(form(3000))
+    assert status == 413
+    assert received < 10, "The rest of the body should not be received once the file is too large."
+    assert (await post([b""]))[0] == 422
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+
+async def backfill_image_hashes(storage, pipeline, open_repository, batch_size: int = 100) -> int:
+    """Computes hashes of stored images that do not have them yet, e.g. uploaded before hashing was added.
+    Images of a batch are downloaded concurrently and hashed in the process pool of the pipeline.
+
+    Args:
+        storage: storage of the images, e.g. `MemeStorage`.
+        pipeline: pipeline with `image_hash`, e.g. `DerivativesPipeline`.
+        open_repository: factory of repository contexts, e.g. `open_repository`.
+        batch_size (int, optional): number of images per batch. Defaults to 100.
+
+    Returns:
+        int: number of hashed images.
+    """
+    async def hash_file(filename: str) -> int | None:
+        try:
+            return await pipeline.image_hash(await storage.get_file(filename))
+        except Exception:
+            logging.exception(f"Could not read '{filename}'")
+            return None
+
+    hashed = 0
+    after_id = None
+    while True:
+        async with open_repository() as repository:
+            memes = await repository.get_memes_without_image_hash(after_id, batch_size)
+        if not memes:
+            return hashed
+
+        hashes = await asyncio.gather(*(hash_file(meme["filename"]) for meme in memes))
+        found = {meme["id"]: value for meme, value in zip(memes, hashes) if value is not None}
+        async with open_repository() as repository:
+            await repository.set_image_hashes(found)
+        hashed += len(found)
+        after_id = memes[-1]["id"]
+        logging.info(f"Hashed {hashed} images")
+
+
+async def backfill_derivatives(pipeline, open_repository, batch_size: int = 100) -> int:
+    """Records derivatives that are in the storage for memes without recorded ones, e.g. made before
+    they were recorded. Derivatives of a batch are looked up concurrently.
+
+    Args:
+        pipeline: pipeline with `stored_keys`, e.g. `DerivativesPipeline`.
+        open_repository: factory of repository contexts, e.g. `open_repository`.
+        batch_size (int, optional): number of memes per batch. Defaults to 100.
+
+    Returns:
+        int: number of files with recorded derivatives.
+    """
+    recorded = 0
+    after_id = None
+    while True:
+        async with open_repository() as repository:
+            memes = await repository.get_memes_without_derivatives(after_id, batch_size)
+        if not memes:
+            return recorded
+
+        files = {meme["filename"]: meme["content_type"] for meme in memes}
+        keys = await asyncio.gather(*(pipeline.stored_keys(name, content_type) for name, content_type in files.items()))
+        found = {filename: value for filename, value in zip(files, keys) if value}
+        async with open_repository() as repository:
+            await repository.set_derivatives(found)
+        recorded += len(found)
+        after_id = memes[-1]["id"]
+        logging.info(f"Recorded derivatives of {recorded} files")
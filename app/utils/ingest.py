@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from app.domain.entities import Meme
+from app.domain.exceptions import NotSupportedFileExtensionException
+from app.repository.repository import SQLAlchemyRepository
+from app.utils.naming import unique_filename
+from app.utils.stream import iter_hashed, iter_local_file
+
+
+@dataclass
+class IngestReport:
+    uploaded: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes: int = 0
+    seconds: float = 0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.uploaded / self.seconds if self.seconds else 0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes / 1024 / 1024 / self.seconds if self.seconds else 0
+
+    def __str__(self) -> str:
+        return (
+            f"Uploaded {self.uploaded} files ({self.bytes / 1024 / 1024:.1f} MB) in {self.seconds:.1f} s: "
+            f"{self.files_per_second:.1f} files/s, {self.megabytes_per_second:.1f} MB/s. "
+            f"Skipped {self.skipped}, failed {self.failed}."
+        )
+
+
+class Manifest:
+    def __init__(self, path: str | Path):
+        """Append-only log of ingested files, one JSON object per line. Files in it are skipped
+        on the next run, so a crashed run can be restarted.
+
+        Args:
+            path (str | Path): path to the manifest file.
+        """
+        self.path = Path(path)
+        self.done: set[str] = set()
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)["source"])
+                    except (ValueError, KeyError):
+                        # line cut short by a crash
+                        continue
+
+    def record(self, entries: list[dict]) -> None:
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        self.done.update(entry["source"] for entry in entries)
+
+
+async def ingest_directory(
+    directory: str | Path,
+    storage,
+    session_factory,
+    manifest_path: str | Path,
+    concurrency: int = 8,
+    batch_size: int = 500,
+) -> IngestReport:
+    """Uploads all supported files of a directory to the storage and adds them to the database.
+    Uploads run concurrently, rows are inserted in batches and recorded in the manifest after commit.
+    Files are hashed on the way, so content that is stored already is shared and the uploaded copy deleted.
+
+    Args:
+        directory (str | Path): directory with memes.
+        storage: storage to upload files to, e.g. `MemeStorage`.
+        session_factory: factory of database sessions, e.g. `async_session`.
+        manifest_path (str | Path): manifest file, files recorded in it are skipped.
+        concurrency (int, optional): max number of uploads at once. Defaults to 8.
+        batch_size (int, optional): max number of rows per INSERT. Defaults to 500.
+
+    Returns:
+        IngestReport: counters and throughput.
+    """
+    started = time.perf_counter()
+    report = IngestReport()
+    manifest = Manifest(manifest_path)
+
+    pending: asyncio.Queue[Path | None] = asyncio.Queue(maxsize=concurrency * 2)
+    uploaded: asyncio.Queue[tuple[Path, Meme] | None] = asyncio.Queue(maxsize=batch_size)
+
+    async def produce():
+        for path in sorted(Path(directory).iterdir()):
+            if not path.is_file():
+                continue
+            if path.name in manifest.done:
+                report.skipped += 1
+                continue
+            await pending.put(path)
+        for _ in range(concurrency):
+            await pending.put(None)
+
+    async def upload():
+        while (path := await pending.get()) is not None:
+            try:
+                meme = Meme(filename=unique_filename(path.name))
+                hasher = hashlib.sha256()
+                stream = iter_hashed(iter_local_file(path), hasher)
+                await storage.upload_stream(meme.filename, stream, meme.content_type.value)
+                meme = replace(meme, content_hash=hasher.hexdigest())
+            except NotSupportedFileExtensionException as e:
+                logging.warning(e.message)
+                report.skipped += 1
+                continue
+            except Exception:
+                logging.exception(f"Could not upload '{path}'")
+                report.failed += 1
+                continue
+            report.bytes += path.stat().st_size
+            await uploaded.put((path, meme))
+
+    async def insert(batch: list[tuple[Path, Meme]]):
+        async with session_factory() as session:
+            rows = await SQLAlchemyRepository(session).add_memes_bulk([meme for _, meme in batch])
+        manifest.record(
+            [{"source": path.name, "id": row["id"], "key": row["filename"]} for (path, _), row in zip(batch, rows)]
+        )
+        # files with content that was stored already are not referenced
+        duplicates = [meme.filename for (_, meme), row in zip(batch, rows) if row["filename"] != meme.filename]
+        if duplicates:
+            result = await storage.delete_many(duplicates)
+            if result.errors:
+                logging.warning(f"Could not delete {len(result.errors)} duplicate files, e.g. {result.errors[0]}")
+        report.uploaded += len(batch)
+        logging.info(f"Inserted {report.uploaded} memes")
+
+    async def consume():
+        batch = []
+        while (item := await uploaded.get()) is not None:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                await insert(batch)
+                batch = []
+        if batch:
+            await insert(batch)
+
+    consumer = asyncio.create_task(consume())
+    workers = asyncio.gather(produce(), *(upload() for _ in range(concurrency)))
+    await asyncio.wait([consumer, workers], return_when=asyncio.FIRST_COMPLETED)
+    if consumer.done():
+        # insert failed, uploads would wait for it forever
+        workers.cancel()
+        await asyncio.gather(workers, return_exceptions=True)
+        consumer.result()
+
+    try:
+        await workers
+    except BaseException:
+        consumer.cancel()
+        raise
+    await uploaded.put(None)
+    await consumer
+
+    report.seconds = time.perf_counter() - started
+    return report
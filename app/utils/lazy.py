@@ -0,0 +1,46 @@
+from typing import Callable, Generic, TypeVar
+
+from app.telemetry.startup import startup_report
+
+T = TypeVar("T")
+
+
+class Lazy(Generic[T]):
+    def __init__(self, factory: Callable[[], T], name: str):
+        """Object made by `factory` on first use instead of on import, e.g. settings or the engine.
+        Attributes and calls are passed to the object, so it stands in for a module-level singleton.
+        Use `get()` where the object itself is needed. Time of making it is added to `startup_report`.
+
+        Args:
+            factory (Callable[[], T]): makes the object.
+            name (str): name of the object in the startup report.
+        """
+        self._factory = factory
+        self._name = name
+        self._made = False
+        self._value: T | None = None
+
+    @property
+    def made(self) -> bool:
+        return self._made
+
+    def get(self) -> T:
+        if not self._made:
+            with startup_report.measure(self._name):
+                self._value = self._factory()
+            self._made = True
+        return self._value
+
+    def reset(self) -> None:
+        """Makes the object again on next use, e.g. after the environment was changed in tests."""
+        self._made = False
+        self._value = None
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"Lazy({self._name}, made={self._made})"
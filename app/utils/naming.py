@@ -0,0 +1,9 @@
+import re
+from uuid import uuid4
+
+
+def unique_filename(filename: str) -> str:
+    """Makes a storage key for an uploaded file: whitespace and brackets are replaced
+    with dashes and a random prefix is added, so files with the same name do not collide."""
+    filename = re.sub(r"[\s\(\)]+", "-", filename)
+    return f"{uuid4()}-{filename}"
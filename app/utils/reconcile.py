@@ -0,0 +1,76 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from app.media.derivatives import source_filename
+
+
+@dataclass
+class ReconcileReport:
+    scanned: int = 0
+    orphans: int = 0
+    deleted: int = 0
+    errors: int = 0
+
+
+async def reconcile_storage(
+    storage,
+    open_repository,
+    min_age: timedelta = timedelta(hours=1),
+    batch_size: int = 1000,
+    dry_run: bool = False,
+) -> ReconcileReport:
+    """Deletes files that no meme, shared file or pending upload references, e.g. left behind
+    when a unit of work could not clean up after itself. Bucket keys are listed page by page and
+    looked up in the database a batch at a time, so neither side is loaded whole. Derivatives
+    are kept while their original is referenced.
+
+    Args:
+        storage: storage of the files, e.g. `MemeStorage`.
+        open_repository: factory of repository contexts, e.g. `open_repository`.
+        min_age (timedelta, optional): younger files are skipped, they may belong to a unit of work
+            that is not committed yet. Defaults to an hour.
+        batch_size (int, optional): keys looked up and deleted at once. Defaults to 1000.
+        dry_run (bool, optional): only count orphans. Defaults to False.
+
+    Returns:
+        ReconcileReport: numbers of scanned, orphaned and deleted files.
+    """
+    report = ReconcileReport()
+    created_before = datetime.now(timezone.utc) - min_age
+
+    async def find_orphans(keys: list[str]) -> list[str]:
+        sources = {key: source_filename(key) for key in keys}
+        async with open_repository() as repository:
+            stored = await repository.get_stored_filenames(list(set(sources.values())))
+        orphans = [key for key, source in sources.items() if source not in stored]
+        report.orphans += len(orphans)
+        if orphans:
+            logging.info(f"Found {len(orphans)} orphaned files, e.g. '{orphans[0]}'")
+        return orphans
+
+    async def iter_orphans():
+        batch = []
+        async for obj in storage.iter_objects(page_size=batch_size):
+            report.scanned += 1
+            if obj["LastModified"] >= created_before:
+                continue
+            batch.append(obj["Key"])
+            if len(batch) == batch_size:
+                for key in await find_orphans(batch):
+                    yield key
+                batch = []
+        if batch:
+            for key in await find_orphans(batch):
+                yield key
+
+    if dry_run:
+        async for _ in iter_orphans():
+            pass
+    else:
+        result = await storage.delete_many(iter_orphans(), batch_size=batch_size)
+        report.deleted = result.deleted
+        report.errors = len(result.errors)
+
+    logging.info(f"Reconciled storage: {report}")
+    return report
@@ -0,0 +1,17 @@
+import asyncio
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator
+
+
+async def iter_local_file(path: str | Path, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """Reads file from disk chunk by chunk in a thread, so the event loop is not blocked."""
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+
+
+async def iter_hashed(stream: AsyncIterable[bytes], hasher) -> AsyncIterator[bytes]:
+    """Passes chunks through, updating the hasher (e.g. `hashlib.sha256()`) on the way."""
+    async for chunk in stream:
+        hasher.update(chunk)
+        yield chunk
@@ -0,0 +1,50 @@
+import hashlib
+import time
+from functools import lru_cache
+
+from fastapi import Response, status
+
+from app.config import settings
+
+
+@lru_cache
+def _representation() -> tuple:
+    # links in the responses are made from these settings, changing them must change every tag
+    return settings.ENDPOINT_URL, settings.BUCKET_NAME, settings.THUMBNAIL_WIDTHS
+
+
+def _presign_window() -> int | None:
+    """Number of the current half of the lifetime of presigned urls, None if they are not made. Urls of a response
+    made in a window live past the end of the next one, so a 304 in the same window leaves them at least half
+    of their lifetime."""
+    if not settings.S3_PRESIGN_GET_URLS:
+        return None
+    return int(time.time() // max(settings.S3_PRESIGN_GET_EXPIRES_SECONDS / 2, 1))
+
+
+def etag(*parts) -> str:
+    """Strong entity tag of a response made from `parts`, e.g. id and `updated_at` of a meme.
+    Tags change as presigned urls in the responses get old, see `_presign_window`."""
+    key = (_representation(), _presign_window(), parts)
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, tag: str) -> bool:
+    """True if the `If-None-Match` header lists the tag or is "*". Weak tags match too,
+    as the header is compared weakly."""
+    if not if_none_match:
+        return False
+    tags = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in tags or tag in tags
+
+
+def set_cache_headers(response: Response, tag: str, cache_control: str) -> None:
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = cache_control
+
+
+def not_modified(tag: str, cache_control: str) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_cache_headers(response, tag, cache_control)
+    return response
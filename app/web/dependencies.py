@@ -0,0 +1,47 @@
+from typing import Annotated, AsyncIterator
+
+from fastapi import Depends
+
+from app.cache.meme import CachedRepository, meme_cache
+from app.config import Settings, get_settings
+from app.repository.backends import open_repository
+from app.repository.base import MemeRepository
+from app.s3storage.base import Storage
+from app.s3storage.meme import s3_storage
+from app.service.meme import MemeService
+from app.service.unit_of_work import create_unit_of_work
+from app.web.limits import transfer_slots
+
+AppSettings = Annotated[Settings, Depends(get_settings)]
+
+
+def get_storage() -> Storage:
+    return s3_storage.get()
+
+
+FileStorage = Annotated[Storage, Depends(get_storage)]
+
+
+async def get_repository() -> AsyncIterator[MemeRepository]:
+    cache = meme_cache.get()
+    async with open_repository(use_replicas=True) as repository:
+        yield repository if cache is None else CachedRepository(repository, cache)
+
+
+Repository = Annotated[MemeRepository, Depends(get_repository)]
+
+
+async def get_meme_service(repository: Repository, storage: FileStorage) -> MemeService:
+    return MemeService(repository, lambda: create_unit_of_work(storage, meme_cache.get()))
+
+
+Service = Annotated[MemeService, Depends(get_meme_service)]
+
+
+async def take_transfer_slot() -> AsyncIterator[None]:
+    """Holds one of `transfer_slots` while the route runs, the uploaded file is received and sent to the storage."""
+    async with transfer_slots.acquire():
+        yield
+
+
+TransferSlot = Depends(take_transfer_slot)
@@ -0,0 +1,179 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Protocol
+
+from fastapi import HTTPException, status
+from starlette.types import Scope
+
+from app.config import settings
+from app.telemetry.metrics import UPLOAD_QUEUE_WAIT, UPLOAD_REJECTIONS
+from app.utils.lazy import Lazy
+
+TOO_MANY_UPLOADS = "Слишком много загрузок, повторите позже."
+UPLOADS_BUSY = "Сервер занят другими загрузками, повторите позже."
+
+# takes a token from the bucket of KEYS[1] and returns seconds until one is available, 0 if it was taken.
+# Time of the Redis server is used, so workers with different clocks share the same buckets.
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimiter(Protocol):
+    async def acquire(self, key: str) -> float:
+        """Takes a token of the client `key`. Returns 0 if it was taken, otherwise seconds until it can be."""
+        ...
+
+
+class InMemoryRateLimiter:
+    def __init__(self, rate: float, burst: int, max_keys: int = 100_000):
+        """Token bucket of each client in the process, so each worker has its own buckets. The least recently
+        seen clients are forgotten when there are more than `max_keys` of them, and start with a full bucket.
+
+        Args:
+            rate (float): tokens added to a bucket per second.
+            burst (int): size of a bucket, requests allowed at once after a pause.
+            max_keys (int, optional): max number of buckets. Defaults to 100_000.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # tokens and the time they were counted at
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def acquire(self, key: str) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisRateLimiter:
+    def __init__(self, redis, rate: float, burst: int, prefix: str = "memes:rate:"):
+        """Token buckets shared between workers, updated atomically by a Lua script.
+
+        Args:
+            redis: async client with `eval`, e.g. `redis.asyncio.Redis`.
+            rate (float): tokens added to a bucket per second.
+            burst (int): size of a bucket, requests allowed at once after a pause.
+            prefix (str, optional): prefix of the keys. Defaults to "memes:rate:".
+        """
+        self.redis = redis
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+
+    async def acquire(self, key: str) -> float:
+        wait = await self.redis.eval(TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, self.rate, self.burst)
+        return float(wait)
+
+
+def client_key(scope: Scope) -> str:
+    """Key of the client of a request, its IP. Headers such as an API key are not verified by the app,
+    a client could send a new one with each request to get a new bucket."""
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def too_many_requests(reason: str, retry_after: float, detail: str) -> HTTPException:
+    """429 with `Retry-After` in whole seconds, counted in `UPLOAD_REJECTIONS` by `reason`."""
+    UPLOAD_REJECTIONS.labels(reason).inc()
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class TransferSlots:
+    def __init__(self, max_in_flight: int, max_queued: int, queue_timeout: float):
+        """Caps uploads sent to the storage at once, so bulk uploads of a few clients can't take
+        the whole S3 connection pool. Uploads over the cap wait in a queue for a slot, they are rejected
+        with 429 if the queue is full or the wait is longer than `queue_timeout`.
+
+        Example:
+            async with transfer_slots.acquire():
+                await service.add(filename, stream)
+
+        Args:
+            max_in_flight (int): uploads sent at once.
+            max_queued (int): uploads waiting for a slot.
+            queue_timeout (float): max wait for a slot in seconds.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[None]:
+        # locked while there are no free slots or others are already waiting for one
+        if not self._semaphore.locked():
+            # a free slot is taken without waiting
+            await self._semaphore.acquire()
+            UPLOAD_QUEUE_WAIT.observe(0)
+        elif self.queued >= self.max_queued:
+            raise too_many_requests("queue_full", self.queue_timeout, UPLOADS_BUSY)
+        else:
+            self.queued += 1
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except TimeoutError:
+                raise too_many_requests("queue_timeout", self.queue_timeout, UPLOADS_BUSY)
+            finally:
+                self.queued -= 1
+                UPLOAD_QUEUE_WAIT.observe(time.perf_counter() - started)
+
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+def create_rate_limiter() -> RateLimiter | None:
+    rate, burst = settings.RATE_LIMIT_UPLOADS_PER_MINUTE / 60, settings.RATE_LIMIT_UPLOADS_BURST
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return InMemoryRateLimiter(rate, burst)
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        from redis.asyncio import Redis
+
+        return RedisRateLimiter(Redis.from_url(settings.REDIS_URL), rate, burst)
+    return None
+
+
+def create_transfer_slots() -> TransferSlots:
+    return TransferSlots(
+        settings.UPLOADS_MAX_IN_FLIGHT, settings.UPLOADS_MAX_QUEUED, settings.UPLOADS_QUEUE_TIMEOUT_SECONDS
+    )
+
+
+rate_limiter: Lazy[RateLimiter | None] = Lazy(create_rate_limiter, "rate limiter")
+transfer_slots: Lazy[TransferSlots] = Lazy(create_transfer_slots, "transfer slots")
@@ -0,0 +1,88 @@
+from typing import Callable
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.web.limits import TOO_MANY_UPLOADS, RateLimiter, client_key, too_many_requests
+
+BODY_TOO_LARGE = "Тело запроса слишком большое."
+
+
+class BodySizeLimitMiddleware:
+    def __init__(self, app: ASGIApp, max_size: Callable[[], int]):
+        """Rejects requests with bodies bigger than `max_size()` bytes with 413 as early as it is known:
+        by `Content-Length` before the body is read, otherwise once that many bytes are received.
+        Uploads are streamed to the routes, which stop files bigger than allowed for their type,
+        see `app.web.uploads.read_upload`, this is only a cap on any body.
+
+        Args:
+            app (ASGIApp): wrapped app.
+            max_size (Callable[[], int]): max size of a body in bytes, read on each request.
+        """
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_size = self.max_size()
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > max_size:
+            response = JSONResponse({"detail": BODY_TOO_LARGE}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_size:
+                    # raised again by FastAPI when it reads the body, see `fastapi.routing.get_request_handler`
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=BODY_TOO_LARGE)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class UploadRateLimitMiddleware:
+    def __init__(self, app: ASGIApp, limiter: Callable[[], RateLimiter | None], routes: set[tuple[str, str]]):
+        """Rejects uploads of clients over their rate with 429 and `Retry-After` before their bodies are read.
+        Requests are checked when the route starts to read the body, by then the request is matched,
+        so only requests with a body to the `routes` count, e.g. updates of descriptions don't.
+
+        Args:
+            app (ASGIApp): wrapped app.
+            limiter (Callable[[], RateLimiter | None]): limiter of the clients, None if uploads are not limited.
+            routes (set[tuple[str, str]]): methods and paths of the limited routes, e.g. ("POST", "/memes").
+        """
+        self.app = app
+        self.limiter = limiter
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limiter = self.limiter() if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        checked = False
+
+        async def limited_receive() -> Message:
+            nonlocal checked
+            if not checked:
+                checked = True
+                route = getattr(scope.get("route"), "path", None)
+                if (scope["method"], route) in self.routes:
+                    wait = await limiter.acquire(client_key(scope))
+                    if wait > 0:
+                        # raised again by FastAPI when it reads the body, like in `BodySizeLimitMiddleware`
+                        raise too_many_requests("rate_limited", wait, TOO_MANY_UPLOADS)
+            return await receive()
+
+        await self.app(scope, limited_receive, send)
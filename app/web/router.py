@@ -1,60 +1,267 @@
 import re
+from dataclasses import replace
+from datetime import timedelta
 from typing import Annotated, Literal
-from uuid import uuid4
-from fastapi import APIRouter, File, HTTPException, UploadFile, status
-from fastapi_pagination.links import Page
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 
-from app.memes.schemas import MemesResponse
-from app.memes.service import MemesService
-from app.memes.s3client import s3_client
+from app.domain.entities import Meme
+from app.domain.exceptions import ContentTypeMismatchException, FileTooLargeException
+from app.media.similarity import MAX_DISTANCE
+from app.media.validation import check_stored_file, max_upload_size
+from app.telemetry.tracing import TracedRoute
+from app.utils.naming import unique_filename
+from app.web.caching import etag, etag_matches, not_modified, set_cache_headers
+from app.web.dependencies import AppSettings, FileStorage, Repository, Service, TransferSlot
+from app.web.schemas import (
+    BatchDeleteResponse,
+    BatchGetResponse,
+    BatchIds,
+    BatchUpdateRequest,
+    BatchUpdateResponse,
+    CompleteUploadRequest,
+    MemesPage,
+    MemesResponse,
+    SimilarMemesResponse,
+    UploadRequest,
+    UploadResponse,
+)
+from app.web.limits import transfer_slots
+from app.web.serialization import render_memes_page
+from app.web.uploads import read_upload, upload_form
 
-router = APIRouter(prefix="/memes", tags=["Мемы"])
+router = APIRouter(prefix="/memes", tags=["Мемы"], route_class=TracedRoute)
 
+# only single ranges are passed to the storage, others are ignored and the whole file is sent
+SINGLE_RANGE = re.compile(r"bytes=(\d+-\d*|-\d+)")
 
-@router.get("", response_model=Page[MemesResponse])
-async def get_memes(order_by: Literal["id", "updated_at"] = "id", descending: bool = False):
-    return await MemesService.get_memes(order_by, descending)
 
+@router.get("", response_model=MemesPage)
+async def get_memes(
+    repo: Repository,
+    service: Service,
+    settings: AppSettings,
+    order_by: Literal["id", "updated_at"] = "id",
+    descending: bool = False,
+    cursor: str | None = None,
+    size: Annotated[int, Query(ge=1, le=100)] = 50,
+    total: Literal["none", "approximate", "exact"] = "none",
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    # pages of the same table version and query are the same
+    query = (order_by, descending, cursor, size, total)
+    if if_none_match:
+        tag = etag("memes", *await repo.get_memes_version(), *query)
+        if etag_matches(if_none_match, tag):
+            return not_modified(tag, settings.HTTP_CACHE_CONTROL_LIST)
 
-@router.post("", response_model=MemesResponse)
-async def upload_meme(file: UploadFile, description: str | None = None):
-    filename = re.sub("[\s\(\)]+", "-", file.filename)
-    filename = f"{uuid4()}-{filename}"
-    await s3_client.upload_file_via_request(filename, file.file)
-    result = await MemesService.add_meme(filename, description)
-    return result
+    try:
+        page = await service.get_all(order_by, descending, cursor, size, with_version=True)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    count = None
+    if total == "approximate":
+        count = await repo.estimate_memes_count()
+    elif total == "exact":
+        count = await repo.count_memes()
+
+    content = render_memes_page(page.items, page.next_cursor, page.previous_cursor, count)
+    response = Response(content, media_type="application/json")
+    set_cache_headers(response, etag("memes", *page.version, *query), settings.HTTP_CACHE_CONTROL_LIST)
+    return response
+
+
+@router.get("/search", response_model=MemesPage)
+async def search_memes(
+    repo: Repository,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    cursor: str | None = None,
+    size: Annotated[int, Query(ge=1, le=100)] = 50,
+):
+    try:
+        page = await repo.search_memes(q, cursor, size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    content = render_memes_page(page.items, page.next_cursor, page.previous_cursor)
+    return Response(content, media_type="application/json")
+
+
+@router.post(":batchGet", response_model=BatchGetResponse)
+async def batch_get_memes(repo: Repository, batch: BatchIds):
+    memes = await repo.get_memes_by_ids(batch.ids)
+    found = {meme["id"] for meme in memes}
+    return BatchGetResponse(items=memes, not_found=[id for id in dict.fromkeys(batch.ids) if id not in found])
+
+
+@router.post(":batchDelete", response_model=BatchDeleteResponse)
+async def batch_delete_memes(service: Service, batch: BatchIds):
+    deleted = await service.delete_many(batch.ids)
+
+    deleted_ids = {meme["id"] for meme in deleted}
+    return BatchDeleteResponse(
+        results=[
+            {"id": id, "status": "deleted" if id in deleted_ids else "not_found"} for id in dict.fromkeys(batch.ids)
+        ]
+    )
+
+
+@router.patch(":batch", response_model=BatchUpdateResponse)
+async def batch_update_memes(service: Service, batch: BatchUpdateRequest):
+    updated = await service.update_many({item.id: item.description for item in batch.items})
+
+    updated_by_id = {meme["id"]: meme for meme in updated}
+    return BatchUpdateResponse(
+        results=[
+            {"id": id, "status": "updated", "meme": updated_by_id[id]}
+            if id in updated_by_id
+            else {"id": id, "status": "not_found"}
+            for id in dict.fromkeys(item.id for item in batch.items)
+        ]
+    )
+
+
+@router.post("", response_model=MemesResponse, dependencies=[TransferSlot], openapi_extra=upload_form())
+async def upload_meme(service: Service, request: Request, description: str | None = None):
+    upload = await read_upload(request)
+    return await service.add(upload.filename, upload.stream, description)
+
+
+@router.post("/uploads", response_model=UploadResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload(service: Service, storage: FileStorage, settings: AppSettings, upload: UploadRequest):
+    meme = Meme(filename=unique_filename(upload.filename), description=upload.description)
+    max_size = max_upload_size(meme.content_type.value)
+    if upload.size is not None and upload.size > max_size:
+        raise FileTooLargeException(upload.filename, max_size)
+    if upload.sha256 is not None:
+        stored = await service.add_stored(replace(meme, content_hash=upload.sha256.lower()), upload.size)
+        if stored is not None:
+            return UploadResponse(id=meme.id, urls=[], multipart=False, part_size=None, expires_in=0, meme=dict(stored))
+
+    expires_in = settings.S3_PRESIGN_UPLOAD_EXPIRES_SECONDS
+    multipart_upload_id, urls = await storage.create_presigned_upload(
+        meme.filename, meme.content_type.value, upload.size, expires_in
+    )
+    await service.register_upload(meme, upload.size, multipart_upload_id, timedelta(seconds=expires_in))
+    return UploadResponse(
+        id=meme.id,
+        urls=urls,
+        multipart=multipart_upload_id is not None,
+        part_size=storage.multipart_part_size if multipart_upload_id else None,
+        expires_in=expires_in,
+    )
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=MemesResponse)
+async def complete_upload(
+    repo: Repository,
+    service: Service,
+    storage: FileStorage,
+    upload_id: str,
+    body: CompleteUploadRequest | None = None,
+):
+    upload = await repo.get_pending_upload(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    if upload["multipart_upload_id"]:
+        if body is None or not body.parts:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Parts are required.")
+        parts = [{"PartNumber": part.part_number, "ETag": part.etag} for part in body.parts]
+        try:
+            await storage.complete_multipart_upload(upload["filename"], upload["multipart_upload_id"], parts)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    head = await storage.head_file(upload["filename"])
+    if head is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="File was not uploaded.")
+    if upload["size"] is not None and head["ContentLength"] != upload["size"]:
+        await storage.delete_file(upload["filename"])
+        await repo.delete_pending_upload(upload_id)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File size does not match.")
+    try:
+        await check_stored_file(storage, upload["filename"], upload["content_type"], head["ContentLength"])
+    except (ContentTypeMismatchException, FileTooLargeException):
+        await storage.delete_file(upload["filename"])
+        await repo.delete_pending_upload(upload_id)
+        raise
+
+    meme = await service.complete_upload(upload_id, head["ContentLength"])
+    if meme is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return meme
 
 
 @router.get("/{id}", response_model=MemesResponse)
-async def get_meme_by_id(meme_id: int):
-    return await MemesService.get_meme_by_id(meme_id)
+async def get_meme_by_id(
+    service: Service,
+    settings: AppSettings,
+    response: Response,
+    id: int,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    meme = await service.get_by_id(id)
+    tag = etag("meme", meme["id"], meme["updated_at"])
+    if etag_matches(if_none_match, tag):
+        return not_modified(tag, settings.HTTP_CACHE_CONTROL_ITEM)
+    set_cache_headers(response, tag, settings.HTTP_CACHE_CONTROL_ITEM)
+    return meme
 
 
-# TODO make file optional!!!
-@router.put("/{id}", response_model=MemesResponse)
-async def update_meme(id: int, file: UploadFile = None, description: str | None = None):
+@router.get("/{id}/similar", response_model=SimilarMemesResponse)
+async def get_similar_memes(
+    repo: Repository,
+    service: Service,
+    id: int,
+    max_distance: Annotated[int, Query(ge=0, le=MAX_DISTANCE)] = 6,
+    size: Annotated[int, Query(ge=1, le=100)] = 20,
+):
+    await service.get_by_id(id)
+    return SimilarMemesResponse(items=await repo.find_similar_memes(id, max_distance, size))
 
-    kwargs = {}
 
-    if not file and not description:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+@router.get("/{id}/content")
+async def get_meme_content(
+    service: Service,
+    storage: FileStorage,
+    id: int,
+    range_header: Annotated[str | None, Header(alias="range")] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    filename = (await service.get_by_id(id))["filename"]
+    byte_range = range_header if range_header and SINGLE_RANGE.fullmatch(range_header) else None
+
+    try:
+        file = await storage.stream_file(filename, byte_range, if_none_match)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    if file:
-        old_filename = (await MemesService.get_meme_by_id(id))["filename"]
-        await s3_client.delete_file(old_filename)
-        new_filename = f"{uuid4()}-{file.filename}"
-        await s3_client.upload_file_via_request(new_filename, file.file)
-        kwargs["filename"] = new_filename
+    if file.body is None:
+        return Response(status_code=file.status_code, headers=file.headers)
+    return StreamingResponse(file.body, status_code=file.status_code, headers=file.headers)
+
+
+@router.put("/{id}", response_model=MemesResponse, openapi_extra=upload_form(required=False))
+async def update_meme(
+    service: Service,
+    request: Request,
+    id: int,
+    description: str | None = None,
+):
+    upload = await read_upload(request, required=False)
+    if not upload and not description:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
-    if description:
-        kwargs["description"] = description
+    if not upload:
+        return await service.update(id, description)
 
-    return await MemesService.update_meme_by_id(id, **kwargs)
+    # only replacing the file sends it to the storage
+    async with transfer_slots.acquire():
+        return await service.replace(id, upload.filename, upload.stream, description)
 
 
 # DELETE
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_meme(id: int):
-    filename = (await MemesService.get_meme_by_id(id))["filename"]
-    await s3_client.delete_file(filename)
-    await MemesService.delete_meme_by_id(id)
+async def delete_meme(service: Service, id: int):
+    await service.delete(id)
@@ -1,7 +1,8 @@
 from datetime import datetime
-from pydantic import BaseModel, computed_field
+from typing import Literal
+from pydantic import BaseModel, Field, computed_field
 
-from app.config import settings
+from app.web.serialization import links
 
 
 class MemesResponse(BaseModel):
@@ -12,7 +13,116 @@ class MemesResponse(BaseModel):
     content_type: str
     created_at: datetime
     updated_at: datetime
+    # keys of the made derivatives, returned as links
+    derivatives: list[str] = Field(default=[], exclude=True)
 
+    # pages of memes skip this model, see `render_memes_page`
     @computed_field
     def url(self) -> str:
-        return f"{settings.ENDPOINT_URL}/{settings.BUCKET_NAME}/{self.filename}"
+        return links().url(self.filename)
+
+    @computed_field
+    def thumbnails(self) -> dict[int, str]:
+        return links().thumbnails(self.filename, self.derivatives)
+
+    @computed_field
+    def poster(self) -> str | None:
+        return links().poster(self.filename, self.derivatives)
+
+    @computed_field
+    def presigned_url(self) -> str | None:
+        return links().presigned_url(self.filename)
+
+
+class MemesPage(BaseModel):
+
+    items: list[MemesResponse]
+    next_cursor: str | None
+    previous_cursor: str | None
+    total: int | None = None
+
+
+class SimilarMeme(MemesResponse):
+
+    distance: int
+
+
+class SimilarMemesResponse(BaseModel):
+
+    items: list[SimilarMeme]
+
+
+class BatchIds(BaseModel):
+
+    ids: list[int] = Field(min_length=1, max_length=1000)
+
+
+class BatchGetResponse(BaseModel):
+
+    items: list[MemesResponse]
+    not_found: list[int]
+
+
+class BatchDeleteResult(BaseModel):
+
+    id: int
+    status: Literal["deleted", "not_found"]
+
+
+class BatchDeleteResponse(BaseModel):
+
+    results: list[BatchDeleteResult]
+
+
+class BatchUpdateItem(BaseModel):
+
+    id: int
+    description: str | None
+
+
+class BatchUpdateRequest(BaseModel):
+
+    items: list[BatchUpdateItem] = Field(min_length=1, max_length=1000)
+
+
+class BatchUpdateResult(BaseModel):
+
+    id: int
+    status: Literal["updated", "not_found"]
+    meme: MemesResponse | None = None
+
+
+class BatchUpdateResponse(BaseModel):
+
+    results: list[BatchUpdateResult]
+
+
+class UploadRequest(BaseModel):
+
+    filename: str
+    description: str | None = None
+    size: int | None = Field(default=None, gt=0)
+    # hex SHA-256 of the content, the upload is skipped if the same content is stored already
+    sha256: str | None = Field(default=None, pattern="^[0-9a-fA-F]{64}$")
+
+
+class UploadResponse(BaseModel):
+
+    id: str
+    urls: list[str]
+    multipart: bool
+    part_size: int | None
+    expires_in: int
+    # meme of the stored content with `sha256` of the request, nothing has to be uploaded then
+    meme: MemesResponse | None = None
+
+
+class UploadedPart(BaseModel):
+
+    part_number: int = Field(ge=1, le=10_000)
+    etag: str
+
+
+class CompleteUploadRequest(BaseModel):
+
+    parts: list[UploadedPart] = []
@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+import multipart
+from fastapi import HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from multipart.exceptions import FormParserError
+from multipart.multipart import parse_options_header
+
+INVALID_FORM = "Некорректная multipart форма."
+
+
+def upload_form(required: bool = True) -> dict:
+    """OpenAPI schema of the form read by `read_upload`, for `openapi_extra` of routes, which don't declare it."""
+    schema = {"type": "object", "properties": {"file": {"type": "string", "format": "binary"}}}
+    if required:
+        schema["required"] = ["file"]
+    return {"requestBody": {"content": {"multipart/form-data": {"schema": schema}}, "required": required}}
+
+
+@dataclass
+class StreamedUpload:
+    filename: str
+    stream: AsyncIterator[bytes]
+
+
+async def _parse_form(request: Request) -> AsyncIterator[tuple[str, object]]:
+    """Events of a multipart form parsed as the body is received: ("headers", dict) at the start of a part,
+    ("data", bytes) for its chunks and ("end", None) at its end."""
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        return
+
+    events: list[tuple[str, object]] = []
+    header_field = b""
+    header_value = b""
+    headers: dict[bytes, bytes] = {}
+
+    def on_part_begin() -> None:
+        headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        nonlocal header_field
+        header_field += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        nonlocal header_value
+        header_value += data[start:end]
+
+    def on_header_end() -> None:
+        nonlocal header_field, header_value
+        headers[header_field.lower()] = header_value
+        header_field = header_value = b""
+
+    callbacks = {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": lambda: events.append(("headers", dict(headers))),
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+    }
+    parser = multipart.MultipartParser(params[b"boundary"], callbacks)
+    async for chunk in request.stream():
+        try:
+            parser.write(chunk)
+        except FormParserError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=INVALID_FORM)
+        for event in events:
+            yield event
+        events.clear()
+
+
+async def read_upload(request: Request, field: str = "file", required: bool = True) -> StreamedUpload | None:
+    """Reads a multipart form up to the file in `field` and returns its name with the stream of its content,
+    which is read from the request as it is consumed. Nothing is spooled, so the limits of `validate_upload`
+    stop the upload once a file is bigger than allowed for its type, not after the whole body is received.
+    Fields after the file are not read.
+
+    Args:
+        request (Request): request with the form.
+        field (str, optional): name of the file field. Defaults to "file".
+        required (bool, optional): raise if there is no file, otherwise return None. Defaults to True.
+
+    Raises:
+        RequestValidationError: if the file is required but missing, like for a missing `UploadFile`.
+        HTTPException: 400 if the form is malformed.
+    """
+    events = _parse_form(request)
+    async for event, value in events:
+        if event != "headers":
+            continue
+        _, options = parse_options_header(value.get(b"content-disposition", b""))
+        if options.get(b"name") == field.encode() and b"filename" in options:
+            filename = options[b"filename"].decode(errors="replace")
+            break
+    else:
+        if required:
+            raise RequestValidationError(
+                [{"type": "missing", "loc": ("body", field), "msg": "Field required", "input": None}]
+            )
+        return None
+
+    async def stream() -> AsyncIterator[bytes]:
+        try:
+            async for event, value in events:
+                if event == "end":
+                    return
+                if event == "data" and value:
+                    yield value
+        finally:
+            await events.aclose()
+
+    return StreamedUpload(filename, stream())
@@ -0,0 +1,24 @@
+import argparse
+import asyncio
+import logging
+
+from app.media.derivatives import derivatives
+from app.repository.backends import open_repository
+from app.s3storage.meme import s3_storage
+from app.utils.backfill import backfill_derivatives
+
+
+async def main(args: argparse.Namespace):
+    await s3_storage.start()
+    try:
+        recorded = await backfill_derivatives(derivatives, open_repository, batch_size=args.batch_size)
+    finally:
+        await s3_storage.close()
+    print(f"Recorded derivatives of {recorded} files")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record derivatives in the storage of memes that do not have them.")
+    parser.add_argument("--batch-size", type=int, default=100, help="number of memes looked up at once")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+import logging
+
+from app.media.derivatives import derivatives
+from app.repository.backends import open_repository
+from app.s3storage.meme import s3_storage
+from app.utils.backfill import backfill_image_hashes
+
+
+async def main(args: argparse.Namespace):
+    await s3_storage.start()
+    derivatives.start()
+    try:
+        hashed = await backfill_image_hashes(s3_storage, derivatives, open_repository, batch_size=args.batch_size)
+    finally:
+        derivatives.close()
+        await s3_storage.close()
+    print(f"Hashed {hashed} images")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute perceptual hashes of images that do not have them.")
+    parser.add_argument("--batch-size", type=int, default=100, help="number of images downloaded at once")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
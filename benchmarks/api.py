@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+import uvicorn
+from PIL import Image
+
+SCENARIOS = ("list", "get", "upload_image", "upload_video", "update", "delete")
+
+
+def make_image() -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (640, 480), "orange").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, video_mb: int):
+        """Requests of the scenarios and memes they need. Memes created during the run are tracked,
+        so they can be deleted at the end.
+
+        Args:
+            client (httpx.AsyncClient): client of the app.
+            video_mb (int): size of the uploaded video in megabytes.
+        """
+        self.client = client
+        self.image = make_image()
+        self.video = os.urandom(video_mb * 1024 * 1024)
+        self.ids: list[int] = []
+        # memes to update or delete, each request takes its own
+        self.spare: list[int] = []
+        self.created: set[int] = set()
+
+    async def upload(self, filename: str, body: bytes, content_type: str) -> httpx.Response:
+        response = await self.client.post("/memes", files={"file": (filename, body, content_type)})
+        if response.status_code == 200:
+            self.created.add(response.json()["id"])
+        return response
+
+    async def seed(self, count: int) -> list[int]:
+        responses = await asyncio.gather(*(self.upload("seed.jpg", self.image, "image/jpeg") for _ in range(count)))
+        return [response.raise_for_status().json()["id"] for response in responses]
+
+    async def request(self, scenario: str, index: int) -> httpx.Response:
+        if scenario == "list":
+            return await self.client.get("/memes", params={"size": 50})
+        if scenario == "get":
+            return await self.client.get(f"/memes/{self.ids[index % len(self.ids)]}")
+        if scenario == "upload_image":
+            return await self.upload("image.jpg", self.image, "image/jpeg")
+        if scenario == "upload_video":
+            return await self.upload("video.mp4", self.video, "video/mp4")
+        if scenario == "update":
+            return await self.client.put(f"/memes/{self.spare.pop()}", params={"description": f"updated {index}"})
+        if scenario == "delete":
+            meme_id = self.spare.pop()
+            self.created.discard(meme_id)
+            return await self.client.delete(f"/memes/{meme_id}")
+        raise ValueError(f"Unknown scenario '{scenario}'.")
+
+    async def cleanup(self) -> None:
+        for meme_id in self.created:
+            await self.client.delete(f"/memes/{meme_id}")
+        self.created.clear()
+
+
+def percentile(latencies: list[float], p: int) -> float:
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0
+    return statistics.quantiles(latencies, n=100, method="inclusive")[p - 1]
+
+
+async def run_scenario(workload: Workload, scenario: str, requests: int, concurrency: int) -> dict:
+    """Sends `requests` requests of a scenario with at most `concurrency` of them at once.
+
+    Returns:
+        dict: throughput in requests per second and latency percentiles in milliseconds.
+    """
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await workload.request(scenario, index)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput": round(requests / seconds, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+async def measure_allocations(workload: Workload, scenario: str, samples: int) -> int:
+    """Median of peak memory allocated while a request is handled, requests are sent one by one.
+    Measured for the whole process, so it includes the client, which is the same for every commit."""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for index in range(samples):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            await workload.request(scenario, index)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return int(statistics.median(peaks))
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.in_memory:
+        # read by the settings on first use
+        os.environ.update(REPOSITORY_BACKEND="memory", STORAGE_BACKEND="memory")
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    timeout = httpx.Timeout(60)
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=timeout) as client:
+            workload = Workload(client, args.video_mb)
+            try:
+                workload.ids = await workload.seed(min(args.requests, 100))
+                for scenario in args.scenarios:
+                    requests = args.video_requests if scenario == "upload_video" else args.requests
+                    samples = min(args.allocation_samples, requests)
+                    if scenario in ("update", "delete"):
+                        workload.spare = await workload.seed(requests + samples)
+
+                    # warm up connections and caches before measuring
+                    if scenario in ("list", "get"):
+                        await run_scenario(workload, scenario, min(requests, 50), args.concurrency)
+                    results[scenario] = await run_scenario(workload, scenario, requests, args.concurrency)
+                    results[scenario]["allocated_bytes"] = await measure_allocations(workload, scenario, samples)
+                    print(f"{scenario}: {results[scenario]}", file=sys.stderr)
+            finally:
+                await workload.cleanup()
+    finally:
+        server.should_exit = True
+        await serving
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "video_requests": args.video_requests,
+            "video_mb": args.video_mb,
+        },
+        "scenarios": results,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.1) -> list[str]:
+    """Finds scenarios that got slower than in the baseline by more than `tolerance`.
+
+    Args:
+        current (dict): results of this run.
+        baseline (dict): results of a previous run.
+        tolerance (float, optional): allowed relative change. Defaults to 0.1.
+
+    Returns:
+        list[str]: descriptions of regressions, empty if there are none.
+    """
+    regressions = []
+    for scenario, result in current["scenarios"].items():
+        previous = baseline["scenarios"].get(scenario)
+        if previous is None:
+            continue
+        if result["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {previous['throughput']} -> {result['throughput']} req/s")
+        for metric in ("p99_ms", "allocated_bytes"):
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{scenario}: {metric} {previous[metric]} -> {result[metric]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the memes API against Postgres and S3 from the settings, e.g. from docker-compose-dev."
+    )
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16, help="max number of requests at once")
+    parser.add_argument("--requests", type=int, default=500, help="number of requests per scenario")
+    parser.add_argument("--video-requests", type=int, default=10, help="number of video uploads")
+    parser.add_argument("--video-mb", type=int, default=20, help="size of the uploaded video")
+    parser.add_argument("--allocation-samples", type=int, default=20, help="requests to measure allocations with")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--in-memory", action="store_true", help="measure the app without Postgres and S3")
+    parser.add_argument("--output", type=Path, help="file to write results to as JSON")
+    parser.add_argument("--baseline", type=Path, help="results of a previous run, exit with 1 if this run is slower")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    print(output)
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,65 @@
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.media.derivatives import derivative_keys
+from app.web.schemas import MemesPage
+from app.web.serialization import render_memes_page
+
+
+def make_rows(size: int) -> list[dict]:
+    created_at = datetime(2024, 6, 24, 7, 27)
+    rows = []
+    for i in range(size):
+        filename = f"8c6f4a52-3f0b-4a53-9d3e-{i:012d}-{'video.mp4' if i % 10 == 0 else 'image.jpg'}"
+        content_type = "video/mp4" if i % 10 == 0 else "image/jpeg"
+        rows.append(
+            {
+                "id": i,
+                "description": f"мем номер {i}",
+                "filename": filename,
+                "content_type": content_type,
+                "created_at": created_at,
+                "updated_at": created_at + timedelta(seconds=i, microseconds=i),
+                "derivatives": derivative_keys(filename, content_type, settings.THUMBNAIL_WIDTHS),
+            }
+        )
+    return rows
+
+
+def render_with_model(rows: list[dict]) -> bytes:
+    """What `response_model=MemesPage` did: a validated model for each row, then `json.dumps`."""
+    page = MemesPage(items=rows, next_cursor="cursor", previous_cursor=None, total=None)
+    return json.dumps(page.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def render_fast(rows: list[dict]) -> bytes:
+    return render_memes_page(rows, "cursor", None)
+
+
+def measure(render, rows: list[dict], repeat: int) -> float:
+    """Median milliseconds of rendering a page."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(rows)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main(args: argparse.Namespace):
+    for size in args.sizes:
+        rows = make_rows(size)
+        model_ms = measure(render_with_model, rows, args.repeat)
+        fast_ms = measure(render_fast, rows, args.repeat)
+        print(f"{size:>5} memes: model {model_ms:8.3f} ms, fast {fast_ms:8.3f} ms, {model_ms / fast_ms:5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare rendering a page of memes with and without models.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 1000], help="memes per page")
+    parser.add_argument("--repeat", type=int, default=200, help="renders of each page")
+    main(parser.parse_args())
@@ -1,15 +1,18 @@
-from app.memes.s3client import s3_client
-
 import asyncio
+import logging
+
+from app.s3storage.meme import s3_storage
 
 
 async def main():
-    result = await s3_client.list_objects()
-    for i in result["Contents"]:
-        name = i["Key"].split("/")[-1]
-        await s3_client.delete_file(name)
-        print(f"Deleted {name}")
+    await s3_storage.start()
+    try:
+        result = await s3_storage.delete_many(s3_storage.iter_keys())
+    finally:
+        await s3_storage.close()
+    print(f"Deleted {result.deleted} files, failed to delete {len(result.errors)}")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
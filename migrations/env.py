@@ -6,8 +6,7 @@ from sqlalchemy import pool
 from alembic import context
 
 from app.config import settings
-from app.database import Base
-from app.memes.models import Memes
+from app.repository.orm import Base
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
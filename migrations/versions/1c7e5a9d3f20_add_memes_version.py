@@ -0,0 +1,61 @@
+"""Add memes version
+
+Revision ID: 1c7e5a9d3f20
+Revises: d5a9c3e7f1b6
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "1c7e5a9d3f20"
+down_revision: Union[str, None] = "d5a9c3e7f1b6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "memes_version",
+        sa.Column("id", sa.SmallInteger(), nullable=False),
+        sa.Column("version", sa.BigInteger(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute("INSERT INTO memes_version (id, version) VALUES (1, 0)")
+    # bumped once per statement in the transaction of the write, columns that are not returned
+    # with memes, e.g. image_hash, don't change the version
+    op.execute(
+        """
+        CREATE FUNCTION bump_memes_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE memes_version SET version = version + 1 WHERE id = 1;
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER memes_version_bump
+        AFTER INSERT OR DELETE OR UPDATE OF filename, description, content_type, updated_at ON memes
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_memes_version()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER memes_version_bump_truncate
+        AFTER TRUNCATE ON memes FOR EACH STATEMENT EXECUTE FUNCTION bump_memes_version()
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER memes_version_bump_truncate ON memes")
+    op.execute("DROP TRIGGER memes_version_bump ON memes")
+    op.execute("DROP FUNCTION bump_memes_version()")
+    op.drop_table("memes_version")
@@ -0,0 +1,32 @@
+"""Add pending uploads expiry
+
+Revision ID: 4e8b2d6f0a13
+Revises: 1c7e5a9d3f20
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4e8b2d6f0a13"
+down_revision: Union[str, None] = "1c7e5a9d3f20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("pending_uploads", sa.Column("expires_at", sa.DateTime(), nullable=True))
+    # presigned urls of the existing uploads lived for the default hour
+    op.execute("UPDATE pending_uploads SET expires_at = created_at + interval '1 hour'")
+    op.alter_column("pending_uploads", "expires_at", nullable=False)
+    op.create_index("ix_pending_uploads_expires_at", "pending_uploads", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pending_uploads_expires_at", table_name="pending_uploads")
+    op.drop_column("pending_uploads", "expires_at")
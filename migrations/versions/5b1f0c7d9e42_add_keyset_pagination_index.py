@@ -0,0 +1,27 @@
+"""Add keyset pagination index
+
+Revision ID: 5b1f0c7d9e42
+Revises: a2860ecdd386
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5b1f0c7d9e42"
+down_revision: Union[str, None] = "a2860ecdd386"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ordering by id is served by the primary key
+    op.create_index("ix_memes_updated_at_id", "memes", ["updated_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_memes_updated_at_id", table_name="memes")
@@ -0,0 +1,46 @@
+"""Add memes derivatives
+
+Revision ID: 8d2f4b6a1e57
+Revises: 4e8b2d6f0a13
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d2f4b6a1e57"
+down_revision: Union[str, None] = "4e8b2d6f0a13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _version_trigger(columns: str) -> None:
+    op.execute("DROP TRIGGER memes_version_bump ON memes")
+    op.execute(
+        f"""
+        CREATE TRIGGER memes_version_bump
+        AFTER INSERT OR DELETE OR UPDATE OF {columns} ON memes
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_memes_version()
+        """
+    )
+
+
+def upgrade() -> None:
+    # derivatives of the existing memes are found in the storage by `backfill_derivatives.py`
+    op.add_column(
+        "memes",
+        sa.Column("derivatives", postgresql.ARRAY(sa.String()), server_default="{}", nullable=False),
+    )
+    # links to the derivatives are returned with memes
+    _version_trigger("filename, description, content_type, updated_at, derivatives")
+
+
+def downgrade() -> None:
+    _version_trigger("filename, description, content_type, updated_at")
+    op.drop_column("memes", "derivatives")
@@ -0,0 +1,32 @@
+"""Add image hashes
+
+Revision ID: a4c7e2f9b1d3
+Revises: f3b6d8a1c5e9
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a4c7e2f9b1d3"
+down_revision: Union[str, None] = "f3b6d8a1c5e9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("memes", sa.Column("image_hash", sa.BigInteger(), nullable=True))
+    # one index per 16-bit chunk for multi-index hashing, expressions must match `image_hash_chunk`
+    for index, shift in enumerate((48, 32, 16, 0)):
+        op.create_index(f"ix_memes_image_hash_{index}", "memes", [sa.text(f"((image_hash >> {shift}) & 65535)")])
+
+
+def downgrade() -> None:
+    for index in range(4):
+        op.drop_index(f"ix_memes_image_hash_{index}", table_name="memes")
+    op.drop_column("memes", "image_hash")
@@ -0,0 +1,29 @@
+"""Add filename indexes
+
+Revision ID: b8e3f1a6c2d4
+Revises: a4c7e2f9b1d3
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b8e3f1a6c2d4"
+down_revision: Union[str, None] = "a4c7e2f9b1d3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the storage reconciler looks up bucket keys by filename
+    op.create_index("ix_memes_filename", "memes", ["filename"])
+    op.create_index("ix_pending_uploads_filename", "pending_uploads", ["filename"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pending_uploads_filename", table_name="pending_uploads")
+    op.drop_index("ix_memes_filename", table_name="memes")
@@ -0,0 +1,43 @@
+"""Add content addressed files
+
+Revision ID: c3d8e1f4a7b2
+Revises: 5b1f0c7d9e42
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3d8e1f4a7b2"
+down_revision: Union[str, None] = "5b1f0c7d9e42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "meme_files",
+        sa.Column("content_hash", sa.String(), nullable=False),
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("content_type", sa.String(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("content_hash"),
+        sa.UniqueConstraint("filename"),
+    )
+    # existing memes keep owning their files, content_hash stays NULL for them
+    op.add_column("memes", sa.Column("content_hash", sa.String(), nullable=True))
+    op.create_foreign_key("memes_content_hash_fkey", "memes", "meme_files", ["content_hash"], ["content_hash"])
+    op.create_index("ix_memes_content_hash", "memes", ["content_hash"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_memes_content_hash", table_name="memes")
+    op.drop_constraint("memes_content_hash_fkey", "memes", type_="foreignkey")
+    op.drop_column("memes", "content_hash")
+    op.drop_table("meme_files")
@@ -0,0 +1,47 @@
+"""Add description search
+
+Revision ID: f3b6d8a1c5e9
+Revises: e7a9b2c4d6f8
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3b6d8a1c5e9"
+down_revision: Union[str, None] = "e7a9b2c4d6f8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column(
+        "memes",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('russian', coalesce(description, ''))", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index("ix_memes_search_vector", "memes", ["search_vector"], postgresql_using="gin")
+    op.create_index(
+        "ix_memes_description_trgm",
+        "memes",
+        ["description"],
+        postgresql_using="gin",
+        postgresql_ops={"description": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_memes_description_trgm", table_name="memes")
+    op.drop_index("ix_memes_search_vector", table_name="memes")
+    op.drop_column("memes", "search_vector")
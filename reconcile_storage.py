@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import logging
+from datetime import timedelta
+
+from app.repository.backends import open_job_queue, open_repository
+from app.s3storage.meme import s3_storage
+from app.utils.reconcile import reconcile_storage
+
+
+async def main(args: argparse.Namespace):
+    if args.enqueue:
+        async with open_job_queue() as jobs:
+            await jobs.add_job("reconcile_storage", {"min_age_minutes": args.min_age_minutes})
+        print("Queued reconciliation")
+        return
+
+    await s3_storage.start()
+    try:
+        while True:
+            report = await reconcile_storage(
+                s3_storage,
+                open_repository,
+                min_age=timedelta(minutes=args.min_age_minutes),
+                batch_size=args.batch_size,
+                dry_run=args.dry_run,
+            )
+            print(f"Scanned {report.scanned} files, {report.orphans} orphaned, {report.deleted} deleted")
+            if args.interval_minutes is None:
+                return
+            await asyncio.sleep(args.interval_minutes * 60)
+    finally:
+        await s3_storage.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete files of the bucket that no meme references.")
+    parser.add_argument("--min-age-minutes", type=float, default=60, help="younger files are skipped")
+    parser.add_argument("--batch-size", type=int, default=1000, help="keys looked up and deleted at once")
+    parser.add_argument("--dry-run", action="store_true", help="only count orphaned files")
+    parser.add_argument("--enqueue", action="store_true", help="leave it to the jobs worker, e.g. from cron")
+    parser.add_argument("--interval-minutes", type=float, default=None, help="run again and again with this pause")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,32 @@
+import argparse
+import asyncio
+import logging
+
+from app.jobs.worker import job_worker
+from app.media.derivatives import derivatives
+from app.repository.backends import open_job_queue
+from app.s3storage.meme import s3_storage
+
+
+async def main(args: argparse.Namespace):
+    if args.retry_dead:
+        async with open_job_queue() as jobs:
+            print(f"Queued {await jobs.retry_dead_jobs()} dead jobs again")
+        return
+
+    await s3_storage.start()
+    derivatives.start()
+    job_worker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await job_worker.close()
+        derivatives.close()
+        await s3_storage.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background jobs beside the app, see JOBS_RUN_IN_APP.")
+    parser.add_argument("--retry-dead", action="store_true", help="queue dead jobs again and exit")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from app.telemetry.startup import parse_import_time, startup_report
+
+
+def report_imports(top: int) -> None:
+    # a fresh interpreter, as modules imported here already would not be counted
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True, text=True, check=True
+    )
+    packages = parse_import_time(result.stderr)
+    print(f"Imports: {sum(seconds for _, seconds in packages) * 1000:.1f} ms")
+    for package, seconds in packages[:top]:
+        print(f"  {package:<24} {seconds * 1000:9.1f} ms")
+
+
+async def report_startup() -> None:
+    with startup_report.measure("import app.main"):
+        from app.main import app
+    from app.config import settings
+    from app.repository.orm import async_session
+    from app.web.dependencies import get_repository
+
+    async with app.router.lifespan_context(app):
+        # what the first request makes
+        if settings.REPOSITORY_BACKEND == "postgres":
+            with startup_report.measure("first connection"):
+                async with async_session() as session:
+                    await session.connection()
+        with startup_report.measure("first repository"):
+            async for _ in get_repository():
+                pass
+    print("Startup:")
+    for line in startup_report.summary().splitlines():
+        print(f"  {line}")
+
+
+def main(args: argparse.Namespace):
+    if args.in_memory:
+        os.environ.update(REPOSITORY_BACKEND="memory", STORAGE_BACKEND="memory")
+    os.environ["JOBS_RUN_IN_APP"] = "false"
+    started = time.perf_counter()
+    report_imports(args.top)
+    asyncio.run(report_startup())
+    print(f"Measured in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Break down import and startup time of an app worker.")
+    parser.add_argument("--top", type=int, default=15, help="number of the slowest packages to show")
+    parser.add_argument("--in-memory", action="store_true", help="start the app without Postgres and S3")
+    main(parser.parse_args())